@@ -0,0 +1,255 @@
+"""
+离线基准测试：启动本地模拟抖音服务（fake_douyin_server.py），测量
+handle_response 候选选择、download_video 单连接/分段下载、DouyinSpider.run() 冷/热启动
+以及不同并发数下的吞吐，结果写入 JSON 以便跨提交比较。
+
+用法:
+    python benchmark.py --output bench_results.json
+    python benchmark.py --size-mb 32 --bandwidth-mb 4 --latency 0.05 --concurrency 1 2 4 8
+    python benchmark.py --browser                 # 同时测量浏览器嗅探路径（需要已安装 Chromium）
+    python benchmark.py --compare old.json        # 与之前的结果对比
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from douyin_spider import DouyinSpider
+from engine import DownloadEngine
+from browser_pool import BrowserPool
+from fake_douyin_server import FakeDouyinServer
+from share_resolver import ShareResolver
+
+MB = 1024 * 1024
+
+
+class _FakeResponse:
+    """模拟 Playwright Response，只提供 handle_response 用到的属性"""
+
+    def __init__(self, url, size, status=200, content_type='video/mp4'):
+        self.url = url
+        self.status = status
+        self.headers = {'content-type': content_type, 'content-length': str(size)}
+
+
+def quiet(message):
+    pass
+
+
+def describe(samples):
+    samples = sorted(samples)
+    return {
+        'n': len(samples),
+        'mean': round(statistics.mean(samples), 4),
+        'p50': round(samples[len(samples) // 2], 4),
+        'min': round(samples[0], 4),
+        'max': round(samples[-1], 4),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except Exception:
+        return None
+
+
+def bench_handle_response(work_dir, responses=20000):
+    """handle_response 候选选择的纯 CPU 开销"""
+    spider = DouyinSpider("https://v.douyin.com/bench/", log_callback=quiet)
+    spider.save_dir = work_dir
+    items = []
+    for i in range(responses):
+        # 大部分是广告/小文件，少量正片大小
+        size = 300 * 1024 if i % 10 else (2 + i % 7) * MB
+        items.append(_FakeResponse(f"https://v3-web.douyinvod.com/video/{i}.mp4", size))
+    items.append(_FakeResponse("https://www.douyin.com/aweme/v1/web/aweme/detail/", 2048, content_type='application/json'))
+
+    started = time.perf_counter()
+    for response in items:
+        spider.handle_response(response)
+    elapsed = time.perf_counter() - started
+    best = max(spider.video_candidates, key=lambda x: x['size'])
+    return {
+        'responses': len(items),
+        'seconds': round(elapsed, 4),
+        'responses_per_sec': round(len(items) / elapsed),
+        'accepted': len(spider.video_candidates),
+        'best_size': best['size'],
+    }
+
+
+def bench_download(server, work_dir, repeat):
+    """download_video：单连接与分段下载的 MB/s"""
+    url = f"{server.base_url}/video/main_1080p.mp4"
+    size = server.media["main_1080p.mp4"]
+    results = {}
+    for segments in (1, 4):
+        samples = []
+        for i in range(repeat):
+            spider = DouyinSpider(url, log_callback=quiet, download_segments=segments)
+            path = os.path.join(work_dir, f"download_{segments}_{i}.mp4")
+            started = time.perf_counter()
+            record = spider.download_video(url, path)
+            elapsed = time.perf_counter() - started
+            if not record:
+                raise RuntimeError(f"下载失败: segments={segments}")
+            samples.append(size / MB / elapsed)
+            os.remove(path)
+        results[f"segments_{segments}"] = {'mbps': describe(samples)}
+    return results
+
+
+def make_spider(server, url, save_dir, browser, **kwargs):
+    spider = DouyinSpider(url, log_callback=quiet, fast_path=not browser,
+                          resolver=ShareResolver(share_page=server.base_url + "/share/video/{video_id}/",
+                                                 log_callback=quiet),
+                          settle_time=0.5, **kwargs)
+    spider.save_dir = save_dir
+    os.makedirs(save_dir, exist_ok=True)
+    return spider
+
+
+def job_url(server, i, browser):
+    video_id = str(7300000000000100000 + i)
+    return server.browser_url(video_id) if browser else server.short_url(video_id)
+
+
+def bench_run(server, work_dir, repeat, browser):
+    """DouyinSpider.run() 冷启动（每次新建引擎/浏览器）与热启动（复用引擎/浏览器）"""
+    cold = []
+    for i in range(repeat):
+        spider = make_spider(server, job_url(server, i, browser), os.path.join(work_dir, f"cold_{i}"), browser)
+        started = time.perf_counter()
+        result = spider.run()
+        cold.append(time.perf_counter() - started)
+        if result['status'] != 'downloaded':
+            raise RuntimeError(f"冷启动任务失败: {result}")
+
+    pool = BrowserPool(size=1, headless=True, log_callback=quiet) if browser else None
+    engine = DownloadEngine(pool=pool, resolve_concurrency=1, download_concurrency=1, log_callback=quiet)
+    warm = []
+    try:
+        # 预热一次，不计入结果
+        engine.run(make_spider(server, job_url(server, 999, browser), os.path.join(work_dir, "warmup"), browser))
+        for i in range(repeat):
+            spider = make_spider(server, job_url(server, i, browser), os.path.join(work_dir, f"warm_{i}"), browser,
+                                 engine=engine)
+            started = time.perf_counter()
+            result = spider.run()
+            warm.append(time.perf_counter() - started)
+            if result['status'] != 'downloaded':
+                raise RuntimeError(f"热启动任务失败: {result}")
+    finally:
+        engine.close()
+        if pool is not None:
+            pool.close()
+    return {'cold_seconds': describe(cold), 'warm_seconds': describe(warm)}
+
+
+def bench_concurrency(server, work_dir, levels, jobs, browser):
+    """不同并发数下处理 jobs 个链接的总耗时和吞吐"""
+    results = {}
+    for level in levels:
+        pool = BrowserPool(size=level, headless=True, log_callback=quiet) if browser else None
+        engine = DownloadEngine(pool=pool, resolve_concurrency=level, download_concurrency=level, log_callback=quiet)
+        try:
+            engine.start()
+            spiders = [make_spider(server, job_url(server, i, browser), os.path.join(work_dir, f"c{level}_{i}"),
+                                   browser, engine=engine) for i in range(jobs)]
+            started = time.perf_counter()
+            futures = [engine.submit(spider) for spider in spiders]
+            statuses = [f.result()['status'] for f in futures]
+            elapsed = time.perf_counter() - started
+        finally:
+            engine.close()
+            if pool is not None:
+                pool.close()
+        ok = statuses.count('downloaded')
+        results[str(level)] = {
+            'jobs': jobs,
+            'ok': ok,
+            'seconds': round(elapsed, 4),
+            'jobs_per_sec': round(ok / elapsed, 3),
+        }
+    return results
+
+
+def compare(current, previous_path):
+    """打印与之前结果的对比（正数表示变慢/变少）"""
+    with open(previous_path, 'r', encoding='utf-8') as f:
+        previous = json.load(f)
+    print(f"与 {previous_path} (commit {previous.get('commit')}) 对比:")
+
+    def walk(cur, prev, prefix):
+        for key, value in cur.items():
+            if key not in prev:
+                continue
+            name = f"{prefix}.{key}" if prefix else key
+            if isinstance(value, dict):
+                walk(value, prev[key], name)
+            elif isinstance(value, (int, float)) and isinstance(prev[key], (int, float)) and prev[key]:
+                change = (value - prev[key]) / prev[key] * 100
+                print(f"  {name:<60} {prev[key]:>12} -> {value:<12} ({change:+.1f}%)")
+
+    walk(current['results'], previous.get('results', {}), "")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="抖音爬虫离线基准测试")
+    parser.add_argument("--size-mb", type=float, default=8, help="正片大小 (MB)")
+    parser.add_argument("--latency", type=float, default=0.0, help="视频首字节延迟 (秒)")
+    parser.add_argument("--bandwidth-mb", type=float, default=None, help="每连接限速 (MB/s)，默认不限速")
+    parser.add_argument("--no-range", action="store_true", help="模拟不支持 Range 的服务器")
+    parser.add_argument("--repeat", type=int, default=3, help="每项重复次数")
+    parser.add_argument("--jobs", type=int, default=8, help="并发测试中的链接数")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4], help="并发级别")
+    parser.add_argument("--browser", action="store_true", help="测量浏览器嗅探路径（需要 Chromium）")
+    parser.add_argument("-o", "--output", default="bench_results.json", help="结果 JSON 文件")
+    parser.add_argument("--compare", help="与之前的结果 JSON 对比")
+    args = parser.parse_args()
+
+    media = {
+        "ad.mp4": 512 * 1024,
+        "main_720p.mp4": int(args.size_mb * MB / 2),
+        "main_1080p.mp4": int(args.size_mb * MB),
+    }
+    server = FakeDouyinServer(
+        default_fixture="share_router_data.html", media=media, latency=args.latency,
+        bandwidth=args.bandwidth_mb * MB if args.bandwidth_mb else None, range_support=not args.no_range
+    ).start()
+    work_dir = tempfile.mkdtemp(prefix="douyin_bench_")
+    config = {k: v for k, v in vars(args).items() if k not in ('output', 'compare')}
+    results = {}
+    try:
+        print("测量 handle_response ...", file=sys.stderr)
+        results['handle_response'] = bench_handle_response(work_dir)
+        print("测量 download_video ...", file=sys.stderr)
+        results['download_video'] = bench_download(server, work_dir, args.repeat)
+        modes = [False, True] if args.browser else [False]
+        for browser in modes:
+            name = 'browser' if browser else 'http'
+            print(f"测量 DouyinSpider.run() ({name}) ...", file=sys.stderr)
+            results[f'run_{name}'] = bench_run(server, work_dir, args.repeat, browser)
+            print(f"测量并发吞吐 ({name}) ...", file=sys.stderr)
+            results[f'concurrency_{name}'] = bench_concurrency(server, work_dir, args.concurrency, args.jobs, browser)
+    finally:
+        server.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {'commit': git_commit(), 'timestamp': time.time(), 'config': config, 'results': results}
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
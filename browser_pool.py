@@ -0,0 +1,358 @@
+import asyncio
+import atexit
+import os
+import sys
+import threading
+import time
+from contextlib import asynccontextmanager
+
+from browser_profile import CacheMeter
+from metrics import PageLoadEvent, PhaseEvent
+
+DEFAULT_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+
+
+def get_stealth_path():
+    """
+    获取反爬脚本路径，适配 EXE 打包路径和开发环境路径
+    """
+    if getattr(sys, 'frozen', False):
+        return os.path.join(sys._MEIPASS, "stealth.min.js")
+    return "stealth.min.js"
+
+
+class _Slot:
+    """池中的一个槽位：一个预建的上下文 + 一个可复用的页面"""
+
+    def __init__(self, index):
+        self.index = index
+        self.context = None
+        self.page = None
+        self.uses = 0
+        self.crashed = False
+        self.generation = -1
+        self.meter = None
+
+
+class BrowserPool:
+    """
+    浏览器池：一个常驻浏览器 + 固定数量的预建上下文（已注入 stealth.min.js）。
+
+    所有 Playwright 对象都运行在池自己的后台线程（asyncio 事件循环）里，
+    cli.py、gui_app.py 的工作线程以及库调用方都可以通过 run() 共享同一个池。
+    页面按 URL 租用，使用 max_uses 次或崩溃后回收重建。
+
+    传入 profile（browser_profile.BrowserProfile）时改用持久化上下文：所有槽位的页面共用一个
+    带用户数据目录的上下文，cookie 和 HTTP 缓存跨运行保留，每次租用结束上报缓存命中字节数。
+    """
+
+    def __init__(self, size=2, headless=True, max_uses=20, user_agent=DEFAULT_USER_AGENT, log_callback=None,
+                 metrics=None, profile=None):
+        self.size = size
+        self.headless = headless
+        self.max_uses = max_uses
+        self.user_agent = user_agent
+        self.log_callback = log_callback
+        # 可选的 metrics.MetricsBus，上报浏览器启动耗时
+        self.metrics = metrics
+        # 可选的持久化配置（默认每个槽位一个用完即弃的上下文）
+        self.profile = profile
+
+        self._loop = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._playwright = None
+        self._browser = None
+        self._persistent = None
+        self._persistent_closed = False
+        self._generation = 0
+        self._slots = []
+        self._idle = None
+
+    def log(self, message):
+        if self.log_callback:
+            self.log_callback(message)
+        else:
+            print(f"[BrowserPool] {message}")
+
+    @property
+    def loop(self):
+        return self._loop
+
+    def start(self):
+        """启动后台事件循环并预热浏览器，重复调用无副作用"""
+        with self._start_lock:
+            if self._loop is not None:
+                return
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._loop.run_forever, name="BrowserPool", daemon=True)
+            self._thread.start()
+            try:
+                self._call(self._async_start())
+            except Exception:
+                self._stop_loop()
+                raise
+
+    def submit(self, coro):
+        """把协程提交到池的事件循环，返回 concurrent.futures.Future"""
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def run(self, fn, *args, timeout=None):
+        """
+        租用一个页面并在池线程中执行 await fn(page, *args)，阻塞直到返回。
+        注意：不能在池自己的事件循环线程里调用，否则会死锁。
+        """
+        self.start()
+        return self._call(self.run_leased(fn, *args), timeout)
+
+    def close(self):
+        """关闭所有上下文和浏览器，停止后台线程"""
+        with self._start_lock:
+            if self._loop is None:
+                return
+            try:
+                self._call(self._async_close(), timeout=30)
+            except Exception as e:
+                self.log(f"关闭浏览器池出错: {e}")
+            self._stop_loop()
+
+    @asynccontextmanager
+    async def lease(self):
+        """在池的事件循环内租用一个页面（供异步调用方使用）"""
+        slot = await self._idle.get()
+        failed = False
+        page = None
+        before = None
+        try:
+            page = await self._ensure_page(slot)
+            if slot.meter is not None:
+                before = slot.meter.snapshot()
+            yield page
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            slot.uses += 1
+            if before is not None:
+                self._report_page_load(slot.meter, before, page)
+            await self._recycle(slot, failed)
+            self._idle.put_nowait(slot)
+
+    def _report_page_load(self, meter, before, page):
+        after = meter.snapshot()
+        delta = {key: after[key] - before[key] for key in after}
+        if self.metrics is not None and delta['requests']:
+            try:
+                url = page.url
+            except Exception:
+                url = None
+            self.metrics.emit(PageLoadEvent(url=url, **delta))
+
+    def _call(self, coro, timeout=None):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result(timeout)
+
+    def _stop_loop(self):
+        loop, thread = self._loop, self._thread
+        self._loop = None
+        self._thread = None
+        if loop is None:
+            return
+        loop.call_soon_threadsafe(loop.stop)
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=10)
+        loop.close()
+
+    async def run_leased(self, fn, *args):
+        """租用一个页面执行 await fn(page, *args)（需在池的事件循环中运行，可配合 submit() 使用）"""
+        async with self.lease() as page:
+            return await fn(page, *args)
+
+    async def _async_start(self):
+        from playwright.async_api import async_playwright
+
+        self._idle = asyncio.Queue()
+        self._playwright = await async_playwright().start()
+        try:
+            await self._launch_browser()
+        except Exception:
+            await self._playwright.stop()
+            self._playwright = None
+            raise
+
+        for i in range(self.size):
+            slot = _Slot(i)
+            await self._new_context(slot)
+            self._slots.append(slot)
+            self._idle.put_nowait(slot)
+        self.log(f"浏览器池已就绪: {self.size} 个预热上下文")
+
+    async def _launch_browser(self):
+        self.log(f"正在启动浏览器 (Headless={self.headless})...")
+        started = time.monotonic()
+        args = ['--start-maximized'] if not self.headless else []
+        if self.profile is not None:
+            await self._launch_persistent(args)
+        else:
+            self._browser = await self._playwright.chromium.launch(headless=self.headless, args=args)
+        if self.metrics is not None:
+            self.metrics.emit(PhaseEvent(phase="browser_launch", duration=time.monotonic() - started))
+        self._generation += 1
+
+    async def _launch_persistent(self, args):
+        fresh = await asyncio.to_thread(self.profile.prepare)
+        self._persistent = await self._playwright.chromium.launch_persistent_context(
+            self.profile.user_data_dir,
+            headless=self.headless,
+            args=args + self.profile.launch_args(),
+            viewport={'width': 1920, 'height': 1080},
+            user_agent=self.user_agent
+        )
+        self._persistent_closed = False
+        # 浏览器进程退出时持久化上下文随之关闭
+        self._persistent.on("close", lambda _context: setattr(self, '_persistent_closed', True))
+        stealth_path = get_stealth_path()
+        if os.path.exists(stealth_path):
+            await self._persistent.add_init_script(path=stealth_path)
+        else:
+            self.log("警告: 未找到反爬脚本 stealth.min.js")
+        if fresh:
+            await self.profile.restore_state(self._persistent)
+        # 持久化上下文自带的空白页用不上
+        for page in self._persistent.pages:
+            await page.close()
+
+    def _connected(self):
+        if self.profile is not None:
+            return self._persistent is not None and not self._persistent_closed
+        return self._browser.is_connected()
+
+    async def _new_context(self, slot):
+        if self.profile is not None:
+            # 持久化模式下所有槽位共用一个上下文，槽位只管理自己的页面
+            slot.context = self._persistent
+            slot.page = None
+            slot.uses = 0
+            slot.crashed = False
+            slot.generation = self._generation
+            return
+        slot.context = await self._browser.new_context(
+            viewport={'width': 1920, 'height': 1080},
+            user_agent=self.user_agent
+        )
+        stealth_path = get_stealth_path()
+        if os.path.exists(stealth_path):
+            await slot.context.add_init_script(path=stealth_path)
+        elif slot.index == 0:
+            self.log("警告: 未找到反爬脚本 stealth.min.js")
+        slot.page = None
+        slot.uses = 0
+        slot.crashed = False
+        slot.generation = self._generation
+
+    async def _ensure_page(self, slot):
+        # 浏览器进程崩溃/断开后整体重启，所有槽位按代号惰性重建
+        if not self._connected():
+            self.log("检测到浏览器已断开，正在重新启动...")
+            await self._launch_browser()
+        if slot.generation != self._generation:
+            await self._new_context(slot)
+
+        if slot.page is None or slot.page.is_closed():
+            slot.page = await slot.context.new_page()
+            slot.page.on("crash", lambda _page: setattr(slot, 'crashed', True))
+            slot.meter = None
+            if self.profile is not None:
+                slot.meter = CacheMeter()
+                try:
+                    await slot.meter.attach(slot.context, slot.page)
+                except Exception as e:
+                    self.log(f"无法统计缓存命中（CDP 不可用）: {e}")
+                    slot.meter = None
+        return slot.page
+
+    async def _recycle(self, slot, failed):
+        try:
+            if (failed or slot.crashed) and self.profile is not None:
+                # 持久化上下文是共用的，只丢弃出错的页面
+                try:
+                    await slot.page.close()
+                except Exception:
+                    pass
+                slot.page = None
+                if not self._connected():
+                    slot.generation = -1
+            elif failed or slot.crashed:
+                # 崩溃或出错：整个上下文丢弃重建，避免状态污染
+                try:
+                    await slot.context.close()
+                except Exception:
+                    pass
+                if self._browser.is_connected():
+                    await self._new_context(slot)
+                else:
+                    slot.generation = -1
+            elif slot.uses >= self.max_uses:
+                await slot.page.close()
+                slot.page = None
+                slot.uses = 0
+            elif slot.page is not None and not slot.page.is_closed():
+                # 切回空白页，停止上一个视频页面的后台加载
+                await slot.page.goto("about:blank")
+        except Exception as e:
+            self.log(f"回收页面出错: {e}")
+            slot.page = None
+            slot.generation = -1
+
+    async def _async_close(self):
+        if self._persistent is not None:
+            if self._connected():
+                await self.profile.save_state(self._persistent)
+            try:
+                await self._persistent.close()
+            except Exception:
+                pass
+            self._persistent = None
+        for slot in self._slots:
+            try:
+                if slot.context is not None:
+                    await slot.context.close()
+            except Exception:
+                pass
+        self._slots = []
+        if self._browser is not None:
+            try:
+                await self._browser.close()
+            except Exception:
+                pass
+            self._browser = None
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+
+
+_shared_pool = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_pool(**kwargs):
+    """
+    获取进程内共享的浏览器池（首次调用时按参数创建，之后忽略参数）
+    """
+    global _shared_pool
+    with _shared_lock:
+        if _shared_pool is None:
+            _shared_pool = BrowserPool(**kwargs)
+        return _shared_pool
+
+
+def shutdown_shared_pool():
+    """关闭共享浏览器池，进程退出时自动调用"""
+    global _shared_pool
+    with _shared_lock:
+        pool, _shared_pool = _shared_pool, None
+    if pool is not None:
+        pool.close()
+
+
+atexit.register(shutdown_shared_pool)
@@ -0,0 +1,150 @@
+import json
+import os
+import shutil
+import weakref
+
+# 页面 -> CacheMeter，spider 据此判断页面是否在持久化配置中（见 douyin_spider._sniff）
+_meters = weakref.WeakKeyDictionary()
+
+
+def dir_size(path):
+    """目录下所有文件的总字节数"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def cache_meter_for(page):
+    """页面所在浏览器使用持久化配置时返回它的 CacheMeter，否则返回 None"""
+    return _meters.get(page)
+
+
+class BrowserProfile:
+    """
+    持久化浏览器配置目录：cookie、localStorage 和 HTTP 缓存（抖音的 JS/CSS 包）跨运行保留，
+    重复打开页面时静态资源从磁盘缓存读取，也减少重新触发验证。
+
+    目录结构：
+        <path>/chromium/             Chromium 用户数据目录（含 HTTP 缓存，上限 cache_size_mb）
+        <path>/storage_state.json    关闭时导出的 cookie 和 localStorage
+
+    启动前检查用户数据目录，超过 max_size_mb 时整个删除重建（轮换），
+    重建后从 storage_state.json 恢复 cookie，登录状态不会因轮换丢失。
+    """
+
+    def __init__(self, path=os.path.join("cache", "browser_profile"), cache_size_mb=256, max_size_mb=1024,
+                 log_callback=None):
+        self.path = path
+        self.cache_size_mb = cache_size_mb
+        self.max_size_mb = max_size_mb
+        self.log_callback = log_callback
+
+    @property
+    def user_data_dir(self):
+        return os.path.join(self.path, "chromium")
+
+    @property
+    def state_path(self):
+        return os.path.join(self.path, "storage_state.json")
+
+    def log(self, message):
+        if self.log_callback:
+            self.log_callback(message)
+        else:
+            print(f"[Profile] {message}")
+
+    def launch_args(self):
+        return [f"--disk-cache-size={self.cache_size_mb * 1024 * 1024}"]
+
+    def prepare(self):
+        """
+        启动浏览器前调用：必要时轮换用户数据目录，返回目录是否为新建（需要恢复 cookie）
+        """
+        user_data_dir = self.user_data_dir
+        if os.path.isdir(user_data_dir):
+            size = dir_size(user_data_dir)
+            if size <= self.max_size_mb * 1024 * 1024:
+                return False
+            self.log(f"浏览器配置目录 {size/1024/1024:.0f}MB 超过上限 {self.max_size_mb}MB，已清空重建")
+            shutil.rmtree(user_data_dir, ignore_errors=True)
+        os.makedirs(user_data_dir, exist_ok=True)
+        return True
+
+    async def restore_state(self, context):
+        """把上次导出的 cookie 写入新建的配置"""
+        if not os.path.exists(self.state_path):
+            return
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                cookies = json.load(f).get('cookies') or []
+            if cookies:
+                await context.add_cookies(cookies)
+                self.log(f"已从 storage_state 恢复 {len(cookies)} 个 cookie")
+        except Exception as e:
+            self.log(f"恢复 storage_state 失败: {e}")
+
+    async def save_state(self, context):
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            await context.storage_state(path=self.state_path)
+        except Exception as e:
+            self.log(f"保存 storage_state 失败: {e}")
+
+
+class CacheMeter:
+    """
+    通过 CDP 的 Network 事件统计一个页面的请求：总请求数、来自 HTTP 缓存（磁盘/内存）的请求数、
+    从网络传输的字节数和由缓存提供的字节数
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.cached_requests = 0
+        self.network_bytes = 0
+        self.cache_bytes = 0
+        self._session = None
+        self._cached = set()
+
+    async def attach(self, context, page):
+        self._session = await context.new_cdp_session(page)
+        self._session.on("Network.responseReceived", self._on_response)
+        self._session.on("Network.requestServedFromCache", self._on_served_from_cache)
+        self._session.on("Network.dataReceived", self._on_data)
+        self._session.on("Network.loadingFinished", self._on_finished)
+        await self._session.send("Network.enable")
+        _meters[page] = self
+
+    async def block_urls(self, patterns):
+        """
+        按 URL 通配符拦截请求。不用 page.route()：Playwright 在有路由时会关闭 HTTP 缓存
+        """
+        await self._session.send("Network.setBlockedURLs", {'urls': list(patterns)})
+
+    def snapshot(self):
+        return {'requests': self.requests, 'cached_requests': self.cached_requests,
+                'network_bytes': self.network_bytes, 'cache_bytes': self.cache_bytes}
+
+    def _on_response(self, params):
+        response = params.get('response') or {}
+        if response.get('fromDiskCache') or response.get('fromPrefetchCache'):
+            self._cached.add(params.get('requestId'))
+
+    def _on_served_from_cache(self, params):
+        self._cached.add(params.get('requestId'))
+
+    def _on_data(self, params):
+        if params.get('requestId') in self._cached:
+            self.cache_bytes += params.get('dataLength') or 0
+
+    def _on_finished(self, params):
+        request_id = params.get('requestId')
+        self.requests += 1
+        self.network_bytes += int(params.get('encodedDataLength') or 0)
+        if request_id in self._cached:
+            self.cached_requests += 1
+            self._cached.discard(request_id)
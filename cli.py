@@ -1,13 +1,340 @@
-from douyin_spider import DouyinSpider, extract_url_from_text
+from douyin_spider import DouyinSpider, extract_url_from_text, extract_urls_from_text
+from browser_pool import get_shared_pool, shutdown_shared_pool
+from engine import get_shared_engine, shutdown_shared_engine
+from resolve_cache import ResolveCache, normalize_share_url
+from download_index import DownloadIndex
+from media_verify import VerifyManifest
+from metrics import MetricsBus, JsonlSink, SummaryCollector
+from concurrent.futures import FIRST_COMPLETED, as_completed, wait
+import argparse
+import multiprocessing
+import json
+import os
+import signal
+import socket
 import sys
 
+def verify():
+    """
+    按下载索引重新检查已下载的文件（存在性、大小、内容哈希）
+    """
+    index = DownloadIndex()
+    results = index.verify()
+    bad = 0
+    for record, status in results:
+        if status != 'ok':
+            bad += 1
+        print(f"[{status}] {record['video_id']} {record['path']}")
+    print(f"共检查 {len(results)} 个文件，异常 {bad} 个")
+    index.close()
+    return 1 if bad else 0
+
+def read_batch_urls(stream):
+    """
+    从分享文本流中提取所有链接（每行可以有多个），按规范化地址去重并保持顺序
+    """
+    urls = []
+    seen = set()
+    for line in stream:
+        for url in extract_urls_from_text(line):
+            key = normalize_share_url(url)
+            if key not in seen:
+                seen.add(key)
+                urls.append(url)
+    return urls
+
+def add_profile_arguments(parser):
+    parser.add_argument("--profile", nargs="?", const=os.path.join("cache", "browser_profile"), metavar="DIR",
+                        help="使用持久化浏览器配置（保留 cookie 和 HTTP 缓存，重复打开页面更快），默认目录 cache/browser_profile")
+    parser.add_argument("--profile-cache-mb", type=int, default=256, help="HTTP 缓存上限 (MB)")
+    parser.add_argument("--profile-max-mb", type=int, default=1024, help="配置目录超过该大小时清空重建 (MB)")
+
+def make_profile(args, log):
+    if not args.profile:
+        return None
+    from browser_profile import BrowserProfile
+    return BrowserProfile(args.profile, cache_size_mb=args.profile_cache_mb, max_size_mb=args.profile_max_mb,
+                          log_callback=log)
+
+def batch(argv):
+    """
+    批量模式：解析和下载流水线并发处理多个链接（浏览器页面共享同一个浏览器），每个链接输出一行 JSON 结果
+    日志输出到 stderr，stdout（或 --output 文件）只包含结果行
+    """
+    parser = argparse.ArgumentParser(prog="cli.py batch", description="批量下载抖音视频")
+    parser.add_argument("input", nargs="?", default="-", help="分享文本文件，默认从 stdin 读取")
+    parser.add_argument("-c", "--concurrency", type=int, default=4, help="同时解析的页面数量")
+    parser.add_argument("--downloads", type=int, default=None, help="同时下载的数量，默认与 --concurrency 相同")
+    parser.add_argument("-o", "--output", help="结果 JSONL 文件，默认输出到 stdout")
+    parser.add_argument("-d", "--save-dir", default="videos", help="视频保存目录")
+    parser.add_argument("--metrics", help="把结构化事件（阶段耗时、候选、下载速度等）写入该 JSONL 文件")
+    parser.add_argument("-w", "--workers", type=int, default=1,
+                        help="工作进程数（每个进程一个浏览器，--concurrency 为每个进程的页面数），默认 1 即单进程")
+    add_profile_arguments(parser)
+    args = parser.parse_args(argv)
+
+    if args.input == "-":
+        urls = read_batch_urls(sys.stdin)
+    else:
+        with open(args.input, 'r', encoding='utf-8') as f:
+            urls = read_batch_urls(f)
+    print(f"共识别到 {len(urls)} 个链接，并发数 {args.concurrency}", file=sys.stderr)
+    os.makedirs(args.save_dir, exist_ok=True)
+
+    def log(message):
+        print(f"[Spider] {message}", file=sys.stderr, flush=True)
+
+    # 所有任务的事件汇总到同一条总线，结束时输出耗时直方图
+    metrics = MetricsBus()
+    summary = metrics.subscribe(SummaryCollector())
+    jsonl = metrics.subscribe(JsonlSink(args.metrics)) if args.metrics else None
+
+    if args.workers > 1:
+        if args.profile:
+            # 同一个用户数据目录只能被一个浏览器进程使用
+            log("多进程模式不支持 --profile，已忽略")
+        return batch_multiprocess(args, urls, metrics, summary, jsonl, log)
+
+    # 页面数量与解析并发数一致：所有链接共享同一个浏览器
+    pool = get_shared_pool(size=args.concurrency, headless=True, log_callback=log, metrics=metrics,
+                           profile=make_profile(args, log))
+    engine = get_shared_engine(pool=pool, resolve_concurrency=args.concurrency,
+                               download_concurrency=args.downloads or args.concurrency, log_callback=log)
+    cache = ResolveCache(log_callback=log)
+    index = DownloadIndex()
+    manifest = VerifyManifest()
+    out = open(args.output, 'a', encoding='utf-8') if args.output else sys.stdout
+
+    futures = {}
+    for url in urls:
+        spider = DouyinSpider(url, log_callback=log, cache=cache, index=index, engine=engine, metrics=metrics,
+                              manifest=manifest)
+        spider.save_dir = args.save_dir
+        futures[engine.submit(spider)] = url
+
+    failed = 0
+    try:
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                log(f"处理 {futures[future]} 出错: {e}")
+                result = {'url': futures[future], 'status': 'failed', 'error': str(e)}
+            if result['status'] not in ('downloaded', 'skipped'):
+                failed += 1
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        shutdown_shared_engine()
+        shutdown_shared_pool()
+        index.close()
+        if jsonl is not None:
+            jsonl.close()
+
+    print(summary.format_summary(), file=sys.stderr)
+    print(f"批量处理完成: 成功 {len(urls) - failed} 个，失败 {failed} 个", file=sys.stderr)
+    return 1 if failed else 0
+
+def batch_multiprocess(args, urls, metrics, summary, jsonl, log):
+    """
+    多进程批量模式：链接写入共享任务库，由多个工作进程（各自一个浏览器）按租约领取
+    """
+    from supervisor import Supervisor
+
+    supervisor = Supervisor(workers=args.workers, concurrency=args.concurrency, downloads=args.downloads,
+                            save_dir=args.save_dir, metrics=metrics, log_callback=log)
+    try:
+        results = supervisor.run(urls)
+    finally:
+        if jsonl is not None:
+            jsonl.close()
+
+    failed = 0
+    out = open(args.output, 'a', encoding='utf-8') if args.output else sys.stdout
+    try:
+        for result in results:
+            if result['status'] not in ('downloaded', 'skipped'):
+                failed += 1
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    print(summary.format_summary(), file=sys.stderr)
+    print(f"批量处理完成: 成功 {len(urls) - failed} 个，失败 {failed} 个", file=sys.stderr)
+    return 1 if failed else 0
+
+def crawl(argv):
+    """
+    主页/合集模式：边翻页边下载，断点保存在 cache/crawl_checkpoints.json，再次运行时只抓新作品
+    （上次没抓完的历史作品接着抓）。每个作品输出一行 JSON 结果
+    """
+    from profile_crawler import ProfileCrawler
+
+    parser = argparse.ArgumentParser(prog="cli.py crawl", description="下载用户主页或合集中的全部视频")
+    parser.add_argument("url", help="主页/合集链接或分享文本")
+    parser.add_argument("--downloads", type=int, default=4, help="同时下载的数量")
+    parser.add_argument("-d", "--save-dir", default="videos", help="视频保存目录")
+    parser.add_argument("-n", "--max-items", type=int, default=None, help="本次最多下载的作品数")
+    parser.add_argument("--restart", action="store_true", help="忽略断点，从头抓取")
+    parser.add_argument("-o", "--output", help="结果 JSONL 文件，默认输出到 stdout")
+    parser.add_argument("--metrics", help="把结构化事件写入该 JSONL 文件")
+    add_profile_arguments(parser)
+    args = parser.parse_args(argv)
+
+    url = extract_url_from_text(args.url)
+    if not url:
+        print("未识别到有效链接", file=sys.stderr)
+        return 2
+
+    def log(message):
+        print(f"[Spider] {message}", file=sys.stderr, flush=True)
+
+    metrics = MetricsBus()
+    summary = metrics.subscribe(SummaryCollector())
+    jsonl = metrics.subscribe(JsonlSink(args.metrics)) if args.metrics else None
+
+    # 抓取全程占用一个页面；作品已带播放地址，下载不需要浏览器，
+    # 但上次失败重新交出的作品 HTTP 快速解析失败时要嗅探，第二个页面留给它们，否则会和翻页互相等待
+    pool = get_shared_pool(size=2, headless=True, log_callback=log, metrics=metrics, profile=make_profile(args, log))
+    engine = get_shared_engine(pool=pool, resolve_concurrency=1, download_concurrency=args.downloads,
+                               log_callback=log)
+    crawler = ProfileCrawler(url, pool=pool, max_items=args.max_items, restart=args.restart, log_callback=log,
+                             metrics=metrics)
+    index = DownloadIndex()
+    manifest = VerifyManifest()
+    out = open(args.output, 'a', encoding='utf-8') if args.output else sys.stdout
+
+    failed = total = 0
+    pending = set()
+    items = {}
+
+    def collect(done):
+        nonlocal failed
+        for future in done:
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {'status': 'failed', 'error': str(e)}
+            ok = result['status'] in ('downloaded', 'skipped')
+            if not ok:
+                failed += 1
+            # 所在页的作品都处理完后才保存断点，失败的作品下次重新下载
+            crawler.done(items.pop(future), ok)
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            out.flush()
+
+    try:
+        for item in crawler.crawl():
+            total += 1
+            # 上次失败重新交出的作品没有播放地址，按视频链接重新解析
+            spider = DouyinSpider(item['url'], log_callback=log, index=index, engine=engine, metrics=metrics,
+                                  target=item if item['candidates'] else None, manifest=manifest)
+            spider.save_dir = args.save_dir
+            future = engine.submit(spider)
+            items[future] = item
+            pending.add(future)
+            # 在途任务有上限：下载跟不上时不再取新作品，翻页随之暂停
+            if len(pending) >= args.downloads * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+        collect(wait(pending).done)
+    except KeyboardInterrupt:
+        print("\n已中断，下次运行从断点继续", file=sys.stderr)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        shutdown_shared_engine()
+        shutdown_shared_pool()
+        index.close()
+        if jsonl is not None:
+            jsonl.close()
+
+    print(summary.format_summary(), file=sys.stderr)
+    print(f"主页抓取完成: 共 {total} 个作品，失败 {failed} 个", file=sys.stderr)
+    return 1 if failed else 0
+
+def serve(argv):
+    """
+    服务模式：常驻进程保持浏览器和下载引擎预热，通过本地 HTTP 接口（或 Unix 套接字）接收任务
+    """
+    from job_store import JobStore
+    from service import DownloadService, make_server
+
+    parser = argparse.ArgumentParser(prog="cli.py serve", description="以常驻服务方式运行下载器")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址（默认只允许本机访问）")
+    parser.add_argument("--port", type=int, default=8765, help="监听端口")
+    parser.add_argument("--unix", help="改为监听该 Unix 套接字文件")
+    parser.add_argument("-c", "--concurrency", type=int, default=2, help="同时解析的页面数量")
+    parser.add_argument("--downloads", type=int, default=None, help="同时下载的数量，默认与 --concurrency 相同")
+    parser.add_argument("-d", "--save-dir", default="videos", help="默认视频保存目录")
+    parser.add_argument("--jobs-db", default=os.path.join("cache", "jobs.db"), help="任务库文件")
+    add_profile_arguments(parser)
+    args = parser.parse_args(argv)
+
+    def log(message):
+        print(f"[Spider] {message}", file=sys.stderr, flush=True)
+
+    downloads = args.downloads or args.concurrency
+    pool = get_shared_pool(size=args.concurrency, headless=True, log_callback=log, profile=make_profile(args, log))
+    engine = get_shared_engine(pool=pool, resolve_concurrency=args.concurrency, download_concurrency=downloads,
+                               log_callback=log)
+    store = JobStore(args.jobs_db)
+    index = DownloadIndex()
+    # 服务以 "主机名:serve" 作为租约持有者，重启后能认领上次未完成的任务
+    service = DownloadService(store, engine, cache=ResolveCache(log_callback=log), index=index,
+                              manifest=VerifyManifest(), save_dir=args.save_dir, max_active=args.concurrency + downloads,
+                              owner=f"{socket.gethostname()}:serve:{os.path.abspath(args.jobs_db)}",
+                              log_callback=log).start()
+    server = make_server(service, args.host, args.port, args.unix)
+    where = args.unix or f"http://{args.host}:{args.port}"
+
+    def on_terminate(signum, frame):
+        raise KeyboardInterrupt
+
+    # 作为后台服务运行时通常用 SIGTERM 停止，与 Ctrl+C 一样保存未完成的任务
+    signal.signal(signal.SIGTERM, on_terminate)
+    print(f"下载服务已启动: {where}（Ctrl+C 退出）", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n正在停止服务...", file=sys.stderr)
+    finally:
+        server.server_close()
+        service.stop()
+        shutdown_shared_engine()
+        shutdown_shared_pool()
+        store.close()
+        index.close()
+    return 0
+
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "verify":
+        sys.exit(verify())
+    if len(sys.argv) > 1 and sys.argv[1] == "batch":
+        sys.exit(batch(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "crawl":
+        sys.exit(crawl(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "serve":
+        sys.exit(serve(sys.argv[2:]))
+
     print("="*60)
     print("抖音视频爬虫命令行版 v1.0")
     print("功能：自动过滤广告，下载高清无水印(尽可能)视频")
     print("操作：粘贴分享口令或链接，按回车开始下载。输入 'q' 退出。")
     print("="*60)
 
+    # 整个会话共享一个常驻浏览器，避免每个链接都冷启动 Chromium
+    pool = get_shared_pool(size=1, headless=True)
+    engine = get_shared_engine(pool=pool, resolve_concurrency=1, download_concurrency=1)
+    # 重复的链接直接使用缓存的播放地址
+    cache = ResolveCache()
+    # 已下载过的视频直接跳过
+    index = DownloadIndex()
+    manifest = VerifyManifest()
+
     while True:
         try:
             # 使用 sys.stdout.flush() 确保提示符立即显示
@@ -28,7 +355,7 @@ def main():
                 
             print(f"正在启动爬虫抓取: {url}")
             # 实例化爬虫并运行
-            spider = DouyinSpider(url)
+            spider = DouyinSpider(url, cache=cache, index=index, engine=engine, manifest=manifest)
             spider.run()
             print("----------------------------------------")
             
@@ -38,5 +365,13 @@ def main():
         except Exception as e:
             print(f"发生未预期的错误: {e}")
 
+    shutdown_shared_engine()
+    shutdown_shared_pool()
+    index.close()
+    stats = cache.stats()
+    print(f"解析缓存: 命中 {stats['hits']} 次，未命中 {stats['misses']} 次，过期 {stats['expired']} 次")
+
 if __name__ == "__main__":
+    # 多进程批量模式在 Windows / PyInstaller 打包版下需要
+    multiprocessing.freeze_support()
     main()
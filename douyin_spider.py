@@ -2,6 +2,7 @@ import re
 import time
 import os
 import sys
+import threading
 
 # 同样在爬虫模块中设置环境变量，确保独立运行时或被调用时都能找到浏览器
 # 必须在导入 playwright 之前设置
@@ -15,30 +16,84 @@ else:
     # 这里我们打印一下，方便调试
     pass
 
-import requests
-from playwright.sync_api import sync_playwright
+import asyncio
+
+from browser_pool import DEFAULT_USER_AGENT
+from browser_profile import cache_meter_for
+from engine import DownloadEngine
+from http_client import get_http_client
+from metrics import MetricsBus, LogSink, LogEvent, CandidateEvent, RetryEvent
+from resource_policy import ResourcePolicy
+from downloader import SegmentedDownloader
+from share_resolver import (ShareResolver, DETAIL_API_RE, extract_video_id, extract_play_candidates,
+                            parse_detail_response, rank_candidates, video_duration)
 
 class DouyinSpider:
-    def __init__(self, url, headless=True, log_callback=None):
+    def __init__(self, url, headless=True, log_callback=None, pool=None, settle_time=2.0, sniff_timeout=20.0,
+                 resource_policy=None, abort_media=True, download_segments=4, fast_path=True,
+                 resolver=None, cache=None, index=None, engine=None, metrics=None, cancel_event=None,
+                 target=None, manifest=None):
         self.url = url
         self.headless = headless
         self.log_callback = log_callback
+        # 结构化事件：本实例的总线把日志交给 log_callback，其余事件转发给调用方共享的 metrics 总线
+        self.metrics = MetricsBus(parent=metrics)
+        self.metrics.subscribe(LogSink(log_callback))
+        # 可选的共享浏览器池（见 browser_pool.py），不传则需要时临时启动浏览器
+        self.pool = pool
+        # 可选的共享下载引擎（见 engine.py），不传则每次 run() 临时创建
+        self.engine = engine
         self.headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+            "User-Agent": DEFAULT_USER_AGENT,
             "Referer": "https://www.douyin.com/"
         }
         self.video_candidates = [] # 存储所有候选视频
+        # 嗅探结束条件：捕获候选后 settle_time 秒内没有更大的候选即结束，最长不超过 sniff_timeout 秒
+        self.settle_time = settle_time
+        self.sniff_timeout = sniff_timeout
+        self._best_size = 0
+        self._last_better_at = 0.0
+        self._candidate_event = None
+        # 从页面的视频详情接口拿到的视频信息（包含全部清晰度的播放地址）
+        self._api_aweme = None
+        self._api_candidates = []
+        # 页面路由：拦截无用资源；abort_media 为 True 时只探测视频流头信息，不让浏览器下载整段视频
+        self.resource_policy = resource_policy or ResourcePolicy()
+        self.abort_media = abort_media
+        self._blocked_requests = 0
+        self._bytes_saved = 0
+        self.download_segments = download_segments
+        # 先尝试纯 HTTP 解析分享链接，失败再启动浏览器
+        self.fast_path = fast_path
+        self.resolver = resolver or ShareResolver(log_callback=self.log)
+        # 可选的解析缓存（见 resolve_cache.py），多个爬虫实例可共享同一个
+        self.cache = cache
+        # 可选的下载索引（见 download_index.py），用于跳过已下载的视频并避免同名覆盖
+        self.index = index
         self.save_dir = "videos"
+        # 取消标记：cancel() 后引擎不再开始新的阶段，嗅探和下载尽快停止
+        self.cancel_event = cancel_event or threading.Event()
+        # 预先得到的解析结果 {'video_id', 'title', 'candidates'}（如主页抓取时列表接口已给出播放地址），
+        # 有则不再解析，直接下载
+        self.target = target
+        # 可选的校验结果清单（见 media_verify.VerifyManifest），每次下载尝试记录一行
+        self.manifest = manifest
+        self.last_report = None
 
         if not os.path.exists(self.save_dir):
             os.makedirs(self.save_dir)
             self.log(f"已创建下载目录: {self.save_dir}")
 
     def log(self, message):
-        if self.log_callback:
-            self.log_callback(message)
-        else:
-            print(f"[Spider] {message}")
+        self.metrics.emit(LogEvent(url=self.url, message=message))
+
+    def cancel(self):
+        """取消任务（可在任意线程调用）"""
+        self.cancel_event.set()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
 
     def handle_response(self, response):
         """
@@ -47,168 +102,409 @@ class DouyinSpider:
         try:
             # 抖音视频流通常是 .mp4 结尾或者 content-type 为 video/mp4
             # 或者是 blob 链接（但 blob 无法直接 requests 下载，这里主要关注 mp4）
-            if response.status == 200 and ('video/mp4' in response.headers.get('content-type', '') or '.mp4' in response.url):
-                content_length = int(response.headers.get('content-length', 0))
-                url = response.url
-                
-                # 过滤掉太小的文件（小于 1MB 的通常是广告或图标特效）
-                if content_length > 1024 * 1024: 
-                    self.log(f"捕获视频流: 大小={content_length/1024/1024:.2f}MB, URL={url[:60]}...")
-                    self.video_candidates.append({
-                        'url': url,
-                        'size': content_length
-                    })
+            if response.status in (200, 206) and ('video/mp4' in response.headers.get('content-type', '') or '.mp4' in response.url):
+                if response.status == 206:
+                    # 分段响应的 content-length 只是这一段，总大小在 Content-Range: bytes 0-1023/12345678
+                    content_length = int(response.headers.get('content-range', '').rpartition('/')[2] or 0)
                 else:
-                    self.log(f"忽略小文件(可能是广告): 大小={content_length/1024}KB, URL={url[:60]}...")
+                    content_length = int(response.headers.get('content-length', 0))
+                self._record_candidate(response.url, content_length, 'response')
         except Exception as e:
             # self.log(f"处理响应出错: {e}")
             pass
 
-    def run(self):
-        with sync_playwright() as p:
-            self.log(f"正在启动浏览器 (Headless={self.headless})...")
-            # 修改：关闭 headless 模式，模拟真实用户，减少被识别为机器人的概率
-            # 也可以方便观察发生了什么
-            try:
-                browser = p.chromium.launch(headless=self.headless, args=['--start-maximized'] if not self.headless else [])
-            except Exception as e:
-                self.log(f"启动浏览器失败: {e}")
-                self.log("尝试使用 playwright install 安装浏览器...")
+    async def handle_api_response(self, response):
+        """
+        解析页面自己请求的视频详情接口：在视频开始传输之前就能拿到全部清晰度的播放地址
+        """
+        if self._api_aweme is not None or not DETAIL_API_RE.search(response.url):
+            return
+        try:
+            if response.status != 200:
                 return
+            aweme = parse_detail_response(await response.json())
+        except Exception:
+            return
+        if aweme is None:
+            return
+        # 页面可能同时请求推荐视频的详情，只采用当前视频的（短链以跳转后的页面地址为准）
+        expected_id = extract_video_id(self.url)
+        if not expected_id:
+            try:
+                expected_id = extract_video_id(response.frame.url)
+            except Exception:
+                pass
+        if expected_id and str(aweme.get('aweme_id') or expected_id) != expected_id:
+            return
+        candidates = extract_play_candidates(aweme)
+        if not candidates:
+            return
 
-            # 创建上下文
-            context = browser.new_context(
-                viewport={'width': 1920, 'height': 1080},
-                user_agent=self.headers["User-Agent"]
-            )
-            
-            # 注入防检测脚本
-            # 适配 EXE 打包路径和开发环境路径
-            stealth_path = "stealth.min.js"
-            if getattr(sys, 'frozen', False):
-                stealth_path = os.path.join(sys._MEIPASS, "stealth.min.js")
-            
-            if os.path.exists(stealth_path):
-                self.log(f"加载反爬脚本: {stealth_path}")
-                context.add_init_script(path=stealth_path)
+        self._api_aweme = aweme
+        for c in candidates:
+            self.metrics.emit(CandidateEvent(url=self.url, candidate_url=c['url'], size=c['size'], accepted=True, source='api'))
+        self.log(f"视频详情接口返回 {len(candidates)} 个播放地址，最高 {candidates[0]['height'] or '?'}p")
+        self._api_candidates = candidates
+        if self._candidate_event is not None:
+            self._candidate_event.set()
+
+    def _record_candidate(self, url, content_length, source):
+        # 同一个地址可能从路由探测和响应监听各报一次，只记录第一次
+        if any(c['url'] == url for c in self.video_candidates):
+            return
+        # 过滤掉太小的文件（小于 1MB 的通常是广告或图标特效）
+        accepted = content_length > 1024 * 1024
+        self.metrics.emit(CandidateEvent(url=self.url, candidate_url=url, size=content_length, accepted=accepted, source=source))
+        if accepted:
+            self.log(f"捕获视频流: 大小={content_length/1024/1024:.2f}MB, URL={url[:60]}...")
+            self.video_candidates.append({
+                'url': url,
+                'size': content_length
+            })
+            # 出现更大的候选（例如广告之后的正片）时重新计算静默窗口
+            if content_length > self._best_size:
+                self._best_size = content_length
+                self._last_better_at = time.monotonic()
+                if self._candidate_event is not None:
+                    self._candidate_event.set()
+        else:
+            self.log(f"忽略小文件(可能是广告): 大小={content_length/1024}KB, URL={url[:60]}...")
+
+    async def _handle_route(self, route):
+        """
+        页面路由：按 resource_policy 拦截资源，视频流只探测头信息后中止
+        """
+        request = route.request
+        action = self.resource_policy.decide(request.url, request.resource_type)
+        try:
+            if action == ResourcePolicy.BLOCK:
+                self._blocked_requests += 1
+                await route.abort()
+            elif action == ResourcePolicy.MEDIA and self.abort_media:
+                await self._probe_media(route)
             else:
-                self.log("警告: 未找到反爬脚本 stealth.min.js")
+                await route.continue_()
+        except Exception:
+            # 页面关闭或请求已被处理时会抛错，忽略即可
+            pass
+
+    async def _probe_media(self, route):
+        """
+        用 1 字节的 Range 请求代替浏览器下载视频：记录地址和总大小后中止请求，
+        正片交给 download_video 下载，避免同一个视频下载两遍
+        """
+        request = route.request
+        headers = dict(request.headers)
+        headers['range'] = 'bytes=0-0'
+        response = await route.fetch(headers=headers)
+
+        if response.status == 206:
+            # Content-Range: bytes 0-0/12345678
+            total = int(response.headers.get('content-range', '').rpartition('/')[2] or 0)
+            if 'video/mp4' in response.headers.get('content-type', '') or '.mp4' in request.url:
+                self._record_candidate(request.url, total, 'probe')
+            self._bytes_saved += max(total - 1, 0)
+            await route.abort()
+        else:
+            # 服务器不支持 Range，数据已经完整拿到了，直接交给浏览器（候选由 handle_response 记录）
+            await route.fulfill(response=response)
+
+    def run(self):
+        """
+        解析并下载视频（同步接口，实际由 engine.DownloadEngine 执行），返回结果:
+        {'url', 'status', 'video_id', 'path', 'bytes', 'timings'}
+        status 取值: downloaded / skipped / failed / no_video / browser_error / cancelled
+        """
+        if self.engine is not None:
+            return self.engine.run(self)
+
+        # 未传入共享引擎时临时创建一个，用完即关（传入的浏览器池由调用方负责关闭）
+        engine = DownloadEngine(pool=self.pool, resolve_concurrency=1, download_concurrency=1,
+                                headless=self.headless, log_callback=self.log, metrics=self.metrics)
+        try:
+            return engine.run(self)
+        finally:
+            engine.close()
+
+    def known_video_id(self):
+        """
+        不解析就能知道的视频 id：长链接中自带，或解析缓存中记录过
+        """
+        if self.target is not None:
+            return self.target['video_id']
+        video_id = extract_video_id(self.url)
+        if not video_id and self.cache is not None:
+            video_id = self.cache.video_id_for(self.url)
+        return video_id
+
+    def _find_downloaded(self, video_id):
+        if self.index is None or not video_id:
+            return None
+        record = self.index.find_downloaded(video_id)
+        if record:
+            self.log(f"视频 {video_id} 已下载过，跳过: {record['path']}")
+        return record
+
+    def report_no_video(self):
+        self.log("未能获取到视频链接。可能原因：")
+        self.log("1. 视频是 blob 格式（加密流），当前爬虫暂不支持")
+        self.log("2. 反爬虫检测拦截了请求")
+        self.log("3. 需要登录")
+
+    def download_target(self, target):
+        """
+        按优先级下载解析结果中的候选，失败（403、CDN 节点异常、数据未通过校验等）时换下一个候选或镜像地址，
+        熔断中的主机排到最后。成功返回 {'path', 'size', 'sha256'}，全部失败返回 None
+        """
+        video_id = target['video_id']
+        title = target['title']
+        urls = get_http_client().order_by_health(c['url'] for c in target['candidates'])
+        if self.index is not None:
+            filepath = self.index.claim_path(self.save_dir, title, video_id)
+        else:
+            filename = f"{title}.mp4"
+            filepath = os.path.join(self.save_dir, filename)
+
+        try:
+            record = None
+            for i, url in enumerate(urls):
+                if i:
+                    self.log(f"切换到第 {i + 1}/{len(urls)} 个候选地址: {url[:60]}...")
+                    self.metrics.emit(RetryEvent(url=self.url, what="candidate", attempt=i, reason="上一个地址下载失败"))
+                record = self.download_video(url, filepath, target.get('duration'))
+                if self.manifest is not None and self.last_report is not None:
+                    self.manifest.append(dict(self.last_report, job_url=self.url, video_id=video_id, attempt=i + 1))
+                if record or self.cancelled:
+                    break
+            if record and self.index is not None and video_id:
+                self.index.add(video_id, record['path'], record['size'], record['sha256'])
+            return record
+        finally:
+            if self.index is not None:
+                self.index.release_path(filepath)
+
+    def _resolve_over_http(self):
+        """
+        快速路径：不启动浏览器，直接用 HTTP 解析分享链接，失败返回 None
+        """
+        self.log(f"尝试 HTTP 快速解析: {self.url}")
+        with self.metrics.phase("http_resolve", self.url):
+            result = self.resolver.resolve(self.url)
+        if not result:
+            self.log("HTTP 快速解析失败，改用浏览器嗅探")
+            return None
 
-            page = context.new_page()
-            
-            # 监听网络请求
-            page.on("response", self.handle_response)
+        self.video_candidates = rank_candidates(result['candidates'])
+        title = clean_title(result['title']) or f"douyin_{result['video_id']}"
+        self.log(f"视频标题: {title}")
+        self.log(f"HTTP 快速解析成功，从 {len(self.video_candidates)} 个播放地址中选择: {self.video_candidates[0]['url'][:60]}...")
+        return {'video_id': result['video_id'], 'title': title, 'duration': result.get('duration'),
+                'candidates': self.video_candidates}
 
+    async def _sniff(self, page):
+        """
+        在租用的页面中访问视频页，返回 {'video_id', 'title', 'duration', 'candidates'}
+        """
+        self._candidate_event = asyncio.Event()
+        deadline = time.monotonic() + self.sniff_timeout
+
+        self._blocked_requests = 0
+        self._bytes_saved = 0
+        self._api_aweme = None
+        self._api_candidates = []
+
+        # 监听网络请求
+        page.on("response", self.handle_response)
+        page.on("response", self.handle_api_response)
+        meter = cache_meter_for(page)
+        if meter is not None:
+            # 持久化配置下页面路由会让 Playwright 关闭 HTTP 缓存，改为按 URL 拦截，视频流不再中止
+            await meter.block_urls(self.resource_policy.url_block_patterns())
+        else:
+            await page.route("**/*", self._handle_route)
+        try:
             self.log(f"正在访问: {self.url}")
             try:
-                page.goto(self.url, timeout=60000)
+                # 页面加载也计入嗅探时限；视频流和详情接口在 DOM 就绪前后就会出现，不必等 load 事件
+                with self.metrics.phase("goto", self.url):
+                    await page.goto(self.url, timeout=max(1, deadline - time.monotonic()) * 1000,
+                                    wait_until='domcontentloaded')
             except Exception as e:
                 self.log(f"页面加载超时或出错: {e}")
 
-            # 等待页面加载，特别是视频元素
-            try:
-                page.wait_for_selector('video', timeout=15000)
-                # 多等待几秒，确保正片加载（有时候广告先播，正片后播）
-                time.sleep(5) 
-                
-                # 模拟鼠标移动，触发加载
-                page.mouse.move(100, 100)
-                page.mouse.move(200, 200)
-                time.sleep(2)
-            except:
-                self.log("等待视频元素超时")
-
-            # 获取标题
-            title = page.title()
-            title = re.sub(r'[\\/:*?"<>|]', '', title).strip()
+            # 等待页面加载，特别是视频元素；详情接口已经返回时不必再等
+            if not self._api_candidates:
+                try:
+                    selector_timeout = max(deadline - time.monotonic(), 0.1)
+                    with self.metrics.phase("wait_selector", self.url):
+                        await self._wait_for_video_element(page, min(15, selector_timeout))
+
+                    # 模拟鼠标移动，触发加载
+                    await page.mouse.move(100, 100)
+                    await page.mouse.move(200, 200)
+                except:
+                    self.log("等待视频元素超时")
+
+            # 不再固定等待，由捕获事件驱动（广告先播时正片到达会重置静默窗口）
+            with self.metrics.phase("settle", self.url):
+                await self._wait_for_stream(deadline)
+
+            # 获取标题（优先使用详情接口里的视频描述）
+            title = clean_title(self._api_aweme.get('desc') or '') if self._api_aweme else ''
+            if not title:
+                title = clean_title(await page.title())
             if not title or title == "抖音":
                 try:
-                    desc = page.locator('.desc').first.inner_text()
-                    title = re.sub(r'[\\/:*?"<>|]', '', desc).strip()
+                    desc = await page.locator('.desc').first.inner_text()
+                    title = clean_title(desc)
                 except:
                     pass
-            
+
             if not title:
                 title = f"douyin_{int(time.time())}"
-            if len(title) > 50:
-                title = title[:50]
-            
+
             self.log(f"视频标题: {title}")
 
-            # 策略优化：选择最大的视频文件
+            # 详情接口的地址按清晰度/码率/大小排序放在前面，嗅探到的视频流按大小排在后面作为备选
             target_url = None
-            if self.video_candidates:
+            if self._api_candidates:
+                api_urls = set(c['url'] for c in self._api_candidates)
+                sniffed = [c for c in rank_candidates(self.video_candidates) if c['url'] not in api_urls]
+                self.video_candidates = self._api_candidates + sniffed
+                target_url = self.video_candidates[0]['url']
+                self.log(f"从视频详情接口的 {len(self._api_candidates)} 个地址中选择了清晰度最高的: {target_url[:60]}...")
+            elif self.video_candidates:
                 # 按大小排序，取最大的
-                self.video_candidates.sort(key=lambda x: x['size'], reverse=True)
+                self.video_candidates = rank_candidates(self.video_candidates)
                 target_url = self.video_candidates[0]['url']
                 self.log(f"从 {len(self.video_candidates)} 个候选视频中选择了最大的: {target_url[:60]}...")
             else:
                 self.log("网络监听未捕获有效视频，尝试直接解析页面元素...")
                 try:
-                    video_elem = page.query_selector('video')
+                    video_elem = await page.query_selector('video')
                     if video_elem:
-                        src = video_elem.get_attribute('src')
+                        src = await video_elem.get_attribute('src')
                         # 有时候 src 是 blob:，这种无法直接下载。如果是 http 开头则可以使用
                         if src and src.startswith('http'):
                             target_url = src
                             self.log(f"从页面元素获取 URL: {target_url}")
                         else:
                             # 尝试获取 source 子标签
-                            sources = video_elem.query_selector_all('source')
+                            sources = await video_elem.query_selector_all('source')
                             for s in sources:
-                                s_src = s.get_attribute('src')
+                                s_src = await s.get_attribute('src')
                                 if s_src and s_src.startswith('http'):
                                     target_url = s_src
                                     break
                 except Exception as e:
                     self.log(f"页面解析出错: {e}")
 
-            if target_url:
-                filename = f"{title}.mp4"
-                filepath = os.path.join(self.save_dir, filename)
-                self.download_video(target_url, filepath)
+            if target_url and not self.video_candidates:
+                self.video_candidates = [{'url': target_url, 'size': 0}]
+            video_id = extract_video_id(page.url) or extract_video_id(self.url)
+            if self._api_aweme and self._api_aweme.get('aweme_id'):
+                video_id = str(self._api_aweme['aweme_id'])
+            # 时长只有详情接口给出，嗅探到的视频流没有
+            duration = video_duration(self._api_aweme) if self._api_aweme else None
+            return {'video_id': video_id, 'title': title, 'duration': duration, 'candidates': self.video_candidates}
+        finally:
+            # 页面会被池复用，必须解除本次的监听和路由
+            page.remove_listener("response", self.handle_response)
+            page.remove_listener("response", self.handle_api_response)
+            try:
+                if meter is not None:
+                    await meter.block_urls([])
+                else:
+                    await page.unroute("**/*", self._handle_route)
+            except Exception:
+                pass
+            if meter is None:
+                self.log(f"本页拦截资源 {self._blocked_requests} 个，中止浏览器内视频传输节省 {self._bytes_saved/1024/1024:.2f}MB")
+
+    async def _wait_for_stream(self, deadline):
+        """
+        等待视频流候选稳定：捕获到候选且 settle_time 内没有更大的候选出现即返回，
+        到达 deadline 时无论结果如何都返回
+        """
+        while True:
+            if self.cancelled:
+                return
+            if self._api_candidates:
+                # 详情接口已给出全部清晰度，不需要再等视频流
+                self.log("已从视频详情接口获取播放地址，结束嗅探")
+                return
+            now = time.monotonic()
+            remaining = deadline - now
+            if remaining <= 0:
+                self.log(f"嗅探达到最长等待时间 {self.sniff_timeout}s")
+                return
+            if self.video_candidates:
+                quiet = now - self._last_better_at
+                if quiet >= self.settle_time:
+                    self.log(f"视频流已稳定 {quiet:.1f}s，结束嗅探")
+                    return
+                timeout = min(self.settle_time - quiet, remaining)
             else:
-                self.log("未能获取到视频链接。可能原因：")
-                self.log("1. 视频是 blob 格式（加密流），当前爬虫暂不支持")
-                self.log("2. 反爬虫检测拦截了请求")
-                self.log("3. 需要登录")
+                timeout = remaining
+            # 定期醒来检查是否已取消
+            timeout = min(timeout, 0.5)
 
-            # 调试模式下不自动关闭，方便看一眼
-            # browser.close() 
-            # 还是关闭吧，不然进程残留
-            browser.close()
+            self._candidate_event.clear()
+            try:
+                await asyncio.wait_for(self._candidate_event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
 
-    def download_video(self, url, filepath):
-        self.log(f"开始下载: {filepath}")
+    async def _wait_for_video_element(self, page, timeout):
+        """
+        等待页面出现 video 元素，详情接口先返回时提前结束；超时抛出异常
+        """
+        selector = asyncio.ensure_future(page.wait_for_selector('video', timeout=timeout * 1000))
+        api = asyncio.ensure_future(self._candidate_event.wait())
         try:
-            # 抖音视频链接通常需要带上 headers 避免 403
-            response = requests.get(url, headers=self.headers, stream=True)
-            if response.status_code == 200:
-                total_size = int(response.headers.get('content-length', 0))
-                downloaded_size = 0
-                
-                with open(filepath, 'wb') as f:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        if chunk:
-                            f.write(chunk)
-                            downloaded_size += len(chunk)
-                            # 简单的进度显示
-                            if total_size > 0:
-                                percent = (downloaded_size / total_size) * 100
-                                # 进度条通常不通过 log 输出，避免刷屏，这里简单处理
-                                # self.log(f"\r下载进度: {percent:.2f}%")
-                self.log(f"下载完成！文件已保存至: {filepath}")
-            else:
-                self.log(f"下载失败，状态码: {response.status_code}")
-        except Exception as e:
-            self.log(f"下载出错: {e}")
+            while True:
+                done, _ = await asyncio.wait({selector, api}, return_when=asyncio.FIRST_COMPLETED)
+                if selector in done:
+                    selector.result()
+                    return
+                if self._api_candidates:
+                    return
+                # 只是嗅探到了视频流，继续等 video 元素
+                self._candidate_event.clear()
+                api = asyncio.ensure_future(self._candidate_event.wait())
+        finally:
+            for task in (selector, api):
+                if not task.done():
+                    task.cancel()
+
+    def download_video(self, url, filepath, expected_duration=None):
+        self.log(f"开始下载: {filepath}")
+        # 支持 Range 时分段并发下载并可断点续传，否则退回单连接下载
+        downloader = SegmentedDownloader(self.headers, segments=self.download_segments, log_callback=self.log,
+                                         metrics=self.metrics, job_url=self.url, cancel_event=self.cancel_event)
+        record = downloader.download(url, filepath, expected_duration)
+        self.last_report = downloader.report
+        return record
+
+def clean_title(text):
+    """
+    去掉文件名中的非法字符，并限制长度
+    """
+    title = re.sub(r'[\\/:*?"<>|]', '', text or '').strip()
+    return title[:50]
+
+def extract_urls_from_text(text):
+    """
+    从混合文本中提取所有 URL（按出现顺序，可能有重复）
+    """
+    # 尝试匹配 http 或 https 开头的链接
+    return re.findall(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+', text)
 
 def extract_url_from_text(text):
     """
     从混合文本中提取 URL
     """
-    # 尝试匹配 http 或 https 开头的链接
-    urls = re.findall(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+', text)
+    urls = extract_urls_from_text(text)
     if urls:
         return urls[0]
     return None
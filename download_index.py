@@ -0,0 +1,167 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from media_verify import BLOCK_HASH_PREFIX, file_block_hash
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def content_hash(path, reference):
+    """
+    按 reference 的格式计算文件哈希：带 media_verify.BLOCK_HASH_PREFIX 前缀的是分块哈希，
+    否则是整个文件的 sha256（旧版本写入的记录）
+    """
+    if reference.startswith(BLOCK_HASH_PREFIX):
+        return file_block_hash(path)
+    return file_sha256(path)
+
+
+class DownloadIndex:
+    """
+    已下载视频索引（SQLite）：video_id -> 文件路径、字节数、内容哈希。
+
+    下载前按视频 id 查询即可跳过已下载的视频（只做一次 stat 检查文件仍在且大小一致），
+    也用于为同名标题分配不冲突的文件名。
+    """
+
+    # 认领记录的有效期（秒），超过后视为持有进程已崩溃
+    CLAIM_TTL = 6 * 3600
+
+    def __init__(self, path=os.path.join("cache", "downloads.db")):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.path = path
+        self._lock = threading.Lock()
+        # 正在下载中的路径 -> video_id，防止并发任务写同一个文件
+        self._claimed = {}
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS downloads ("
+                "video_id TEXT PRIMARY KEY, path TEXT NOT NULL, size INTEGER NOT NULL, "
+                "sha256 TEXT, created_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS downloads_path ON downloads (path)")
+            # 正在下载中的路径（跨进程）：多个工作进程共用一个索引时，同名标题不会写到同一个文件
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS claims (path TEXT PRIMARY KEY, video_id TEXT, created_at REAL NOT NULL)"
+            )
+
+    def get(self, video_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT video_id, path, size, sha256, created_at FROM downloads WHERE video_id = ?", (video_id,)
+            ).fetchone()
+        return self._row_to_dict(row)
+
+    def find_downloaded(self, video_id):
+        """
+        返回仍然有效（文件存在且大小一致）的下载记录，否则返回 None
+        """
+        if not video_id:
+            return None
+        record = self.get(video_id)
+        if record is None:
+            return None
+        try:
+            if os.path.getsize(record['path']) == record['size']:
+                return record
+        except OSError:
+            pass
+        return None
+
+    def add(self, video_id, path, size, sha256):
+        path = os.path.abspath(path)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO downloads (video_id, path, size, sha256, created_at) VALUES (?, ?, ?, ?, ?)",
+                (video_id, path, size, sha256, time.time())
+            )
+
+    def claim_path(self, save_dir, title, video_id):
+        """
+        为视频分配文件路径：同名文件属于其他视频时追加视频 id（无 id 时追加序号）
+        下载结束后需调用 release_path()
+        """
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM claims WHERE created_at < ?", (time.time() - self.CLAIM_TTL,))
+            n = 0
+            while True:
+                if n == 0:
+                    name = title
+                elif video_id and n == 1:
+                    name = f"{title}_{video_id}"
+                else:
+                    name = f"{title}_{n}"
+                path = os.path.abspath(os.path.join(save_dir, f"{name}.mp4"))
+                if self._path_available(path, video_id) and self._claim_row(path, video_id):
+                    self._claimed[path] = video_id
+                    return path
+                n += 1
+
+    def release_path(self, path):
+        path = os.path.abspath(path)
+        with self._lock, self._conn:
+            self._claimed.pop(path, None)
+            self._conn.execute("DELETE FROM claims WHERE path = ?", (path,))
+
+    def verify(self, full_hash=True):
+        """
+        逐条检查索引中的文件，返回 [(记录, 状态)]，状态为 ok / missing / size_mismatch / hash_mismatch
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT video_id, path, size, sha256, created_at FROM downloads ORDER BY created_at"
+            ).fetchall()
+        results = []
+        for row in rows:
+            record = self._row_to_dict(row)
+            if not os.path.exists(record['path']):
+                status = 'missing'
+            elif os.path.getsize(record['path']) != record['size']:
+                status = 'size_mismatch'
+            elif full_hash and record['sha256'] and content_hash(record['path'], record['sha256']) != record['sha256']:
+                status = 'hash_mismatch'
+            else:
+                status = 'ok'
+            results.append((record, status))
+        return results
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _path_available(self, path, video_id):
+        if path in self._claimed:
+            return False
+        row = self._conn.execute("SELECT video_id FROM downloads WHERE path = ?", (path,)).fetchone()
+        if row is not None:
+            return row[0] == video_id
+        # 磁盘上已有的未登记文件不覆盖
+        return not os.path.exists(path)
+
+    def _claim_row(self, path, video_id):
+        cursor = self._conn.execute(
+            "INSERT OR IGNORE INTO claims (path, video_id, created_at) VALUES (?, ?, ?)", (path, video_id, time.time())
+        )
+        if cursor.rowcount:
+            return True
+        # 同一个视频留下的认领（例如上次下载中途退出）可以继续使用，断点续传
+        row = self._conn.execute("SELECT video_id FROM claims WHERE path = ?", (path,)).fetchone()
+        return row is not None and video_id is not None and row[0] == video_id
+
+    @staticmethod
+    def _row_to_dict(row):
+        if row is None:
+            return None
+        return {'video_id': row[0], 'path': row[1], 'size': row[2], 'sha256': row[3], 'created_at': row[4]}
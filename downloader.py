@@ -0,0 +1,359 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from http_client import CircuitOpen, HttpStatusError, get_http_client, host_of
+from media_verify import BLOCK_SIZE, BlockHasher, VerificationError, check_mp4_head, scan_mp4
+from metrics import DownloadEvent, DownloadProgressEvent, RetryEvent, VerifyEvent
+
+
+class DownloadCancelled(Exception):
+    """下载被 cancel_event 取消"""
+
+
+class SegmentedDownloader:
+    """
+    分段并发下载器：服务器支持 Range 时把文件切成多段并行下载到预分配的 .part 文件，
+    旁边的 .part.json 清单记录每段已完成的字节数，中断后再次下载会从断点继续，
+    全部完成后原子重命名为目标文件；不支持 Range 时退回单连接下载。
+    请求通过共享的 http_client.HttpClient 发出（长连接、超时、重试和按主机熔断），
+    分段传输中途断开时从该段已写入的位置重试。
+
+    两种模式都先写入 .part 文件，边下载边计算分块哈希（见 media_verify.BlockHasher）并检查长度和文件头，
+    完成后只读取 MP4 盒子头部检查结构和时长，通过才重命名为目标文件；未通过的数据直接删除（不再续传）。
+    """
+
+    def __init__(self, headers, segments=4, min_segment_size=2 * 1024 * 1024, chunk_size=64 * 1024, log_callback=None,
+                 metrics=None, job_url=None, progress_interval=0.5, cancel_event=None, client=None, verify=True,
+                 min_duration=1.0):
+        self.headers = headers
+        self.segments = segments
+        self.min_segment_size = min_segment_size
+        self.chunk_size = chunk_size
+        self.log_callback = log_callback
+        # 可选的 metrics.MetricsBus，用于上报下载进度和速度；job_url 标记事件所属任务
+        self.metrics = metrics
+        self.job_url = job_url
+        self.progress_interval = progress_interval
+        # 可选的 threading.Event，置位后各下载循环在下一个数据块处停止（分段下载保留断点）
+        self.cancel_event = cancel_event
+        # 不传则使用进程内共享的客户端
+        self.client = client or get_http_client()
+        # verify 为 False 时只检查长度和计算哈希，不检查 MP4 结构；短于 min_duration 秒的视频视为无效
+        self.verify = verify
+        self.min_duration = min_duration
+        # 最近一次 download() 的结果和校验信息，供调用方写入清单（见 media_verify.VerifyManifest）
+        self.report = None
+        self._hasher = None
+        self._abort = threading.Event()
+        self._lock = threading.Lock()
+        self._last_save = 0.0
+        self._last_progress = 0.0
+
+    def log(self, message):
+        if self.log_callback:
+            self.log_callback(message)
+        else:
+            print(f"[Downloader] {message}")
+
+    def download(self, url, filepath, expected_duration=None):
+        """
+        下载 url 到 filepath，成功返回 {'path', 'size', 'sha256'}（sha256 为分块哈希），失败返回 None。
+        expected_duration 为解析得到的视频时长（秒），相差太多时视为下到了广告或别的视频
+        """
+        started = time.monotonic()
+        self.report = {'url': url, 'path': filepath, 'ok': False, 'mode': None, 'size': 0, 'sha256': None,
+                       'duration': None, 'boxes': None, 'error': None}
+        total = self._probe(url) if self.segments > 1 else 0
+        mode = 'segmented' if total else 'single'
+        self.report['mode'] = mode
+        try:
+            if mode == 'single':
+                record = self._download_single(url, filepath)
+            else:
+                record = self._download_segmented(url, filepath, total)
+            if record:
+                record = self._finish(filepath, record, expected_duration)
+        except VerificationError as e:
+            self.log(f"下载的数据未通过校验，已丢弃: {e}")
+            self._discard(filepath)
+            self.report['error'] = str(e)
+            self._emit_verify(url, filepath, False, str(e))
+            record = None
+
+        if self.metrics is not None:
+            duration = time.monotonic() - started
+            size = record['size'] if record else 0
+            self.metrics.emit(DownloadEvent(
+                url=self.job_url, path=filepath, bytes=size, duration=duration,
+                mbps=size / 1024 / 1024 / duration if duration > 0 else 0.0, mode=mode, ok=record is not None
+            ))
+        return record
+
+    def _finish(self, filepath, record, expected_duration):
+        """检查 .part 文件的 MP4 结构和时长，通过后重命名为目标文件"""
+        part_path = filepath + ".part"
+        self.report.update(size=record['size'], sha256=record['sha256'])
+        if self.verify:
+            info = scan_mp4(part_path)
+            self.report.update(duration=info['duration'], boxes=info['boxes'])
+            self._check_duration(info['duration'], expected_duration)
+        os.replace(part_path, filepath)
+        if os.path.exists(part_path + ".json"):
+            os.remove(part_path + ".json")
+        self.report['ok'] = True
+        if self.verify:
+            self._emit_verify(self.report['url'], filepath, True, "")
+        self.log(f"下载完成！文件已保存至: {filepath}")
+        return dict(record, path=filepath)
+
+    def _check_duration(self, duration, expected):
+        if duration < self.min_duration:
+            raise VerificationError(f"视频时长只有 {duration:.2f}s")
+        if expected and abs(duration - expected) > max(2.0, expected * 0.1):
+            raise VerificationError(f"视频时长 {duration:.1f}s 与解析结果 {expected:.1f}s 不符，可能是广告或其他视频")
+
+    def _discard(self, filepath):
+        for path in (filepath + ".part", filepath + ".part.json"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _emit_verify(self, url, filepath, ok, reason):
+        if self.metrics is not None:
+            self.metrics.emit(VerifyEvent(url=self.job_url, path=filepath, candidate_url=url, ok=ok, reason=reason,
+                                          duration=self.report['duration'] or 0.0))
+
+    def _get(self, url, headers):
+        return self.client.get(url, headers=headers, stream=True, metrics=self.metrics, job_url=self.job_url,
+                               cancel_event=self.cancel_event, log=self.log)
+
+    def _check_cancelled(self):
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise DownloadCancelled("下载已取消")
+
+    def _report_progress(self, filepath, downloaded, total, force=False):
+        """按 progress_interval 节流上报下载进度"""
+        if self.metrics is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_progress < self.progress_interval:
+            return
+        self._last_progress = now
+        self.metrics.emit(DownloadProgressEvent(url=self.job_url, path=filepath, downloaded=downloaded, total=total))
+
+    def _probe(self, url):
+        """
+        用 1 字节的 Range 请求探测是否支持分段，返回文件总大小（不支持返回 0）
+        """
+        try:
+            headers = dict(self.headers)
+            headers['Range'] = 'bytes=0-0'
+            response = self._get(url, headers)
+            response.close()
+            if response.status_code == 206:
+                # Content-Range: bytes 0-0/12345678
+                return int(response.headers.get('content-range', '').rpartition('/')[2] or 0)
+        except Exception as e:
+            self.log(f"探测分段下载失败，改用单连接: {e}")
+        return 0
+
+    def _download_single(self, url, filepath):
+        part_path = filepath + ".part"
+        response = None
+        try:
+            # 抖音视频链接通常需要带上 headers 避免 403
+            response = self._get(url, self.headers)
+            if response.status_code == 200:
+                total_size = int(response.headers.get('content-length', 0))
+                downloaded_size = 0
+                # 边下载边计算内容哈希
+                hasher = BlockHasher()
+
+                with open(part_path, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=8192):
+                        if chunk:
+                            self._check_cancelled()
+                            if downloaded_size == 0 and self.verify:
+                                check_mp4_head(chunk)
+                            f.write(chunk)
+                            hasher.update(downloaded_size, chunk)
+                            downloaded_size += len(chunk)
+                            self._report_progress(filepath, downloaded_size, total_size)
+                self._report_progress(filepath, downloaded_size, total_size, force=True)
+                # 压缩传输时 Content-Length 是压缩后的长度，无法比较
+                if total_size and downloaded_size != total_size and not response.headers.get('content-encoding'):
+                    raise VerificationError(f"收到 {downloaded_size} 字节，与 Content-Length {total_size} 不符")
+                return {'size': downloaded_size, 'sha256': hasher.hexdigest(downloaded_size)}
+            else:
+                self.report['error'] = f"状态码 {response.status_code}"
+                self.log(f"下载失败，状态码: {response.status_code}")
+        except VerificationError:
+            raise
+        except Exception as e:
+            if isinstance(e, DownloadCancelled) or (self.cancel_event is not None and self.cancel_event.is_set()):
+                self.report['error'] = "下载已取消"
+                self.log("下载已取消")
+            else:
+                self.report['error'] = str(e)
+                self.log(f"下载出错: {e}")
+            # 单连接下载无法续传，删除不完整的文件
+            if os.path.exists(part_path):
+                os.remove(part_path)
+        finally:
+            if response is not None:
+                response.close()
+        return None
+
+    def _download_segmented(self, url, filepath, total):
+        part_path = filepath + ".part"
+        manifest_path = part_path + ".json"
+
+        manifest = self._load_manifest(manifest_path, part_path, total)
+        if manifest:
+            done = sum(seg[2] for seg in manifest['segments'])
+            self.log(f"从断点继续下载: 已完成 {done/1024/1024:.2f}MB / {total/1024/1024:.2f}MB")
+        else:
+            manifest = self._new_manifest(url, total)
+            # 预分配文件，各分段直接写入自己的偏移位置
+            with open(part_path, 'wb') as f:
+                f.truncate(total)
+        # 签名地址会过期，断点续传时使用最新的地址
+        manifest['url'] = url
+        self._save_manifest(manifest_path, manifest)
+
+        pending = [seg for seg in manifest['segments'] if seg[0] + seg[2] <= seg[1]]
+        self.log(f"分段下载: {len(manifest['segments'])} 段，待下载 {len(pending)} 段，总大小 {total/1024/1024:.2f}MB")
+
+        self._hasher = BlockHasher()
+        self._abort.clear()
+        errors = []
+        with ThreadPoolExecutor(max_workers=max(len(pending), 1)) as executor:
+            futures = [executor.submit(self._fetch_segment, url, filepath, manifest_path, manifest, seg) for seg in pending]
+            for future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    errors.append(e)
+
+        self._save_manifest(manifest_path, manifest)
+        for e in errors:
+            if isinstance(e, VerificationError):
+                raise e
+        if errors and self.cancel_event is not None and self.cancel_event.is_set():
+            self.report['error'] = "下载已取消"
+            self.log("下载已取消（已保存进度，重新下载时将断点续传）")
+            return None
+        if errors:
+            self.report['error'] = str(errors[0])
+            self.log(f"下载出错（已保存进度，重试时将断点续传）: {errors[0]}")
+            return None
+
+        self._report_progress(filepath, total, total, force=True)
+        # 各分段按块对齐，块哈希在下载时已经算好；只有续传前写入的块和中途重试过的块需要从文件读回来
+        with open(part_path, 'rb') as f:
+            def read_block(index):
+                f.seek(index * BLOCK_SIZE)
+                return f.read(BLOCK_SIZE)
+
+            block_hash = self._hasher.hexdigest(total, read_block)
+        if self._hasher.reread_blocks:
+            self.log(f"从文件补算了 {self._hasher.reread_blocks} 个数据块的哈希")
+        return {'size': total, 'sha256': block_hash}
+
+    def _fetch_segment(self, url, filepath, manifest_path, manifest, seg):
+        """下载一个分段，传输中途断开时从已写入的位置按退避重试（请求本身的重试由 HttpClient 负责）"""
+        attempt = 0
+        while True:
+            try:
+                return self._fetch_segment_once(url, filepath, manifest_path, manifest, seg)
+            except VerificationError:
+                # 通知其他分段停止，数据已经不可用
+                self._abort.set()
+                raise
+            except (DownloadCancelled, CircuitOpen, HttpStatusError):
+                raise
+            except Exception as e:
+                self._check_cancelled()
+                if attempt >= self.client.retries:
+                    raise
+                attempt += 1
+                self.client.breaker.record_failure(host_of(url))
+                delay = self.client.backoff_delay(attempt)
+                if self.metrics is not None:
+                    self.metrics.emit(RetryEvent(url=self.job_url, what="segment", attempt=attempt, reason=str(e)))
+                self.log(f"分段 {seg[0]}-{seg[1]} 传输中断（{e}），{delay:.1f}s 后从断点重试")
+                if self.cancel_event is not None:
+                    self.cancel_event.wait(delay)
+                else:
+                    time.sleep(delay)
+
+    def _fetch_segment_once(self, url, filepath, manifest_path, manifest, seg):
+        part_path = filepath + ".part"
+        start, end, done = seg
+        headers = dict(self.headers)
+        headers['Range'] = f"bytes={start + done}-{end}"
+        response = self._get(url, headers)
+        if response.status_code != 206:
+            response.close()
+            raise HttpStatusError(f"分段 {start}-{end} 请求失败，状态码: {response.status_code}")
+
+        # 无缓冲写入：进度记录到清单时数据已经交给操作系统，进程崩溃也不会丢
+        with response, open(part_path, 'r+b', buffering=0) as f:
+            f.seek(start + done)
+            for chunk in response.iter_content(chunk_size=self.chunk_size):
+                if not chunk:
+                    continue
+                self._check_cancelled()
+                if self._abort.is_set():
+                    raise DownloadCancelled("其他分段校验未通过")
+                offset = start + seg[2]
+                chunk = chunk[:end + 1 - offset]
+                if offset == 0 and self.verify:
+                    check_mp4_head(chunk)
+                f.write(chunk)
+                self._hasher.update(offset, chunk)
+                with self._lock:
+                    seg[2] += len(chunk)
+                    if time.monotonic() - self._last_save > 1.0:
+                        self._save_manifest(manifest_path, manifest)
+                    self._report_progress(filepath, sum(s[2] for s in manifest['segments']), manifest['size'])
+                if start + seg[2] > end:
+                    break
+
+        if start + seg[2] <= end:
+            raise IOError(f"分段 {start}-{end} 数据不完整")
+
+    def _new_manifest(self, url, total):
+        count = max(1, min(self.segments, total // self.min_segment_size))
+        # 分段边界按哈希块对齐，每块只由一个分段按顺序写入，下载时就能算出块哈希
+        size = max(BLOCK_SIZE, total // count // BLOCK_SIZE * BLOCK_SIZE)
+        count = max(1, min(count, total // size))
+        segments = []
+        for i in range(count):
+            start = i * size
+            end = total - 1 if i == count - 1 else start + size - 1
+            # [起始偏移, 结束偏移(含), 已完成字节数]
+            segments.append([start, end, 0])
+        return {'url': url, 'size': total, 'segments': segments}
+
+    def _load_manifest(self, manifest_path, part_path, total):
+        if not (os.path.exists(manifest_path) and os.path.exists(part_path)):
+            return None
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except Exception:
+            return None
+        # 大小不一致说明不是同一个视频，重新下载
+        if manifest.get('size') != total or os.path.getsize(part_path) != total:
+            return None
+        return manifest
+
+    def _save_manifest(self, manifest_path, manifest):
+        tmp_path = manifest_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, manifest_path)
+        self._last_save = time.monotonic()
@@ -0,0 +1,273 @@
+import asyncio
+import atexit
+import threading
+import time
+from concurrent.futures import Future
+
+from browser_pool import BrowserPool
+from metrics import JobEvent, PhaseEvent
+
+
+class _Job:
+    """引擎中的一个任务：一个 DouyinSpider 实例及其结果"""
+
+    def __init__(self, spider):
+        self.spider = spider
+        self.future = Future()
+        self.started = time.monotonic()
+        self.result = {'url': spider.url, 'status': 'failed', 'video_id': None, 'path': None, 'bytes': 0, 'timings': {}}
+
+    def timing(self, phase, started):
+        duration = time.monotonic() - started
+        self.result['timings'][phase] = round(duration, 3)
+        self.spider.metrics.emit(PhaseEvent(url=self.spider.url, phase=phase, duration=duration))
+
+    def finish(self, status, record=None):
+        self.result['status'] = status
+        if record:
+            self.result['path'] = record['path']
+            self.result['bytes'] = record['size']
+        self.timing('total', self.started)
+        self.spider.metrics.emit(JobEvent(url=self.spider.url, status=status, result=self.result))
+        if not self.future.done():
+            self.future.set_result(self.result)
+
+
+class DownloadEngine:
+    """
+    异步下载引擎：解析阶段 -> 有界队列 -> 下载阶段。
+
+    解析阶段（HTTP 快速解析 / 浏览器嗅探）和下载阶段各有自己的并发上限，
+    下载队列满时解析阶段暂停取新任务（背压）。浏览器解析完一个页面就去处理下一个链接，
+    之前的视频在下载阶段继续写盘。引擎运行在自己的后台事件循环里，任何线程都可以 submit()。
+    """
+
+    def __init__(self, pool=None, resolve_concurrency=2, download_concurrency=4, queue_size=None,
+                 headless=True, log_callback=None, metrics=None):
+        # 未传入浏览器池时，第一次需要浏览器嗅探才创建，close() 时一并关闭
+        self.pool = pool
+        self._own_pool = pool is None
+        self.resolve_concurrency = resolve_concurrency
+        self.download_concurrency = download_concurrency
+        self.queue_size = queue_size or download_concurrency * 2
+        self.headless = headless
+        self.log_callback = log_callback
+        # 可选的 metrics.MetricsBus，引擎自己创建的浏览器池的事件（启动耗时、页面资源统计）上报到这里
+        self.metrics = metrics
+
+        self._loop = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._pool_lock = threading.Lock()
+        self._jobs = None
+        self._downloads = None
+        self._workers = []
+
+    def log(self, message):
+        if self.log_callback:
+            self.log_callback(message)
+        else:
+            print(f"[Engine] {message}")
+
+    def start(self):
+        with self._start_lock:
+            if self._loop is not None:
+                return
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._loop.run_forever, name="DownloadEngine", daemon=True)
+            self._thread.start()
+            asyncio.run_coroutine_threadsafe(self._async_start(), self._loop).result()
+
+    def submit(self, spider):
+        """
+        提交一个 DouyinSpider 任务，返回 concurrent.futures.Future（结果同 DouyinSpider.run()）
+        """
+        self.start()
+        job = _Job(spider)
+        self._loop.call_soon_threadsafe(self._jobs.put_nowait, job)
+        return job.future
+
+    def run(self, spider):
+        """同步执行一个任务并等待结果"""
+        return self.submit(spider).result()
+
+    def close(self):
+        with self._start_lock:
+            if self._loop is None:
+                return
+            loop, thread = self._loop, self._thread
+            try:
+                asyncio.run_coroutine_threadsafe(self._async_close(), loop).result(timeout=30)
+            except Exception as e:
+                self.log(f"关闭下载引擎出错: {e}")
+            loop.call_soon_threadsafe(loop.stop)
+            if thread is not threading.current_thread():
+                thread.join(timeout=10)
+            loop.close()
+            self._loop = None
+            self._thread = None
+        if self._own_pool and self.pool is not None:
+            self.pool.close()
+            self.pool = None
+
+    async def _async_start(self):
+        self._jobs = asyncio.Queue()
+        self._downloads = asyncio.Queue(maxsize=self.queue_size)
+        self._workers = [asyncio.create_task(self._resolve_worker()) for _ in range(self.resolve_concurrency)]
+        self._workers += [asyncio.create_task(self._download_worker()) for _ in range(self.download_concurrency)]
+
+    async def _async_close(self):
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        # 未完成的任务标记为失败，避免调用方一直等待
+        for queue in (self._jobs, self._downloads):
+            while not queue.empty():
+                item = queue.get_nowait()
+                job = item[0] if isinstance(item, tuple) else item
+                job.finish('failed')
+
+    async def _resolve_worker(self):
+        while True:
+            job = await self._jobs.get()
+            if job.spider.cancelled:
+                job.finish('cancelled')
+                continue
+            try:
+                target = await self._resolve_job(job)
+                if target is not None:
+                    # 下载队列满时在这里等待，形成背压
+                    await self._downloads.put((job, target))
+            except asyncio.CancelledError:
+                job.finish('failed')
+                raise
+            except Exception as e:
+                job.spider.log(f"解析出错: {e}")
+                job.finish('failed')
+
+    async def _download_worker(self):
+        while True:
+            job, target = await self._downloads.get()
+            if job.spider.cancelled:
+                job.finish('cancelled')
+                continue
+            try:
+                started = time.monotonic()
+                record = await asyncio.to_thread(job.spider.download_target, target)
+                job.timing('download', started)
+                if record:
+                    job.finish('downloaded', record)
+                else:
+                    job.finish('cancelled' if job.spider.cancelled else 'failed')
+            except asyncio.CancelledError:
+                job.finish('failed')
+                raise
+            except Exception as e:
+                job.spider.log(f"下载出错: {e}")
+                job.finish('failed')
+
+    async def _resolve_job(self, job):
+        """
+        解析阶段，需要继续下载时返回解析结果，否则直接结束任务并返回 None
+        """
+        spider = job.spider
+
+        # 已知视频 id 时先查下载索引，已下载过的直接跳过（不解析、不启动浏览器）
+        known_id = spider.known_video_id()
+        job.result['video_id'] = known_id
+        record = spider._find_downloaded(known_id)
+        if record:
+            job.finish('skipped', record)
+            return None
+
+        started = time.monotonic()
+        target = await self._resolve(spider)
+        job.timing('resolve', started)
+        if spider.cancelled:
+            job.finish('cancelled')
+            return None
+        if target is None:
+            job.finish('browser_error')
+            return None
+
+        if not target['candidates']:
+            spider.report_no_video()
+            job.finish('no_video')
+            return None
+
+        job.result['video_id'] = target['video_id']
+        record = spider._find_downloaded(target['video_id'])
+        if record:
+            job.finish('skipped', record)
+            return None
+        return target
+
+    async def _resolve(self, spider):
+        if spider.target is not None:
+            return spider.target
+        # 读穿解析缓存：命中时直接下载，不再解析/启动浏览器
+        if spider.cache is not None:
+            target = spider.cache.get(spider.url)
+            if target is not None:
+                spider.log(f"命中解析缓存: 视频 {target['video_id']}")
+                return target
+
+        target = None
+        if spider.fast_path:
+            target = await asyncio.to_thread(spider._resolve_over_http)
+        if target is None:
+            target = await self._sniff(spider)
+
+        if target and spider.cache is not None:
+            spider.cache.put(spider.url, target)
+        return target
+
+    async def _sniff(self, spider):
+        """
+        在浏览器池中租用页面嗅探，浏览器启动失败返回 None
+        """
+        try:
+            pool = await asyncio.to_thread(self._get_pool, spider.headers["User-Agent"])
+        except Exception as e:
+            spider.log(f"启动浏览器失败: {e}")
+            spider.log("尝试使用 playwright install 安装浏览器...")
+            return None
+        # 页面操作在浏览器池自己的事件循环里执行，嗅探过程的日志和事件由 spider 自己上报
+        return await asyncio.wrap_future(pool.submit(pool.run_leased(spider._sniff)))
+
+    def _get_pool(self, user_agent):
+        with self._pool_lock:
+            if self.pool is None:
+                # 池在引擎的整个生命周期内复用，日志不能归到第一个用到它的任务
+                self.pool = BrowserPool(size=1, headless=self.headless, user_agent=user_agent,
+                                        log_callback=self.log_callback, metrics=self.metrics)
+            self.pool.start()
+            return self.pool
+
+
+_shared_engine = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_engine(**kwargs):
+    """
+    获取进程内共享的下载引擎（首次调用时按参数创建，之后忽略参数）
+    """
+    global _shared_engine
+    with _shared_lock:
+        if _shared_engine is None:
+            _shared_engine = DownloadEngine(**kwargs)
+        return _shared_engine
+
+
+def shutdown_shared_engine():
+    """关闭共享下载引擎，进程退出时自动调用"""
+    global _shared_engine
+    with _shared_lock:
+        engine, _shared_engine = _shared_engine, None
+    if engine is not None:
+        engine.close()
+
+
+atexit.register(shutdown_shared_engine)
@@ -0,0 +1,137 @@
+import json
+import os
+import sys
+import time
+
+
+def find_bundled_browsers_path(candidates):
+    """
+    在候选目录中找到第一个包含 chromium 的 ms-playwright 目录，没有返回 None。
+    每个目录只列一次，不存在的目录直接跳过。
+    """
+    for path in candidates:
+        try:
+            names = os.listdir(path)
+        except OSError:
+            continue
+        if any("chromium" in name for name in names):
+            return path
+    return None
+
+
+def default_browsers_path():
+    """
+    Playwright 实际使用的浏览器目录（与 PLAYWRIGHT_BROWSERS_PATH 的约定一致）
+    """
+    configured = os.environ.get("PLAYWRIGHT_BROWSERS_PATH")
+    if configured and configured != "0":
+        return configured
+    if configured == "0":
+        # "0" 表示浏览器装在 playwright 包自己的目录里
+        try:
+            import importlib.util
+            spec = importlib.util.find_spec("playwright")
+            if spec and spec.origin:
+                return os.path.join(os.path.dirname(spec.origin), "driver", "package", ".local-browsers")
+        except Exception:
+            pass
+        return None
+    if sys.platform == "win32":
+        return os.path.join(os.environ.get("LOCALAPPDATA", os.path.expanduser("~")), "ms-playwright")
+    if sys.platform == "darwin":
+        return os.path.expanduser("~/Library/Caches/ms-playwright")
+    return os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "ms-playwright")
+
+
+def playwright_version():
+    """读取 playwright 版本号，不导入 playwright 本身"""
+    try:
+        from importlib.metadata import version
+        return version("playwright")
+    except Exception:
+        pass
+    try:
+        import playwright
+        return getattr(playwright, "__version__", "unknown")
+    except Exception:
+        return "unknown"
+
+
+def environment_key():
+    """
+    运行环境的指纹：浏览器目录 + 已安装的 chromium 版本目录 + playwright 版本。
+    任何一项变化（换了安装位置、升级了浏览器或 playwright）都需要重新检查。
+    """
+    browsers_path = default_browsers_path()
+    chromium = []
+    if browsers_path:
+        try:
+            chromium = sorted(name for name in os.listdir(browsers_path) if name.startswith("chromium"))
+        except OSError:
+            pass
+    return {
+        'browsers_path': browsers_path,
+        'chromium': chromium,
+        'playwright': playwright_version(),
+    }
+
+
+class EnvironmentStamp:
+    """
+    "环境已验证" 标记：启动一次浏览器验证成功后记录当前环境指纹，
+    之后启动时指纹不变就跳过验证（启动完整的 Chromium 很慢，打包版尤其明显）。
+    """
+
+    def __init__(self, path=os.path.join("cache", "env_verified.json")):
+        self.path = path
+
+    def is_verified(self, key=None):
+        key = key or environment_key()
+        # 没找到任何 chromium 目录时不信任标记
+        if not key['chromium']:
+            return False
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                stamp = json.load(f)
+        except (OSError, ValueError):
+            return False
+        return stamp.get('key') == key
+
+    def mark_verified(self, key=None):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'key': key or environment_key(), 'verified_at': time.time()}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class StartupTimer:
+    """
+    记录启动各阶段距进程开始的耗时，用于跟踪冷启动到可交互的时间
+    """
+
+    def __init__(self, started=None):
+        self.started = started if started is not None else time.perf_counter()
+        self.marks = []
+
+    def mark(self, name):
+        self.marks.append((name, time.perf_counter() - self.started))
+
+    def report(self):
+        return ", ".join(f"{name} {elapsed:.2f}s" for name, elapsed in self.marks)
+
+    def save(self, path="cache/startup_times.jsonl"):
+        """追加一行 JSON，便于比较不同版本的启动耗时"""
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({'ts': time.time(), 'frozen': bool(getattr(sys, 'frozen', False)),
+                                    'marks': dict(self.marks)}, ensure_ascii=False) + "\n")
+        except OSError:
+            pass
@@ -0,0 +1,365 @@
+import json
+import os
+import re
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# 广告约 512KB（低于爬虫的 1MB 阈值），正片默认 8MB
+DEFAULT_MEDIA = {
+    "ad.mp4": 512 * 1024,
+    "main_720p.mp4": 4 * 1024 * 1024,
+    "main_1080p.mp4": 8 * 1024 * 1024,
+}
+
+WATCH_PAGE = """<!DOCTYPE html>
+<html>
+<head><meta charset="utf-8"><title>{title}</title></head>
+<body>
+<div class="desc">{title}</div>
+<video id="player" src="__BASE_URL__/video/ad.mp4" autoplay muted></video>
+<script>
+{detail_fetch}
+// 先播广告，{delay_ms}ms 后切换到正片
+setTimeout(function () {{
+    document.getElementById('player').src = '__BASE_URL__/video/{main}';
+}}, {delay_ms});
+</script>
+</body>
+</html>
+"""
+
+
+PROFILE_PAGE = """<!DOCTYPE html>
+<html>
+<head><meta charset="utf-8"><title>用户 {sec_uid} 的主页</title></head>
+<body style="height: 100000px">
+<script>
+// 首屏请求第一页作品，滚动到底部时按返回的 max_cursor 请求下一页
+var cursor = 0, hasMore = true, loading = false;
+function loadMore() {{
+    if (!hasMore || loading) return;
+    loading = true;
+    fetch('/aweme/v1/web/aweme/post/?sec_user_id={sec_uid}&count={count}&max_cursor=' + cursor)
+        .then(function (r) {{ return r.json(); }})
+        .then(function (data) {{ cursor = data.max_cursor; hasMore = !!data.has_more; loading = false; }});
+}}
+window.addEventListener('scroll', loadMore);
+loadMore();
+</script>
+</body>
+</html>
+"""
+
+
+def make_fake_mp4(size, duration=15.0, timescale=1000):
+    """
+    生成指定大小的 MP4 数据：ftyp + moov(mvhd) + mdat（内容为填充字节）
+    """
+    ftyp = struct.pack('>I4s4sI8s', 24, b'ftyp', b'isom', 512, b'isomiso2')
+    mvhd_payload = struct.pack('>B3xIIII', 0, 0, 0, timescale, int(duration * timescale))
+    mvhd_payload += struct.pack('>IH10x', 0x00010000, 0x0100)
+    mvhd_payload += struct.pack('>9I', 0x00010000, 0, 0, 0, 0x00010000, 0, 0, 0, 0x40000000)
+    mvhd_payload += b'\x00' * 24 + struct.pack('>I', 2)
+    mvhd = struct.pack('>I4s', 8 + len(mvhd_payload), b'mvhd') + mvhd_payload
+    moov = struct.pack('>I4s', 8 + len(mvhd), b'moov') + mvhd
+    header = ftyp + moov
+    mdat_size = max(size - len(header), 8)
+    filler = bytes(range(256)) * (mdat_size // 256 + 1)
+    return header + struct.pack('>I4s', mdat_size, b'mdat') + filler[:mdat_size - 8]
+
+
+class FakeDouyinServer:
+    """
+    本地模拟抖音服务，用于测试和基准测试（不依赖外网）：
+
+    /s/<video_id>/             短链，302 跳转到分享页
+    /share/video/<video_id>/   分享页，返回 fixtures 目录下录制的 HTML
+    /web/<video_id>            跳转到不含数据的网页版落地页（用于测试回退请求分享页）
+    /b/<video_id>/             短链，302 跳转到带 <video> 元素的播放页（浏览器嗅探用）
+    /watch/<video_id>          播放页：先加载广告，再切换到正片
+    /aweme/v1/web/aweme/detail/?aweme_id=<id>   视频详情接口（JSON，包含各清晰度播放地址）
+    /aweme/v1/play/            播放接口，302 跳转到正片
+    /user/<sec_uid>            用户主页：滚动时按游标请求作品列表
+    /aweme/v1/web/aweme/post/?sec_user_id=<id>&max_cursor=<c>   作品列表接口（按发布时间倒序分页）
+    /video/<name>              视频流，支持延迟、限速、Range、403、临时 503、传输中断和 HTML 错误页
+
+    HTML 中的 __BASE_URL__ 会在返回时替换为本服务地址。
+    videos 中没有登记的视频 id 使用 default_fixture（为 None 时返回 404）。
+    """
+
+    def __init__(self, videos=None, host="127.0.0.1", port=0, fixtures_dir=FIXTURES_DIR, default_fixture=None,
+                 media=None, latency=0.0, bandwidth=None, range_support=True, forbidden=(), ad_delay=0.3,
+                 detail_api=True, profiles=None, page_size=10, flaky=None, truncate=None, error_pages=()):
+        # video_id -> fixture 文件名
+        self.videos = dict(videos or {})
+        self.fixtures_dir = fixtures_dir
+        self.default_fixture = default_fixture
+        # 视频名 -> 字节数；latency 为首字节延迟（秒），bandwidth 为每个连接的限速（字节/秒）
+        self.media = dict(DEFAULT_MEDIA if media is None else media)
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.range_support = range_support
+        # 这些视频名返回 403（模拟签名失效或 CDN 节点拒绝）
+        self.forbidden = set(forbidden)
+        # 这些视频名返回状态码 200 的 HTML 错误页（模拟 CDN 防盗链页面）
+        self.error_pages = set(error_pages)
+        # 视频名 -> 次数：前几次请求返回 503（flaky），或只发送一半数据就断开连接（truncate）
+        self.flaky = dict(flaky or {})
+        self.truncate = dict(truncate or {})
+        self.ad_delay = ad_delay
+        # 播放页是否请求视频详情接口
+        self.detail_api = detail_api
+        # sec_uid -> 作品数（作品 0 最新），page_size 为列表接口每页数量
+        self.profiles = dict(profiles or {})
+        self.page_size = page_size
+        self.requests = []
+        self._media_cache = {}
+        self._media_lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def short_url(self, video_id):
+        return f"{self.base_url}/s/{video_id}/"
+
+    def browser_url(self, video_id):
+        return f"{self.base_url}/b/{video_id}/"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def load_fixture(self, name):
+        with open(os.path.join(self.fixtures_dir, name), 'r', encoding='utf-8') as f:
+            return f.read().replace('__BASE_URL__', self.base_url)
+
+    def detail_json(self, video_id):
+        """视频详情接口的响应，格式同网页版 aweme/detail"""
+        bit_rate = []
+        for name, gear, height, rate in (("main_1080p.mp4", "normal_1080_0", 1080, 2400000),
+                                         ("main_720p.mp4", "normal_720_0", 720, 1200000)):
+            if name in self.media:
+                bit_rate.append({'gear_name': gear, 'bit_rate': rate, 'play_addr': {
+                    'url_list': [f"{self.base_url}/video/{name}?video_id={video_id}"],
+                    'data_size': self.media[name], 'height': height, 'width': height * 16 // 9,
+                }})
+        return {'status_code': 0, 'aweme_detail': {
+            'aweme_id': video_id,
+            'desc': f"基准视频{video_id}",
+            'video': {
+                'bit_rate': bit_rate,
+                'play_addr': {'url_list': [f"{self.base_url}/aweme/v1/play/?video_id={video_id}"], 'height': 720},
+            },
+        }}
+
+    def profile_url(self, sec_uid):
+        return f"{self.base_url}/user/{sec_uid}"
+
+    def post_id(self, sec_uid, i):
+        """主页中第 i 个作品（0 为最新）的视频 id"""
+        return str(7310000000000000000 + self.profiles[sec_uid] - i)
+
+    def post_list_json(self, sec_uid, max_cursor=0, count=None):
+        """作品列表接口的响应：max_cursor 为上一页最后一个作品的发布时间（毫秒），0 表示第一页"""
+        count = count or self.page_size
+        total = self.profiles.get(sec_uid, 0)
+        posts = []
+        for i in range(total):
+            create_time = 1700000000 + (total - i) * 3600
+            if max_cursor and create_time * 1000 >= max_cursor:
+                continue
+            video_id = self.post_id(sec_uid, i)
+            posts.append({
+                'aweme_id': video_id, 'desc': f"作品{video_id}", 'create_time': create_time,
+                'video': {'play_addr': {'url_list': [f"{self.base_url}/video/main_720p.mp4?video_id={video_id}"],
+                                        'data_size': self.media.get("main_720p.mp4", 0), 'height': 720}},
+            })
+            if len(posts) == count:
+                break
+        has_more = bool(posts) and posts[-1]['aweme_id'] != self.post_id(sec_uid, total - 1)
+        next_cursor = posts[-1]['create_time'] * 1000 if posts else max_cursor
+        return {'status_code': 0, 'aweme_list': posts, 'max_cursor': next_cursor, 'has_more': int(has_more)}
+
+    def _take(self, counters, name):
+        with self._media_lock:
+            if counters.get(name, 0) > 0:
+                counters[name] -= 1
+                return True
+        return False
+
+    def media_bytes(self, name):
+        with self._media_lock:
+            if name not in self._media_cache:
+                self._media_cache[name] = make_fake_mp4(self.media[name])
+            return self._media_cache[name]
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def handle(self):
+                # 客户端中途断开（如取消下载）属于正常情况
+                try:
+                    super().handle()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def do_GET(self):
+                server.requests.append(self.path)
+                path = self.path.split('?', 1)[0]
+
+                m = re.match(r'^/s/(\w+)/?$', path)
+                if m:
+                    return self._redirect(f"{server.base_url}/share/video/{m.group(1)}/?region=CN&from=web_code_link")
+
+                m = re.match(r'^/web/(\w+)/?$', path)
+                if m:
+                    return self._redirect(f"{server.base_url}/video/{m.group(1)}")
+
+                m = re.match(r'^/video/(\w+)/?$', path)
+                if m:
+                    return self._html("<html><head><title>抖音</title></head><body></body></html>")
+
+                m = re.match(r'^/share/video/(\w+)/?$', path)
+                if m:
+                    fixture = server.videos.get(m.group(1), server.default_fixture)
+                    if fixture:
+                        return self._html(server.load_fixture(fixture))
+
+                m = re.match(r'^/b/(\w+)/?$', path)
+                if m:
+                    return self._redirect(f"{server.base_url}/watch/{m.group(1)}")
+
+                m = re.match(r'^/watch/(\w+)/?$', path)
+                if m:
+                    detail_fetch = ""
+                    if server.detail_api:
+                        detail_fetch = f"fetch('/aweme/v1/web/aweme/detail/?aweme_id={m.group(1)}');"
+                    page = WATCH_PAGE.format(title=f"基准视频{m.group(1)}", main="main_1080p.mp4",
+                                             delay_ms=int(server.ad_delay * 1000), detail_fetch=detail_fetch)
+                    return self._html(page.replace('__BASE_URL__', server.base_url))
+
+                if path == '/aweme/v1/web/aweme/detail/':
+                    m = re.search(r'aweme_id=(\d+)', self.path)
+                    if m:
+                        return self._json(server.detail_json(m.group(1)))
+
+                m = re.match(r'^/user/(\w+)/?$', path)
+                if m and m.group(1) in server.profiles:
+                    page = PROFILE_PAGE.format(sec_uid=m.group(1), count=server.page_size)
+                    return self._html(page)
+
+                if path == '/aweme/v1/web/aweme/post/':
+                    query = parse_qs(urlsplit(self.path).query)
+                    sec_uid = query.get('sec_user_id', [''])[0]
+                    max_cursor = int(query.get('max_cursor', ['0'])[0] or 0)
+                    count = int(query.get('count', ['0'])[0] or 0)
+                    return self._json(server.post_list_json(sec_uid, max_cursor, count))
+
+                if path == '/aweme/v1/play/':
+                    return self._redirect(f"{server.base_url}/video/main_720p.mp4")
+
+                m = re.match(r'^/video/([\w.]+\.mp4)$', path)
+                if m and m.group(1) in server.media:
+                    return self._media(m.group(1))
+
+                self._empty(404)
+
+            def _redirect(self, location):
+                self.send_response(302)
+                self.send_header('Location', location)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def _html(self, text):
+                body = text.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _json(self, data):
+                body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _empty(self, status):
+                self.send_response(status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def _media(self, name):
+                if server.latency:
+                    time.sleep(server.latency)
+                if name in server.forbidden:
+                    return self._empty(403)
+                if name in server.error_pages:
+                    return self._html("<html><body>访问受限</body></html>")
+                if server._take(server.flaky, name):
+                    return self._empty(503)
+                truncated = server._take(server.truncate, name)
+
+                data = server.media_bytes(name)
+                start, end = 0, len(data) - 1
+                range_header = self.headers.get('Range')
+                m = re.match(r'bytes=(\d+)-(\d*)', range_header or '')
+                if m and server.range_support:
+                    start = int(m.group(1))
+                    end = min(int(m.group(2)), end) if m.group(2) else end
+                    self.send_response(206)
+                    self.send_header('Content-Range', f"bytes {start}-{end}/{len(data)}")
+                else:
+                    self.send_response(200)
+                if server.range_support:
+                    self.send_header('Accept-Ranges', 'bytes')
+                self.send_header('Content-Type', 'video/mp4')
+                self.send_header('Content-Length', str(end - start + 1))
+                self.end_headers()
+                body = data[start:end + 1]
+                if truncated:
+                    self.close_connection = True
+                    body = body[:len(body) // 2]
+                self._write_throttled(body)
+
+            def _write_throttled(self, body):
+                chunk_size = 64 * 1024
+                try:
+                    for i in range(0, len(body), chunk_size):
+                        chunk = body[i:i + chunk_size]
+                        self.wfile.write(chunk)
+                        if server.bandwidth:
+                            time.sleep(len(chunk) / server.bandwidth)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+        return Handler
@@ -1,6 +1,13 @@
+import time
+
+# 冷启动计时起点（尽量早）
+_PROCESS_STARTED = time.perf_counter()
+
 import os
 import sys
 
+from environment import EnvironmentStamp, StartupTimer, environment_key, find_bundled_browsers_path
+
 # 【关键设置】
 # 必须在导入 playwright 或其他模块之前设置
 
@@ -23,13 +30,8 @@ if hasattr(sys, '_MEIPASS'):
 potential_paths.append(os.path.join(os.getcwd(), "dist", "ms-playwright"))
 potential_paths.append(os.path.join(os.getcwd(), "ms-playwright"))
 
-found_path = None
-for p in potential_paths:
-    if os.path.exists(p) and os.path.isdir(p) and os.listdir(p):
-        # 简单检查里面有没有 chromium 文件夹
-        if any("chromium" in name for name in os.listdir(p)):
-            found_path = p
-            break
+# 简单检查里面有没有 chromium 文件夹（每个目录只列一次）
+found_path = find_bundled_browsers_path(potential_paths)
 
 if found_path:
     os.environ["PLAYWRIGHT_BROWSERS_PATH"] = found_path
@@ -41,26 +43,61 @@ else:
 
 import customtkinter as ctk
 import threading
+import queue
 import subprocess
 import multiprocessing
 import traceback
 
-from douyin_spider import DouyinSpider, extract_url_from_text
+# 爬虫、浏览器池、下载引擎等较重的模块在第一次下载时才导入，缩短启动时间
+from metrics import MetricsBus, DownloadProgressEvent, JobEvent
+from job_queue import JobQueue
 
 # 设置主题
 ctk.set_appearance_mode("System")  # Modes: "System" (standard), "Dark", "Light"
 ctk.set_default_color_theme("blue")  # Themes: "blue" (standard), "green", "dark-blue"
 
+# 日志框最多保留的行数，超出后删除最早的行
+MAX_LOG_LINES = 2000
+# 主线程每次刷新 UI 的间隔（毫秒）和每次最多处理的日志条数
+UI_POLL_MS = 100
+UI_BATCH_SIZE = 500
+# 同时进行的任务数可选值
+PARALLEL_CHOICES = ["1", "2", "3", "4", "6", "8"]
+
+JOB_STATE_TEXT = {
+    'queued': "排队中",
+    'running': "解析中",
+    'downloading': "下载中",
+    'cancelling': "取消中",
+    'downloaded': "已完成",
+    'skipped': "已下载过",
+    'failed': "失败",
+    'no_video': "未找到视频",
+    'browser_error': "浏览器错误",
+    'cancelled': "已取消",
+}
+
+
 class App(ctk.CTk):
     def __init__(self):
         super().__init__()
+        self.startup = StartupTimer(_PROCESS_STARTED)
+        self.startup.mark("导入")
 
         self.title("抖音视频下载器")
-        self.geometry("700x500")
+        self.geometry("760x640")
 
         # 布局配置
         self.grid_columnconfigure(0, weight=1)
-        self.grid_rowconfigure(2, weight=1)
+        self.grid_rowconfigure(5, weight=1)
+
+        # 工作线程只往队列里放消息，由主线程定时批量取出更新界面（Tk 控件不是线程安全的）
+        self._ui_queue = queue.Queue()
+        # 任务队列：所有任务按提交顺序排列，由主线程调度，同时运行的任务数不超过所选的同时下载数
+        self.job_queue = JobQueue(self._start_job, max_parallel=2)
+        self._job_rows = 0
+        self.metrics = MetricsBus()
+        self.metrics.subscribe(self._on_event)
 
         # 1. 顶部输入区域
         self.input_frame = ctk.CTkFrame(self)
@@ -73,7 +110,7 @@ class App(ctk.CTk):
         self.url_entry = ctk.CTkEntry(self.input_frame, placeholder_text="例如: 2.30 h@o.qe... https://v.douyin.com/...")
         self.url_entry.grid(row=1, column=0, padx=10, pady=(5, 10), sticky="ew")
 
-        self.download_btn = ctk.CTkButton(self.input_frame, text="开始下载", command=self.start_download_thread)
+        self.download_btn = ctk.CTkButton(self.input_frame, text="加入队列", command=self.enqueue_from_input)
         self.download_btn.grid(row=1, column=1, padx=10, pady=(5, 10))
 
         # 1.5 路径选择区域
@@ -93,17 +130,60 @@ class App(ctk.CTk):
         self.browse_btn = ctk.CTkButton(self.path_frame, text="浏览...", width=60, command=self.browse_directory)
         self.browse_btn.grid(row=0, column=2, padx=10, pady=10)
 
+        self.parallel_label = ctk.CTkLabel(self.path_frame, text="同时下载:")
+        self.parallel_label.grid(row=0, column=3, padx=(10, 0), pady=10)
+
+        self.parallel_menu = ctk.CTkOptionMenu(self.path_frame, values=PARALLEL_CHOICES, width=60,
+                                               command=self._set_max_parallel)
+        self.parallel_menu.grid(row=0, column=4, padx=10, pady=10)
+        self.parallel_menu.set("2")
+
         # 2. 环境检查区域
         self.status_label = ctk.CTkLabel(self, text="系统就绪", text_color="gray")
         self.status_label.grid(row=2, column=0, padx=20, pady=(0, 5), sticky="w")
 
-        # 3. 日志输出区域
-        self.log_textbox = ctk.CTkTextbox(self, width=600, height=300)
-        self.log_textbox.grid(row=3, column=0, padx=20, pady=(0, 20), sticky="nsew")
+        # 3. 下载进度
+        self.progress_frame = ctk.CTkFrame(self, fg_color="transparent")
+        self.progress_frame.grid(row=3, column=0, padx=20, pady=(0, 5), sticky="ew")
+        self.progress_frame.grid_columnconfigure(0, weight=1)
+
+        self.progress_bar = ctk.CTkProgressBar(self.progress_frame)
+        self.progress_bar.grid(row=0, column=0, sticky="ew")
+        self.progress_bar.set(0)
+
+        self.progress_label = ctk.CTkLabel(self.progress_frame, text="", width=200, anchor="e")
+        self.progress_label.grid(row=0, column=1, padx=(10, 0))
+
+        # 4. 任务队列
+        self.jobs_frame = ctk.CTkScrollableFrame(self, height=150, label_text="任务队列")
+        self.jobs_frame.grid(row=4, column=0, padx=20, pady=(0, 10), sticky="ew")
+        self.jobs_frame.grid_columnconfigure(0, weight=1)
+
+        self.clear_btn = ctk.CTkButton(self, text="清除已结束的任务", width=120, command=self.clear_finished_jobs)
+        self.clear_btn.grid(row=4, column=0, padx=30, pady=(4, 0), sticky="ne")
+
+        # 5. 日志输出区域
+        self.log_textbox = ctk.CTkTextbox(self, width=600, height=200)
+        self.log_textbox.grid(row=5, column=0, padx=20, pady=(0, 20), sticky="nsew")
         self.log_textbox.configure(state="disabled")
+        self._log_lines = 0
+
+        # 所有任务共享的解析缓存、下载索引和校验记录，第一个任务开始时再加载
+        self.resolve_cache = None
+        self.download_index = None
+        self.manifest = None
 
         # 启动时检查环境
         self.after(500, self.check_environment)
+        self.after(UI_POLL_MS, self._poll_ui_queue)
+        self.startup.mark("窗口创建")
+        # 主循环处理到这个回调时界面已经可以操作
+        self.after(0, self._report_startup)
+
+    def _report_startup(self):
+        self.startup.mark("可交互")
+        self.log(f"启动耗时: {self.startup.report()}")
+        self.startup.save()
 
     def browse_directory(self):
         """选择文件夹"""
@@ -115,12 +195,72 @@ class App(ctk.CTk):
 
 
     def log(self, message):
-        """线程安全的日志输出"""
+        """线程安全的日志输出：只入队，由主线程批量写入日志框"""
+        self._ui_queue.put(('log', message))
+
+    def set_status(self, text, color):
+        """线程安全地更新状态标签"""
+        self._ui_queue.put(('status', text, color))
+
+    def _on_event(self, event):
+        """指标事件回调（在下载线程中执行），只记录数据，不碰界面"""
+        if not isinstance(event, (DownloadProgressEvent, JobEvent)):
+            return
+        if isinstance(event, DownloadProgressEvent):
+            self.job_queue.progress(event.url, event.downloaded, event.total, event.ts)
+            return
+        job = self.job_queue.find(event.url)
+        if job is not None:
+            # 任务结束，交给主线程更新该行并调度下一个任务
+            self._ui_queue.put(('job_done', job, event.status))
+
+    def _poll_ui_queue(self):
+        """主线程定时器：批量写入日志、更新状态和进度条"""
+        lines = []
+        try:
+            for _ in range(UI_BATCH_SIZE):
+                item = self._ui_queue.get_nowait()
+                if item[0] == 'log':
+                    lines.append(item[1])
+                elif item[0] == 'status':
+                    self.status_label.configure(text=item[1], text_color=item[2])
+                elif item[0] == 'job_done':
+                    self.job_queue.finish(item[1], item[2])
+        except queue.Empty:
+            pass
+        if lines:
+            self._append_log(lines)
+        self._render_jobs()
+        self._render_progress()
+        self.after(UI_POLL_MS, self._poll_ui_queue)
+
+    def _append_log(self, lines):
         self.log_textbox.configure(state="normal")
-        self.log_textbox.insert("end", message + "\n")
+        self.log_textbox.insert("end", "\n".join(lines) + "\n")
+        # 单条日志可能包含多行（如异常堆栈）
+        self._log_lines += sum(line.count("\n") + 1 for line in lines)
+        if self._log_lines > MAX_LOG_LINES:
+            # 环形缓冲：删除最早的行，避免日志框无限增长拖慢界面
+            excess = self._log_lines - MAX_LOG_LINES
+            self.log_textbox.delete("1.0", f"{excess + 1}.0")
+            self._log_lines = MAX_LOG_LINES
         self.log_textbox.see("end")
         self.log_textbox.configure(state="disabled")
-        print(message)
+
+    def _render_progress(self):
+        with self.job_queue.lock:
+            active = [(job.downloaded, job.total) for job in self.job_queue.jobs
+                      if job.state == 'downloading' and job.total]
+        if not active:
+            if self.progress_label.cget("text"):
+                self.progress_bar.set(0)
+                self.progress_label.configure(text="")
+            return
+        downloaded = sum(d for d, _ in active)
+        total = sum(t for _, t in active)
+        self.progress_bar.set(downloaded / total if total else 0)
+        self.progress_label.configure(
+            text=f"{len(active)} 个下载中 {downloaded/1024/1024:.1f}/{total/1024/1024:.1f}MB")
 
     def check_environment(self):
         """检查 Playwright 环境"""
@@ -128,6 +268,13 @@ class App(ctk.CTk):
 
     def _check_env_thread(self):
         self.log("正在检查运行环境...")
+        # 环境指纹（浏览器目录、chromium 版本、playwright 版本）和上次验证成功时一致则不再启动浏览器验证
+        stamp = EnvironmentStamp()
+        key = environment_key()
+        if stamp.is_verified(key):
+            self.log(f"环境检查通过（已验证过）：{', '.join(key['chromium'])}")
+            self.set_status("环境正常", "green")
+            return
         try:
             from playwright.sync_api import sync_playwright
             with sync_playwright() as p:
@@ -141,12 +288,14 @@ class App(ctk.CTk):
                     # 显式指定 chromium
                     browser = p.chromium.launch(headless=True)
                     browser.close()
+                    stamp.mark_verified(key)
                     self.log("环境检查通过：Chromium 驱动已安装。")
-                    self.status_label.configure(text="环境正常", text_color="green")
+                    self.set_status("环境正常", "green")
                 except Exception as e:
+                    stamp.clear()
                     self.log(f"检测到驱动异常: {e}")
                     self.log("正在尝试自动安装 Playwright 浏览器驱动 (这可能需要几分钟)...")
-                    self.status_label.configure(text="正在安装依赖组件...", text_color="orange")
+                    self.set_status("正在安装依赖组件...", "orange")
                     self.install_playwright()
         except Exception as e:
             self.log(f"环境严重错误: {e}")
@@ -191,48 +340,125 @@ class App(ctk.CTk):
             rc = process.poll()
             if rc == 0:
                 self.log("组件安装成功！请重新点击下载尝试。")
-                self.status_label.configure(text="环境已修复", text_color="green")
+                self.set_status("环境已修复", "green")
             else:
                 self.log(f"组件安装失败，返回码: {rc}")
-                self.status_label.configure(text="环境安装失败", text_color="red")
+                self.set_status("环境安装失败", "red")
         except Exception as e:
             self.log(f"执行安装命令出错: {e}")
             self.log(traceback.format_exc())
 
-    def start_download_thread(self):
+    def enqueue_from_input(self):
+        """把输入框中的所有链接加入任务队列（支持一次粘贴多条分享文本）"""
         raw_input = self.url_entry.get()
         if not raw_input:
             self.log("错误: 请先输入内容")
             return
-            
+
         save_dir = self.path_entry.get()
         if not save_dir:
             self.log("错误: 请选择保存路径")
             return
 
-        self.download_btn.configure(state="disabled", text="下载中...")
-        threading.Thread(target=self.run_spider, args=(raw_input, save_dir), daemon=True).start()
+        from douyin_spider import extract_urls_from_text
+
+        urls = extract_urls_from_text(raw_input)
+        if not urls:
+            self.log("错误: 未能在输入中识别到有效的链接")
+            return
+
+        added = 0
+        for url in urls:
+            job = self.job_queue.add(url, save_dir)
+            if job is None:
+                self.log(f"链接已在队列中: {url}")
+                continue
+            self._create_job_row(job)
+            added += 1
+        self.url_entry.delete(0, "end")
+        self.log(f"已加入队列 {added} 个链接，保存目录: {save_dir}")
+        self.job_queue.dispatch()
+
+    def _set_max_parallel(self, value):
+        self.job_queue.max_parallel = int(value)
+        self.job_queue.dispatch()
+
+    def _start_job(self, job):
+        from douyin_spider import DouyinSpider
+        from browser_pool import get_shared_pool
+        from engine import get_shared_engine
 
-    def run_spider(self, raw_input, save_dir):
         try:
-            url = extract_url_from_text(raw_input)
-            if not url:
-                self.log("错误: 未能在输入中识别到有效的链接")
-                return
-
-            self.log(f"开始处理链接: {url}")
-            self.log(f"保存目录: {save_dir}")
-            # 传递 headless=True 确保后台静默运行
-            spider = DouyinSpider(url, headless=True, log_callback=self.log)
-            # 临时修改：由于 douyin_spider.py 的 __init__ 方法并没有接收 save_dir 参数（它是在内部写死或硬编码的，或者之前的修改漏掉了？）
-            # 让我们检查一下 douyin_spider.py 的定义。如果不通过参数传递，需要手动设置属性。
-            spider.save_dir = save_dir
-            spider.run()
+            if self.resolve_cache is None:
+                from resolve_cache import ResolveCache
+                from download_index import DownloadIndex
+                from media_verify import VerifyManifest
+
+                self.resolve_cache = ResolveCache(log_callback=self.log)
+                self.download_index = DownloadIndex()
+                # 与 cli.py 一样，所有任务的下载校验结果写入同一个 cache/download_manifest.jsonl
+                self.manifest = VerifyManifest()
+            # 所有任务共享同一个常驻浏览器池和下载引擎；引擎按最大可选并发创建，实际并发由队列调度控制
+            pool = get_shared_pool(size=2, headless=True, log_callback=self.log)
+            engine = get_shared_engine(pool=pool, resolve_concurrency=2, download_concurrency=int(PARALLEL_CHOICES[-1]),
+                                       log_callback=self.log)
+            job.spider = DouyinSpider(job.url, headless=True, log_callback=self.log, cache=self.resolve_cache,
+                                      index=self.download_index, engine=engine, metrics=self.metrics,
+                                      manifest=self.manifest)
+            job.spider.save_dir = job.save_dir
+            job.state = 'running'
+            self.log(f"开始处理链接: {job.url}")
+            engine.submit(job.spider)
         except Exception as e:
             self.log(f"运行出错: {e}")
-        finally:
-            # 恢复按钮状态（需要使用 after 在主线程更新 UI）
-            self.after(0, lambda: self.download_btn.configure(state="normal", text="开始下载"))
+            job.state = 'failed'
+
+    def cancel_job(self, job):
+        if self.job_queue.cancel(job):
+            self.log(f"正在取消: {job.url}")
+
+    def clear_finished_jobs(self):
+        for job in self.job_queue.clear_finished():
+            for widget in job.widgets:
+                widget.destroy()
+
+    def _create_job_row(self, job):
+        # 行号只增不减，清除已结束的任务后新任务仍排在最后
+        self._job_rows += 1
+        row = self._job_rows
+        name = ctk.CTkLabel(self.jobs_frame, text=job.url, anchor="w")
+        state = ctk.CTkLabel(self.jobs_frame, text="", width=80)
+        speed = ctk.CTkLabel(self.jobs_frame, text="", width=160, anchor="e")
+        cancel = ctk.CTkButton(self.jobs_frame, text="取消", width=50, command=lambda: self.cancel_job(job))
+        name.grid(row=row, column=0, padx=5, pady=2, sticky="ew")
+        state.grid(row=row, column=1, padx=5, pady=2)
+        speed.grid(row=row, column=2, padx=5, pady=2)
+        cancel.grid(row=row, column=3, padx=5, pady=2)
+        job.widgets = (name, state, speed, cancel)
+
+    def _render_jobs(self):
+        with self.job_queue.lock:
+            snapshot = [(job, job.state, job.downloaded, job.total, job.speed, job.eta()) for job in self.job_queue.jobs]
+        for job, state, downloaded, total, speed, eta in snapshot:
+            _name, state_label, speed_label, cancel_btn = job.widgets
+            text = JOB_STATE_TEXT.get(state, state)
+            if state == 'downloading' and total:
+                text = f"{text} {downloaded * 100 // total}%"
+            if state_label.cget("text") != text:
+                state_label.configure(text=text)
+
+            detail = ""
+            if state == 'downloading' and speed:
+                detail = f"{speed/1024/1024:.2f}MB/s"
+                if eta is not None:
+                    detail += f"  剩余 {int(eta)}s"
+            elif job.finished and total:
+                detail = f"{total/1024/1024:.1f}MB"
+            if speed_label.cget("text") != detail:
+                speed_label.configure(text=detail)
+
+            if job.finished and cancel_btn.cget("state") != "disabled":
+                cancel_btn.configure(state="disabled")
 
 if __name__ == "__main__":
     # Windows 下 PyInstaller 打包多进程应用必须调用此函数
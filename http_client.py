@@ -0,0 +1,197 @@
+import atexit
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+from metrics import RetryEvent
+
+
+class CircuitOpen(IOError):
+    """主机的熔断器处于打开状态，暂时不向它发请求"""
+
+
+class HttpStatusError(IOError):
+    """服务器返回了不可重试的状态码（如签名失效的 403），应换下一个候选地址"""
+
+
+def host_of(url):
+    return urlsplit(url).netloc.lower()
+
+
+class CircuitBreaker:
+    """
+    按主机熔断：连续失败 failure_threshold 次后打开，reset_timeout 秒内直接拒绝请求；
+    之后放行一个试探请求（半开），成功则关闭，失败则重新打开
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        # host -> [连续失败次数, 打开时间（None 为关闭）, 是否已放行试探请求]
+        self._hosts = {}
+
+    def allow(self, host):
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is None or state[1] is None:
+                return True
+            if time.monotonic() - state[1] < self.reset_timeout or state[2]:
+                return False
+            state[2] = True
+            return True
+
+    def is_open(self, host):
+        with self._lock:
+            state = self._hosts.get(host)
+            return state is not None and state[1] is not None and time.monotonic() - state[1] < self.reset_timeout
+
+    def record_success(self, host):
+        with self._lock:
+            self._hosts.pop(host, None)
+
+    def record_failure(self, host):
+        """记录一次失败，返回熔断器是否因此打开"""
+        with self._lock:
+            state = self._hosts.setdefault(host, [0, None, False])
+            state[0] += 1
+            if state[1] is not None:
+                # 半开状态的试探请求失败，重新计时
+                state[1] = time.monotonic()
+                state[2] = False
+                return False
+            if state[0] >= self.failure_threshold:
+                state[1] = time.monotonic()
+                state[2] = False
+                return True
+            return False
+
+
+class HttpClient:
+    """
+    进程内共享的下载 HTTP 客户端：每个 CDN 主机一个 requests.Session（保持长连接，连接数有上限），
+    请求带超时；连接错误、超时、5xx 和 429 按带抖动的指数退避重试，每个主机一个熔断器。
+    403/404 等直接返回给调用方，由调用方换下一个候选地址。
+    """
+
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, max_per_host=8, connect_timeout=5.0, read_timeout=20.0, retries=3, backoff=0.5,
+                 max_backoff=8.0, breaker=None, log_callback=None):
+        self.max_per_host = max_per_host
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.log_callback = log_callback
+        self._lock = threading.Lock()
+        self._sessions = {}
+
+    def log(self, message):
+        if self.log_callback:
+            self.log_callback(message)
+        else:
+            print(f"[HttpClient] {message}")
+
+    def session(self, host):
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                session = requests.Session()
+                # pool_block：连接数达到上限时等待空闲连接，而不是再开新连接
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_per_host, pool_block=True)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._sessions[host] = session
+            return session
+
+    def backoff_delay(self, attempt):
+        """第 attempt 次重试前的等待时间（full jitter：0 到指数上限之间均匀随机）"""
+        return random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+
+    def get(self, url, headers=None, stream=True, metrics=None, job_url=None, cancel_event=None, log=None):
+        """
+        带重试的 GET，返回 requests.Response（可能是 4xx，由调用方处理）；
+        重试用尽抛出 IOError，主机熔断时抛出 CircuitOpen。metrics/job_url 用于上报 RetryEvent，
+        log 为调用方的日志函数（共享客户端的日志应归到具体任务）
+        """
+        import requests
+
+        log = log or self.log
+        host = host_of(url)
+        attempt = 0
+        while True:
+            if not self.breaker.allow(host):
+                raise CircuitOpen(f"{host} 连续失败，暂停请求")
+            try:
+                response = self.session(host).get(url, headers=headers, stream=stream, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                reason = f"{type(e).__name__}: {e}"
+                response = None
+            except Exception:
+                # 其他异常（无效地址、重定向过多等）不重试，但也要记为失败：
+                # 半开状态的试探请求必须有结果，否则熔断器会一直拒绝这个主机
+                self.breaker.record_failure(host)
+                raise
+            else:
+                if response.status_code not in self.RETRY_STATUSES:
+                    self.breaker.record_success(host)
+                    return response
+                reason = f"状态码 {response.status_code}"
+                response.close()
+
+            if self.breaker.record_failure(host):
+                log(f"{host} 连续失败，熔断 {self.breaker.reset_timeout:.0f}s")
+            if attempt >= self.retries:
+                raise IOError(f"请求失败（已重试 {attempt} 次）: {reason}")
+            attempt += 1
+            delay = self.backoff_delay(attempt)
+            if metrics is not None:
+                metrics.emit(RetryEvent(url=job_url, what=host, attempt=attempt, reason=reason))
+            log(f"请求 {host} 失败（{reason}），{delay:.1f}s 后第 {attempt} 次重试")
+            if cancel_event is not None:
+                if cancel_event.wait(delay):
+                    raise IOError("请求已取消")
+            else:
+                time.sleep(delay)
+
+    def order_by_health(self, urls):
+        """把熔断中的主机的地址排到最后（保持原有顺序）"""
+        return sorted(urls, key=lambda url: self.breaker.is_open(host_of(url)))
+
+    def close(self):
+        with self._lock:
+            sessions, self._sessions = self._sessions, {}
+        for session in sessions.values():
+            session.close()
+
+
+_shared_client = None
+_shared_lock = threading.Lock()
+
+
+def get_http_client(**kwargs):
+    """
+    获取进程内共享的下载客户端（首次调用时按参数创建，之后忽略参数）
+    """
+    global _shared_client
+    with _shared_lock:
+        if _shared_client is None:
+            _shared_client = HttpClient(**kwargs)
+        return _shared_client
+
+
+def shutdown_http_client():
+    global _shared_client
+    with _shared_lock:
+        client, _shared_client = _shared_client, None
+    if client is not None:
+        client.close()
+
+
+atexit.register(shutdown_http_client)
@@ -0,0 +1,127 @@
+import threading
+
+
+class GuiJob:
+    """任务队列面板中的一个任务（一行）"""
+
+    def __init__(self, url, save_dir):
+        self.url = url
+        self.save_dir = save_dir
+        self.state = 'queued'
+        self.spider = None
+        # 下载进度由下载线程写入、主线程读取
+        self.downloaded = 0
+        self.total = 0
+        self.speed = 0.0
+        self._sample = None
+        # 该行的控件
+        self.widgets = None
+
+    @property
+    def finished(self):
+        return self.state not in JobQueue.PENDING_STATES
+
+    def update_progress(self, downloaded, total, ts):
+        """记录进度并用指数滑动平均估算速度（字节/秒）"""
+        if self._sample is not None:
+            last_ts, last_downloaded = self._sample
+            if ts > last_ts:
+                rate = (downloaded - last_downloaded) / (ts - last_ts)
+                self.speed = rate if not self.speed else 0.7 * self.speed + 0.3 * rate
+        self._sample = (ts, downloaded)
+        self.downloaded = downloaded
+        self.total = total
+
+    def eta(self):
+        if not self.speed or not self.total:
+            return None
+        return max(self.total - self.downloaded, 0) / self.speed
+
+
+class JobQueue:
+    """
+    GUI 的任务队列（不依赖界面）：所有任务按提交顺序排列，同时运行的任务数不超过 max_parallel。
+
+    调度（add/dispatch/finish/cancel）在界面主线程中调用；start_job(job) 由界面提供，负责创建爬虫并提交，
+    成功后把任务置为 running。下载线程只通过 progress() 更新进度，读写任务状态都要持有 lock
+    """
+
+    PENDING_STATES = ('queued', 'running', 'downloading', 'cancelling')
+    ACTIVE_STATES = ('running', 'downloading', 'cancelling')
+
+    def __init__(self, start_job, max_parallel=1):
+        self.start_job = start_job
+        self.max_parallel = max_parallel
+        self.jobs = []
+        self.lock = threading.Lock()
+        self._by_url = {}
+
+    def add(self, url, save_dir):
+        """加入一个链接，同一链接还没结束时返回 None"""
+        with self.lock:
+            existing = self._by_url.get(url)
+            if existing is not None and not existing.finished:
+                return None
+            job = GuiJob(url, save_dir)
+            self.jobs.append(job)
+            self._by_url[url] = job
+        return job
+
+    def dispatch(self):
+        """按 max_parallel 启动排队中的任务"""
+        with self.lock:
+            running = sum(1 for job in self.jobs if job.state in self.ACTIVE_STATES)
+            queued = [job for job in self.jobs if job.state == 'queued']
+        for job in queued:
+            if running >= self.max_parallel:
+                break
+            self.start_job(job)
+            if job.state in self.ACTIVE_STATES:
+                running += 1
+
+    def progress(self, url, downloaded, total, ts):
+        """下载线程上报进度，返回对应的任务（不在队列中时返回 None）"""
+        with self.lock:
+            job = self._by_url.get(url)
+            if job is None:
+                return None
+            job.update_progress(downloaded, total, ts)
+            if job.state == 'running':
+                job.state = 'downloading'
+        return job
+
+    def find(self, url):
+        with self.lock:
+            return self._by_url.get(url)
+
+    def finish(self, job, status):
+        """任务结束，空出的名额交给排队中的任务"""
+        with self.lock:
+            job.state = status
+            job.speed = 0.0
+        self.dispatch()
+
+    def cancel(self, job):
+        """
+        取消任务：排队中的直接取消，运行中的通知爬虫停止（结束后由 finish() 更新状态）。
+        返回 True 表示已通知运行中的爬虫
+        """
+        with self.lock:
+            if job.state == 'queued':
+                job.state = 'cancelled'
+                return False
+            if job.finished:
+                return False
+            job.state = 'cancelling'
+        job.spider.cancel()
+        return True
+
+    def clear_finished(self):
+        """移出已结束的任务，返回被移出的任务"""
+        with self.lock:
+            finished = [job for job in self.jobs if job.finished]
+            self.jobs = [job for job in self.jobs if not job.finished]
+            for job in finished:
+                if self._by_url.get(job.url) is job:
+                    del self._by_url[job.url]
+        return finished
@@ -0,0 +1,202 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# 任务结束后不会再变化的状态
+FINAL_STATUSES = ('downloaded', 'skipped', 'failed', 'no_video', 'browser_error', 'cancelled')
+
+
+class JobStore:
+    """
+    持久化任务队列（SQLite）：服务重启后排队中的任务继续执行。
+
+    取任务用租约：claim() 把任务标记为 running 并记录租约到期时间，执行期间定期 renew()，
+    持有者崩溃后租约过期，任务会被其他持有者（或重启后的自己）重新取走。
+    多个进程可以共用同一个数据库文件。
+    """
+
+    def __init__(self, path=os.path.join("cache", "jobs.db"), max_attempts=3):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.path = path
+        # 租约过期被重新取走的次数上限，超过后任务标记为失败（避免反复让进程崩溃的链接）
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        # 自动提交模式，需要原子操作的地方显式 BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, url TEXT NOT NULL, save_dir TEXT NOT NULL, "
+            "status TEXT NOT NULL, result TEXT, attempts INTEGER NOT NULL DEFAULT 0, "
+            "cancel_requested INTEGER NOT NULL DEFAULT 0, lease_owner TEXT, lease_expires REAL, "
+            "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id)")
+
+    def add(self, url, save_dir):
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO jobs (url, save_dir, status, created_at, updated_at) VALUES (?, ?, 'queued', ?, ?)",
+                (url, save_dir, now, now)
+            )
+            job_id = cursor.lastrowid
+        return self.get(job_id)
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute(f"SELECT {self._COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_dict(row)
+
+    def list(self, status=None, limit=100):
+        """按提交顺序列出任务，status 可以是单个状态或状态列表"""
+        if isinstance(status, str):
+            status = [status]
+        with self._lock:
+            if status:
+                marks = ",".join("?" * len(status))
+                rows = self._conn.execute(
+                    f"SELECT {self._COLUMNS} FROM jobs WHERE status IN ({marks}) ORDER BY id LIMIT ?",
+                    (*status, limit)
+                ).fetchall()
+            else:
+                rows = self._conn.execute(f"SELECT {self._COLUMNS} FROM jobs ORDER BY id DESC LIMIT ?",
+                                          (limit,)).fetchall()
+                rows.reverse()
+        return [self._row_to_dict(row) for row in rows]
+
+    def counts(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+    def has_pending(self):
+        """是否还有可以取走的任务（排队中或租约已过期）"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM jobs WHERE status = 'queued' OR (status = 'running' AND lease_expires < ?) LIMIT 1",
+                (time.time(),)
+            ).fetchone()
+        return row is not None
+
+    def claim(self, owner, lease_seconds=60):
+        """
+        取出下一个排队中的任务（或租约已过期的任务），没有返回 None
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # 租约过期次数过多的任务直接判为失败
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'failed', result = ?, lease_owner = NULL, updated_at = ? "
+                    "WHERE status = 'running' AND lease_expires < ? AND attempts >= ?",
+                    (json.dumps({'status': 'failed', 'error': "执行进程多次中断"}, ensure_ascii=False), now, now,
+                     self.max_attempts)
+                )
+                row = self._conn.execute(
+                    f"SELECT {self._COLUMNS} FROM jobs WHERE status = 'queued' "
+                    "OR (status = 'running' AND lease_expires < ?) ORDER BY id LIMIT 1",
+                    (now,)
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'running', lease_owner = ?, lease_expires = ?, "
+                    "attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                    (owner, now + lease_seconds, now, row[0])
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self.get(row[0])
+
+    def renew(self, job_id, owner, lease_seconds=60):
+        """
+        续租，返回任务是否已被请求取消；租约已不属于 owner 时返回 None
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE id = ? AND status = 'running' AND lease_owner = ?",
+                (time.time() + lease_seconds, job_id, owner)
+            )
+            if cursor.rowcount == 0:
+                return None
+            row = self._conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row[0])
+
+    def finish(self, job_id, status, result=None, owner=None):
+        """记录任务结果；指定 owner 时只有租约持有者能写入（过期后被别人取走的任务不会被覆盖）"""
+        sql = "UPDATE jobs SET status = ?, result = ?, lease_owner = NULL, lease_expires = NULL, updated_at = ? WHERE id = ?"
+        params = [status, json.dumps(result, ensure_ascii=False) if result is not None else None, time.time(), job_id]
+        if owner is not None:
+            sql += " AND lease_owner = ?"
+            params.append(owner)
+        with self._lock:
+            cursor = self._conn.execute(sql, params)
+        return cursor.rowcount > 0
+
+    def request_cancel(self, job_id):
+        """
+        请求取消：排队中的任务直接取消，执行中的任务由持有者在续租时发现后取消。返回最新的任务
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'cancelled', updated_at = ? WHERE id = ? AND status = 'queued'", (now, job_id)
+            )
+            self._conn.execute(
+                "UPDATE jobs SET cancel_requested = 1, updated_at = ? WHERE id = ? AND status = 'running'", (now, job_id)
+            )
+        return self.get(job_id)
+
+    def requeue_owner(self, owner, crashed=False):
+        """
+        把某个持有者名下执行中的任务放回队列（该持有者确定已经退出时使用）。
+        正常停止（crashed=False）不计入尝试次数；进程崩溃时已达到 max_attempts 的任务判为失败
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if crashed:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'failed', result = ?, lease_owner = NULL, lease_expires = NULL, "
+                        "updated_at = ? WHERE status = 'running' AND lease_owner = ? AND attempts >= ?",
+                        (json.dumps({'status': 'failed', 'error': "执行进程多次中断"}, ensure_ascii=False), now, owner,
+                         self.max_attempts)
+                    )
+                cursor = self._conn.execute(
+                    "UPDATE jobs SET status = 'queued', lease_owner = NULL, lease_expires = NULL, updated_at = ?, "
+                    "attempts = attempts - ? WHERE status = 'running' AND lease_owner = ?",
+                    (now, 0 if crashed else 1, owner)
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return cursor.rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    _COLUMNS = ("id, url, save_dir, status, result, attempts, cancel_requested, lease_owner, lease_expires, "
+                "created_at, updated_at")
+
+    @staticmethod
+    def _row_to_dict(row):
+        if row is None:
+            return None
+        return {
+            'id': row[0], 'url': row[1], 'save_dir': row[2], 'status': row[3],
+            'result': json.loads(row[4]) if row[4] else None, 'attempts': row[5],
+            'cancel_requested': bool(row[6]), 'lease_owner': row[7], 'lease_expires': row[8],
+            'created_at': row[9], 'updated_at': row[10],
+        }
@@ -0,0 +1,183 @@
+import hashlib
+import json
+import os
+import struct
+import threading
+import time
+
+# 分块内容哈希：sha256(sha256(块0) + sha256(块1) + ...)，每块 1MB。
+# 各块可以独立计算，分段下载时每一段边下载边算，不需要下载完再按顺序读一遍文件
+BLOCK_SIZE = 1024 * 1024
+BLOCK_HASH_PREFIX = "b1m:"
+
+
+class VerificationError(IOError):
+    """下载的数据未通过校验（长度不符、不是 MP4、结构不完整、时长不符等）"""
+
+
+class BlockHasher:
+    """
+    按偏移量接收数据的分块哈希。每块的数据需从块起点开始按顺序到达（分段按块对齐时自然满足），
+    没能完整流过的块（如断点续传前已写入的部分）在 hexdigest() 时通过 read_block 补算
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # 块序号 -> [hashlib 对象, 已接收字节数]，None 表示数据没有按顺序到达
+        self._blocks = {}
+        self.reread_blocks = 0
+
+    def update(self, offset, data):
+        view = memoryview(data)
+        while view:
+            index, pos = divmod(offset, BLOCK_SIZE)
+            n = min(len(view), BLOCK_SIZE - pos)
+            with self._lock:
+                state = self._blocks.get(index)
+                if state is None and pos == 0 and index not in self._blocks:
+                    state = self._blocks[index] = [hashlib.sha256(), 0]
+                if state is not None and state[1] == pos:
+                    state[0].update(view[:n])
+                    state[1] += n
+                else:
+                    self._blocks[index] = None
+            offset += n
+            view = view[n:]
+
+    def hexdigest(self, total, read_block=None):
+        digests = []
+        for index in range((total + BLOCK_SIZE - 1) // BLOCK_SIZE):
+            expected = min(BLOCK_SIZE, total - index * BLOCK_SIZE)
+            state = self._blocks.get(index)
+            if state is not None and state[1] == expected:
+                digests.append(state[0].digest())
+            else:
+                if read_block is None:
+                    raise VerificationError(f"第 {index} 块数据不完整")
+                self.reread_blocks += 1
+                digests.append(hashlib.sha256(read_block(index)).digest())
+        return BLOCK_HASH_PREFIX + hashlib.sha256(b"".join(digests)).hexdigest()
+
+
+def block_hash(data):
+    """整段数据的分块哈希"""
+    hasher = BlockHasher()
+    hasher.update(0, data)
+    return hasher.hexdigest(len(data))
+
+
+def file_block_hash(path):
+    hasher = BlockHasher()
+    with open(path, 'rb') as f:
+        offset = 0
+        for chunk in iter(lambda: f.read(BLOCK_SIZE), b''):
+            hasher.update(offset, chunk)
+            offset += len(chunk)
+    return hasher.hexdigest(offset)
+
+
+def check_mp4_head(data):
+    """
+    流式检查：文件开头必须是 ftyp 盒子，否则不是 MP4（常见的是 200 状态码返回的错误页面）
+    """
+    if len(data) >= 8 and data[4:8] != b'ftyp':
+        raise VerificationError(f"不是 MP4 文件（开头为 {bytes(data[:16])!r}）")
+
+
+def scan_mp4(path):
+    """
+    只读取顶层盒子的头部和 mvhd，检查 MP4 结构：以 ftyp 开头、包含 moov 和 mdat、
+    各盒子正好铺满整个文件（被截断的文件最后一个盒子会超出文件末尾）。
+    返回 {'boxes': [顶层盒子类型], 'duration': 秒}，不通过时抛出 VerificationError
+    """
+    size = os.path.getsize(path)
+    boxes = []
+    duration = None
+    with open(path, 'rb') as f:
+        offset = 0
+        while offset < size:
+            f.seek(offset)
+            box_type, box_size, header = _read_box_header(f, size - offset)
+            if box_size is None:
+                box_size = size - offset
+            if box_size < header:
+                raise VerificationError(f"偏移 {offset} 处的盒子大小无效: {box_size}")
+            if offset + box_size > size:
+                raise VerificationError(f"{box_type} 盒子超出文件末尾 {offset + box_size - size} 字节，文件被截断")
+            boxes.append(box_type)
+            if box_type == 'moov':
+                duration = _moov_duration(f, offset + header, offset + box_size)
+            offset += box_size
+
+    if not boxes or boxes[0] != 'ftyp':
+        raise VerificationError("不是 MP4 文件（缺少 ftyp）")
+    for required in ('moov', 'mdat'):
+        if required not in boxes:
+            raise VerificationError(f"缺少 {required} 盒子")
+    if not duration:
+        raise VerificationError("无法读取视频时长（mvhd）")
+    return {'boxes': boxes, 'duration': duration}
+
+
+def _read_box_header(f, remaining):
+    """返回 (类型, 大小, 头部长度)；大小为 None 表示盒子一直延伸到文件末尾"""
+    data = f.read(8)
+    if len(data) < 8 or remaining < 8:
+        raise VerificationError("盒子头部不完整，文件被截断")
+    box_size, box_type = struct.unpack('>I4s', data)
+    box_type = box_type.decode('latin-1')
+    if box_size == 1:
+        large = f.read(8)
+        if len(large) < 8:
+            raise VerificationError("盒子头部不完整，文件被截断")
+        return box_type, struct.unpack('>Q', large)[0], 16
+    if box_size == 0:
+        return box_type, None, 8
+    return box_type, box_size, 8
+
+
+def _moov_duration(f, start, end):
+    offset = start
+    while offset + 8 <= end:
+        f.seek(offset)
+        box_type, box_size, header = _read_box_header(f, end - offset)
+        box_size = box_size or end - offset
+        if box_size < header:
+            break
+        if box_type == 'mvhd':
+            payload = f.read(min(box_size - header, 32))
+            version = payload[0] if payload else 0
+            if version == 1 and len(payload) >= 32:
+                timescale, duration = struct.unpack('>IQ', payload[20:32])
+            elif len(payload) >= 20:
+                timescale, duration = struct.unpack('>II', payload[12:20])
+            else:
+                return None
+            return duration / timescale if timescale else None
+        offset += box_size
+    return None
+
+
+class VerifyManifest:
+    """
+    校验结果清单（JSONL）：每次下载尝试一行，包括候选地址、大小、哈希、时长、盒子结构和失败原因
+    """
+
+    def __init__(self, path=os.path.join("cache", "download_manifest.jsonl")):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def append(self, entry):
+        line = json.dumps(dict(entry, ts=time.time()), ensure_ascii=False)
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + "\n")
+
+    def read(self):
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
@@ -0,0 +1,316 @@
+import json
+import threading
+import time
+from dataclasses import asdict, dataclass, field, fields
+
+
+@dataclass
+class Event:
+    """所有事件的基类，ts 为 Unix 时间戳，url 为所属任务的分享链接"""
+    url: str = None
+    ts: float = field(default_factory=time.time)
+
+    type = "event"
+
+    def to_dict(self):
+        data = asdict(self)
+        data['type'] = self.type
+        return data
+
+
+@dataclass
+class LogEvent(Event):
+    message: str = ""
+
+    type = "log"
+
+
+@dataclass
+class PhaseEvent(Event):
+    """一个阶段的耗时（秒），phase 如 browser_launch / goto / wait_selector / settle / resolve / download"""
+    phase: str = ""
+    duration: float = 0.0
+
+    type = "phase"
+
+
+@dataclass
+class CandidateEvent(Event):
+    """捕获到的视频流候选，accepted 为 False 表示被当作广告/小文件忽略"""
+    candidate_url: str = ""
+    size: int = 0
+    accepted: bool = True
+    source: str = ""
+
+    type = "candidate"
+
+
+@dataclass
+class DownloadProgressEvent(Event):
+    path: str = ""
+    downloaded: int = 0
+    total: int = 0
+
+    type = "download_progress"
+
+
+@dataclass
+class DownloadEvent(Event):
+    """一次下载结束（成功或失败），mbps 为平均速度 MB/s"""
+    path: str = ""
+    bytes: int = 0
+    duration: float = 0.0
+    mbps: float = 0.0
+    mode: str = ""
+    ok: bool = True
+
+    type = "download"
+
+
+@dataclass
+class RetryEvent(Event):
+    what: str = ""
+    attempt: int = 0
+    reason: str = ""
+
+    type = "retry"
+
+
+@dataclass
+class VerifyEvent(Event):
+    """下载文件的校验结果，reason 为失败原因，duration 为 MP4 时长（秒）"""
+    path: str = ""
+    candidate_url: str = ""
+    ok: bool = True
+    reason: str = ""
+    duration: float = 0.0
+
+    type = "verify"
+
+
+@dataclass
+class PageLoadEvent(Event):
+    """一次页面租用期间的请求统计（持久化浏览器配置时上报），cache_bytes 为由 HTTP 缓存提供的字节数"""
+    requests: int = 0
+    cached_requests: int = 0
+    network_bytes: int = 0
+    cache_bytes: int = 0
+
+    type = "page_load"
+
+
+@dataclass
+class JobEvent(Event):
+    """任务结束，result 同 DouyinSpider.run() 的返回值"""
+    status: str = ""
+    result: dict = None
+
+    type = "job"
+
+
+EVENT_TYPES = {cls.type: cls for cls in (LogEvent, PhaseEvent, CandidateEvent, DownloadProgressEvent, DownloadEvent,
+                                        RetryEvent, VerifyEvent, PageLoadEvent, JobEvent)}
+
+
+def event_from_dict(data):
+    """
+    把 to_dict() 的结果还原为事件对象（例如从子进程传回的事件）
+    """
+    cls = EVENT_TYPES.get(data.get('type'), Event)
+    return cls(**{f.name: data[f.name] for f in fields(cls) if f.name in data})
+
+
+class MetricsBus:
+    """
+    事件总线：emit() 把事件同步分发给所有订阅者，再转发给 parent（如果有）。
+
+    每个 DouyinSpider 有自己的总线（订阅者是它的 log_callback），parent 指向调用方共享的总线，
+    共享总线上可以挂 JsonlSink、SummaryCollector 等消费者。
+    """
+
+    def __init__(self, parent=None):
+        self.parent = parent
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback):
+        with self._lock:
+            self._subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    def emit(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(event)
+            except Exception:
+                # 消费者出错不能影响爬虫本身
+                pass
+        if self.parent is not None:
+            self.parent.emit(event)
+
+    def phase(self, name, url=None):
+        """计时上下文：with bus.phase("goto", url): ..."""
+        return _PhaseTimer(self, name, url)
+
+
+class _PhaseTimer:
+    def __init__(self, bus, name, url):
+        self.bus = bus
+        self.name = name
+        self.url = url
+        self.started = None
+
+    def __enter__(self):
+        self.started = time.monotonic()
+        return self
+
+    def __exit__(self, *exc):
+        self.bus.emit(PhaseEvent(url=self.url, phase=self.name, duration=time.monotonic() - self.started))
+
+
+class LogSink:
+    """把 LogEvent 转给原来的 log_callback（未设置时打印到控制台）"""
+
+    def __init__(self, log_callback=None, prefix="[Spider]"):
+        self.log_callback = log_callback
+        self.prefix = prefix
+
+    def __call__(self, event):
+        if not isinstance(event, LogEvent):
+            return
+        if self.log_callback:
+            self.log_callback(event.message)
+        else:
+            print(f"{self.prefix} {event.message}")
+
+
+class JsonlSink:
+    """把事件逐行写入 JSONL 文件（默认不写进度事件，避免文件过大）"""
+
+    def __init__(self, path, include_progress=False):
+        self.include_progress = include_progress
+        self._file = open(path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        if isinstance(event, DownloadProgressEvent) and not self.include_progress:
+            return
+        line = json.dumps(event.to_dict(), ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class SummaryCollector:
+    """
+    汇总一批任务的指标：各阶段耗时直方图、候选数量、下载字节与速度、重试次数、校验结果、页面缓存命中、任务状态
+    """
+
+    BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.phases = {}
+        self.candidates = {'accepted': 0, 'ignored': 0}
+        self.downloads = []
+        self.retries = 0
+        self.verify = {'ok': 0, 'failed': 0}
+        self.page_loads = {'pages': 0, 'requests': 0, 'cached_requests': 0, 'network_bytes': 0, 'cache_bytes': 0}
+        self.statuses = {}
+
+    def __call__(self, event):
+        with self._lock:
+            if isinstance(event, PhaseEvent):
+                self.phases.setdefault(event.phase, []).append(event.duration)
+            elif isinstance(event, CandidateEvent):
+                self.candidates['accepted' if event.accepted else 'ignored'] += 1
+            elif isinstance(event, DownloadEvent):
+                if event.ok:
+                    self.downloads.append(event)
+            elif isinstance(event, RetryEvent):
+                self.retries += 1
+            elif isinstance(event, VerifyEvent):
+                self.verify['ok' if event.ok else 'failed'] += 1
+            elif isinstance(event, PageLoadEvent):
+                self.page_loads['pages'] += 1
+                for key in ('requests', 'cached_requests', 'network_bytes', 'cache_bytes'):
+                    self.page_loads[key] += getattr(event, key)
+            elif isinstance(event, JobEvent):
+                self.statuses[event.status] = self.statuses.get(event.status, 0) + 1
+
+    def summary(self):
+        with self._lock:
+            phases = {name: self._describe(values) for name, values in self.phases.items()}
+            total_bytes = sum(d.bytes for d in self.downloads)
+            speeds = [d.mbps for d in self.downloads]
+            return {
+                'phases': phases,
+                'candidates': dict(self.candidates),
+                'downloads': {
+                    'count': len(self.downloads),
+                    'bytes': total_bytes,
+                    'mbps': self._describe(speeds) if speeds else None,
+                },
+                'retries': self.retries,
+                'verify': dict(self.verify),
+                'page_loads': dict(self.page_loads),
+                'jobs': dict(self.statuses),
+            }
+
+    def format_summary(self):
+        data = self.summary()
+        lines = ["阶段耗时 (秒):"]
+        for name, d in sorted(data['phases'].items()):
+            histogram = " ".join(f"<={b}:{n}" for b, n in d['histogram'].items() if n)
+            lines.append(f"  {name:<14} n={d['count']:<5} p50={d['p50']:.2f} p90={d['p90']:.2f} max={d['max']:.2f}  {histogram}")
+        lines.append(f"候选视频: 采用 {data['candidates']['accepted']} 个，忽略 {data['candidates']['ignored']} 个")
+        downloads = data['downloads']
+        if downloads['mbps']:
+            lines.append(f"下载: {downloads['count']} 个，共 {downloads['bytes']/1024/1024:.2f}MB，"
+                         f"速度 p50={downloads['mbps']['p50']:.2f}MB/s max={downloads['mbps']['max']:.2f}MB/s")
+        lines.append(f"重试: {data['retries']} 次")
+        verify = data['verify']
+        if verify['ok'] or verify['failed']:
+            lines.append(f"校验: 通过 {verify['ok']} 个，未通过 {verify['failed']} 个")
+        loads = data['page_loads']
+        if loads['pages']:
+            lines.append(f"页面资源: {loads['pages']} 次加载，网络 {loads['network_bytes']/1024/1024:.2f}MB，"
+                         f"缓存 {loads['cache_bytes']/1024/1024:.2f}MB（{loads['cached_requests']}/{loads['requests']} 个请求命中）")
+        lines.append("任务状态: " + ", ".join(f"{k}={v}" for k, v in sorted(data['jobs'].items())))
+        return "\n".join(lines)
+
+    def _describe(self, values):
+        values = sorted(values)
+        histogram = {}
+        for bucket in self.BUCKETS:
+            histogram[str(bucket)] = 0
+        histogram['inf'] = 0
+        for v in values:
+            for bucket in self.BUCKETS:
+                if v <= bucket:
+                    histogram[str(bucket)] += 1
+                    break
+            else:
+                histogram['inf'] += 1
+        return {
+            'count': len(values),
+            'p50': self._percentile(values, 0.5),
+            'p90': self._percentile(values, 0.9),
+            'max': values[-1],
+            'histogram': histogram,
+        }
+
+    @staticmethod
+    def _percentile(values, q):
+        return values[min(int(len(values) * q), len(values) - 1)]
@@ -0,0 +1,456 @@
+import asyncio
+import json
+import os
+import queue
+import re
+import threading
+import time
+from urllib.parse import parse_qs, urlencode, urlsplit, urlunsplit
+
+from metrics import MetricsBus, LogSink, LogEvent
+from share_resolver import extract_play_candidates, video_duration
+
+# 主页作品列表（按发布时间倒序，游标参数 max_cursor）和合集列表（按集数正序，游标参数 cursor）
+SOURCE_KINDS = {
+    'user': {'page_re': re.compile(r'/user/([\w-]+)'),
+             'api_re': re.compile(r'/aweme/v\d+/web/aweme/post/'),
+             'cursor_param': 'max_cursor', 'order': 'desc'},
+    'mix': {'page_re': re.compile(r'/(?:collection|mix/detail)/(\d+)'),
+            'api_re': re.compile(r'/aweme/v\d+/web/mix/aweme/'),
+            'cursor_param': 'cursor', 'order': 'asc'},
+}
+
+# 在页面里重放列表请求（带上页面的 cookie），返回响应文本
+FETCH_JS = """async (url) => {
+    const response = await fetch(url, {credentials: 'include'});
+    return await response.text();
+}"""
+
+
+def parse_source(url):
+    """
+    识别主页/合集地址，返回 (类型, id)，不是则返回 None（短链需要跳转后再识别）
+    """
+    for kind, spec in SOURCE_KINDS.items():
+        m = spec['page_re'].search(urlsplit(url or '').path)
+        if m:
+            return kind, m.group(1)
+    return None
+
+
+def parse_list_response(data):
+    """
+    解析作品/合集列表接口的响应，返回 {'items', 'cursor', 'has_more'}，格式不对返回 None
+    """
+    if not isinstance(data, dict) or not isinstance(data.get('aweme_list', []), list):
+        return None
+    if 'aweme_list' not in data and data.get('status_code') not in (None, 0):
+        return None
+    cursor = data.get('max_cursor', data.get('cursor'))
+    return {'items': data.get('aweme_list') or [], 'cursor': int(cursor or 0), 'has_more': bool(data.get('has_more'))}
+
+
+def with_cursor(url, param, cursor):
+    """把列表请求地址中的游标参数替换为 cursor"""
+    parts = urlsplit(url)
+    query = parse_qs(parts.query, keep_blank_values=True)
+    query[param] = [str(cursor)]
+    return urlunsplit(parts._replace(query=urlencode(query, doseq=True)))
+
+
+class CrawlCheckpoint:
+    """
+    抓取断点（JSON 文件）：每个主页/合集一条记录
+        newest   已抓取过的最新作品发布时间，之后只抓比它新的
+        cursor   历史作品抓到哪一页（中途退出时从这里继续）
+        done     历史作品是否已全部抓完
+        count    累计交给下载的作品数
+        retry    下载失败的作品 video_id -> {'url', 'title', 'create_time', 'duration', 'attempts'}，下次抓取时重新交出
+    """
+
+    def __init__(self, path=os.path.join("cache", "crawl_checkpoints.json")):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self._entries = json.load(f)
+            except Exception:
+                self._entries = {}
+
+    def get(self, key):
+        with self._lock:
+            return dict(self._entries.get(key) or {})
+
+    def put(self, key, entry):
+        with self._lock:
+            self._entries[key] = dict(entry, updated_at=time.time())
+            self._save()
+
+    def _save(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._entries, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+
+
+class CrawlProgress:
+    """
+    一次抓取的分页进度：判断每页里哪些作品需要下载、下一页从哪个游标取，以及该页处理完后的断点。
+
+    倒序列表（主页）：先从第一页往后翻，遇到不比 newest 新的作品（置顶作品除外）说明新作品已经抓完，
+    再跳到 cursor 继续上次没抓完的历史作品。第一次抓取时整个列表都是历史作品。
+    正序列表（合集）：新内容在末尾，直接从上次的 cursor 继续。
+    """
+
+    def __init__(self, entry, order='desc'):
+        self.entry = dict(entry or {})
+        self.entry.setdefault('count', 0)
+        self.order = order
+        if order == 'asc':
+            self.in_head = False
+            self.start_cursor = self.entry.get('cursor') or 0
+        else:
+            # 有 newest 时先抓列表头部的新作品
+            self.in_head = bool(self.entry.get('newest'))
+            self.start_cursor = 0
+        self._run_newest = self.entry.get('newest') or 0
+
+    def accept(self, page):
+        """
+        处理一页列表，返回 (需要下载的作品, 下一页游标, 该页处理完后的断点)；下一页游标为 None 表示结束
+        """
+        newest = self.entry.get('newest') or 0
+        items = []
+        reached_known = False
+        for aweme in page['items']:
+            create_time = int(aweme.get('create_time') or 0)
+            pinned = bool(aweme.get('is_top'))
+            if self.in_head and create_time <= newest:
+                # 置顶的旧作品排在最前面，不能作为新作品已抓完的依据
+                if not pinned:
+                    reached_known = True
+                continue
+            items.append(aweme)
+            if not pinned and self.order == 'desc' and (self.in_head or not newest):
+                self._run_newest = max(self._run_newest, create_time)
+        self.entry['count'] += len(items)
+
+        if self.order == 'asc':
+            self.entry['cursor'] = page['cursor']
+            self.entry['done'] = not page['has_more']
+            next_cursor = page['cursor'] if page['has_more'] else None
+        elif self.in_head:
+            next_cursor = page['cursor']
+            if reached_known or not page['has_more']:
+                # 新作品抓完，更新 newest；历史作品没抓完时跳到上次的位置继续
+                self.in_head = False
+                self.entry['newest'] = self._run_newest
+                if not page['has_more']:
+                    self.entry.update(cursor=None, done=True)
+                next_cursor = self.entry.get('cursor') if not self.entry.get('done') else None
+        else:
+            if not newest:
+                self.entry['newest'] = self._run_newest
+            self.entry['cursor'] = page['cursor'] if page['has_more'] else None
+            self.entry['done'] = not page['has_more']
+            next_cursor = self.entry['cursor']
+        return items, next_cursor, dict(self.entry)
+
+
+class ProfileCrawler:
+    """
+    主页/合集抓取：在浏览器中打开页面，截获页面自己的列表接口响应，按游标逐页取作品，
+    以生成器的形式逐个交出作品（含播放地址），调用方可以边翻页边下载。
+
+    翻页优先在页面里重放列表请求（可直接跳到断点游标），失败时滚动页面让页面自己加载下一页。
+    消费方跟不上时翻页暂停（缓冲区 buffer_size 个作品）。
+
+    消费方处理完每个作品后要调用 done(item, ok)：断点只在一页的作品全部处理完后才保存，
+    中途退出时没处理完的页下次重新抓取；处理失败的作品记在断点的 retry 中，下次抓取时先重新交出
+    （不带播放地址，签名地址可能已过期，由调用方重新解析），连续失败 max_retries 次后放弃。
+    """
+
+    def __init__(self, url, pool=None, checkpoint=None, headless=True, max_items=None, restart=False,
+                 page_timeout=15.0, buffer_size=20, log_callback=None, metrics=None, max_retries=3):
+        self.url = url
+        # 可选的共享浏览器池，不传则临时启动一个（只占用一个页面）
+        self.pool = pool
+        self.headless = headless
+        self.checkpoint = checkpoint if checkpoint is not None else CrawlCheckpoint()
+        # 本次最多交出的作品数，None 为不限
+        self.max_items = max_items
+        # 忽略已保存的断点从头抓取（抓完后覆盖断点）
+        self.restart = restart
+        self.page_timeout = page_timeout
+        self.buffer_size = buffer_size
+        self.max_retries = max_retries
+        self.log_callback = log_callback
+        self.metrics = MetricsBus(parent=metrics)
+        self.metrics.subscribe(LogSink(log_callback))
+
+        self.source = parse_source(url)
+        self._items = None
+        self._stop = threading.Event()
+        self._captured = {}
+        self._captured_event = None
+        self._template = None
+        # 消费方一侧的断点状态（见 done()）
+        self._lock = threading.Lock()
+        self._retry = {}
+        self._outstanding = {}
+        self._checkpoints = []
+        self._page = 0
+
+    def log(self, message):
+        self.metrics.emit(LogEvent(url=self.url, message=message))
+
+    @property
+    def key(self):
+        return f"{self.source[0]}:{self.source[1]}" if self.source else None
+
+    def crawl(self):
+        """
+        生成器：逐个交出 {'video_id', 'url', 'title', 'create_time', 'duration', 'candidates'}，
+        上次失败重新交出的作品 candidates 为空。每个作品处理完后调用 done()
+        """
+        from browser_pool import BrowserPool
+
+        pool = self.pool
+        own_pool = pool is None
+        if own_pool:
+            pool = BrowserPool(size=1, headless=self.headless, log_callback=self.log_callback, metrics=self.metrics)
+        self._items = queue.Queue(maxsize=self.buffer_size)
+        self._stop.clear()
+        with self._lock:
+            self._retry, self._outstanding, self._checkpoints, self._page = {}, {}, [], 0
+        future = pool.submit(pool.run_leased(self._crawl))
+        yielded = 0
+        try:
+            while True:
+                try:
+                    item = self._items.get(timeout=0.5)
+                except queue.Empty:
+                    if future.done():
+                        break
+                    continue
+                kind, value = item
+                if kind == 'end':
+                    break
+                if kind == 'retry':
+                    with self._lock:
+                        self._retry = dict(value)
+                    continue
+                if kind == 'checkpoint':
+                    # 这一页的作品都已经被取走，等它们都处理完再保存
+                    with self._lock:
+                        self._checkpoints.append((self._page, value))
+                        self._page += 1
+                    self._flush()
+                    continue
+                with self._lock:
+                    self._outstanding[value['video_id']] = self._page
+                yield value
+                yielded += 1
+                if self.max_items and yielded >= self.max_items:
+                    self.log(f"已达到本次抓取上限 {self.max_items} 个作品")
+                    break
+        finally:
+            self._stop.set()
+            try:
+                future.result(timeout=self.page_timeout + 30)
+            except Exception as e:
+                self.log(f"抓取出错: {e}")
+            if own_pool:
+                pool.close()
+
+    def done(self, item, ok):
+        """
+        消费方报告一个作品处理完毕（ok 为是否下载成功或已存在），可在任意线程调用
+        """
+        video_id = item['video_id']
+        with self._lock:
+            self._outstanding.pop(video_id, None)
+            if ok:
+                self._retry.pop(video_id, None)
+            else:
+                entry = self._retry.get(video_id) or {
+                    'url': item['url'], 'title': item.get('title'), 'create_time': item.get('create_time'),
+                    'duration': item.get('duration'), 'attempts': 0,
+                }
+                entry['attempts'] += 1
+                if entry['attempts'] >= self.max_retries:
+                    self._retry.pop(video_id, None)
+                    self.log(f"作品 {video_id} 已连续失败 {entry['attempts']} 次，不再重试")
+                else:
+                    self._retry[video_id] = entry
+        self._flush()
+
+    def _flush(self):
+        """保存所有作品都已处理完的页的断点（按页顺序）"""
+        with self._lock:
+            while self._checkpoints:
+                page, snapshot = self._checkpoints[0]
+                if any(p <= page for p in self._outstanding.values()):
+                    break
+                self._checkpoints.pop(0)
+                self.checkpoint.put(self.key, dict(snapshot, retry=dict(self._retry)))
+
+    def _put(self, item):
+        # 在线程里阻塞等待缓冲区空位（背压），调用方停止迭代后放弃
+        while not self._stop.is_set():
+            try:
+                self._items.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    async def _crawl(self, page):
+        self._captured = {}
+        self._captured_event = asyncio.Event()
+        self._template = None
+        page.on("response", self._handle_list_response)
+        try:
+            self.log(f"正在打开: {self.url}")
+            try:
+                await page.goto(self.url, timeout=60000)
+            except Exception as e:
+                self.log(f"页面加载超时或出错: {e}")
+            if self.source is None:
+                # 短链跳转后才能识别是主页还是合集
+                self.source = parse_source(page.url)
+            if self.source is None:
+                self.log(f"不是用户主页或合集页面: {page.url}")
+                return
+            spec = SOURCE_KINDS[self.source[0]]
+            progress = CrawlProgress({} if self.restart else self.checkpoint.get(self.key), spec['order'])
+            entry = progress.entry
+            if entry.get('newest') or entry.get('cursor'):
+                self.log(f"从断点继续: 已抓取 {entry['count']} 个作品"
+                         + ("，历史作品已抓完，只抓新作品" if entry.get('done') else ""))
+
+            # 上次失败的作品先交出（不带播放地址），列表里再遇到时不重复交出
+            retry = entry.get('retry') or {}
+            if not await asyncio.to_thread(self._put, ('retry', retry)):
+                return
+            for video_id, info in retry.items():
+                item = {'video_id': video_id, 'url': info['url'], 'title': info.get('title'),
+                        'create_time': info.get('create_time'), 'duration': info.get('duration'), 'candidates': []}
+                if not await asyncio.to_thread(self._put, ('item', item)):
+                    return
+            if retry:
+                self.log(f"重新下载上次失败的 {len(retry)} 个作品")
+
+            cursor = progress.start_cursor
+            pages = 0
+            while not self._stop.is_set():
+                data = await self._next_page(page, spec, cursor)
+                if data is None:
+                    self.log(f"获取列表失败（游标 {cursor}），下次从断点继续")
+                    return
+                pages += 1
+                awemes, cursor, snapshot = progress.accept(data)
+                self.log(f"第 {pages} 页: {len(data['items'])} 个作品，需要下载 {len(awemes)} 个")
+                for aweme in awemes:
+                    item = self._to_item(aweme)
+                    if item is not None and item['video_id'] in retry:
+                        continue
+                    if item is not None and not await asyncio.to_thread(self._put, ('item', item)):
+                        return
+                if not await asyncio.to_thread(self._put, ('checkpoint', snapshot)):
+                    return
+                if cursor is None:
+                    self.log(f"列表已抓取完毕，共 {pages} 页")
+                    return
+        finally:
+            page.remove_listener("response", self._handle_list_response)
+            await asyncio.to_thread(self._put, ('end', None))
+
+    async def _handle_list_response(self, response):
+        spec = next((spec for spec in SOURCE_KINDS.values() if spec['api_re'].search(response.url)), None)
+        if spec is None or (self.source is not None and spec is not SOURCE_KINDS[self.source[0]]):
+            return
+        try:
+            if response.status != 200:
+                return
+            data = parse_list_response(await response.json())
+        except Exception:
+            return
+        if data is None:
+            return
+        requested = parse_qs(urlsplit(response.url).query).get(spec['cursor_param'], ['0'])[0]
+        # 记下页面自己的请求地址，之后替换游标重放
+        self._template = response.url
+        self._captured[int(requested or 0)] = data
+        self._captured_event.set()
+
+    async def _next_page(self, page, spec, cursor):
+        """
+        取游标为 cursor 的一页：已截获的直接用，否则在页面里重放请求，再不行就滚动页面等待
+        """
+        deadline = time.monotonic() + self.page_timeout
+        if self._template is None:
+            # 第一页由页面加载时自己请求，之后才有可以重放的请求地址
+            await self._wait_for(lambda: self._template is not None, deadline)
+        if cursor in self._captured:
+            return self._captured.pop(cursor)
+        if self._template is not None:
+            data = await self._replay(page, spec, cursor)
+            if data is not None:
+                return data
+        while time.monotonic() < deadline and not self._stop.is_set():
+            if cursor in self._captured:
+                return self._captured.pop(cursor)
+            try:
+                await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+            except Exception:
+                pass
+            await self._wait_for(lambda: cursor in self._captured, min(deadline, time.monotonic() + 1))
+        return self._captured.pop(cursor, None)
+
+    async def _wait_for(self, condition, deadline):
+        """等待截获的列表响应满足 condition，最多等到 deadline"""
+        while not condition() and not self._stop.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            self._captured_event.clear()
+            try:
+                await asyncio.wait_for(self._captured_event.wait(), min(remaining, 0.5))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _replay(self, page, spec, cursor):
+        url = with_cursor(self._template, spec['cursor_param'], cursor)
+        try:
+            text = await page.evaluate(FETCH_JS, url)
+            data = parse_list_response(json.loads(text))
+        except Exception as e:
+            self.log(f"重放列表请求失败，改为滚动加载: {e}")
+            return None
+        if data is None:
+            self.log("重放列表请求没有返回作品列表，改为滚动加载")
+        return data
+
+    def _to_item(self, aweme):
+        from douyin_spider import clean_title
+
+        video_id = str(aweme.get('aweme_id') or '')
+        candidates = extract_play_candidates(aweme)
+        if not video_id or not candidates:
+            # 图文作品等没有视频流
+            self.log(f"作品 {video_id or '?'} 没有视频，跳过")
+            return None
+        return {
+            'video_id': video_id,
+            'url': f"https://www.douyin.com/video/{video_id}",
+            'title': clean_title(aweme.get('desc') or '') or f"douyin_{video_id}",
+            'create_time': aweme.get('create_time'),
+            'duration': video_duration(aweme),
+            'candidates': candidates,
+        }
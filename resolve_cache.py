@@ -0,0 +1,163 @@
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qs, urlsplit
+
+EXPIRY_QUERY_KEYS = ('x-expires', 'expires', 'Expires')
+# douyinvod 签名地址: https://v3-web.douyinvod.com/<32位签名>/<8位十六进制过期时间>/video/...
+SIGNED_PATH_RE = re.compile(r'^/[0-9a-f]{32}/([0-9a-f]{8})/')
+
+
+def normalize_share_url(url):
+    """
+    规范化分享链接作为缓存键：忽略协议、大小写主机名、结尾斜杠和跟踪参数
+    """
+    parts = urlsplit(url.strip())
+    key = parts.netloc.lower() + parts.path.rstrip('/')
+    query = parse_qs(parts.query)
+    for name in ('modal_id', 'aweme_id'):
+        if name in query:
+            key += f"?{name}={query[name][0]}"
+    return key
+
+
+def url_expiry(url):
+    """
+    解析签名 CDN 地址中的过期时间戳，没有则返回 None
+    """
+    parts = urlsplit(url)
+    query = parse_qs(parts.query)
+    for name in EXPIRY_QUERY_KEYS:
+        if name in query:
+            try:
+                return int(query[name][0])
+            except ValueError:
+                pass
+    m = SIGNED_PATH_RE.match(parts.path)
+    if m:
+        return int(m.group(1), 16)
+    return None
+
+
+class ResolveCache:
+    """
+    解析结果缓存：规范化分享链接 -> 视频 id -> 播放候选（地址、大小、标题）。
+
+    条目的有效期取候选地址中最早的签名过期时间（提前 expiry_margin 秒失效，留出下载时间），
+    没有签名时按 default_ttl；超过 max_entries 时按 LRU 淘汰，持久化为 JSON 文件。
+    """
+
+    def __init__(self, path=os.path.join("cache", "resolve_cache.json"), max_entries=1000,
+                 default_ttl=6 * 3600, expiry_margin=300, log_callback=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.expiry_margin = expiry_margin
+        self.log_callback = log_callback
+        self._lock = threading.Lock()
+        self._urls = {}
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self._load()
+
+    def log(self, message):
+        if self.log_callback:
+            self.log_callback(message)
+        else:
+            print(f"[Cache] {message}")
+
+    def get(self, url):
+        """
+        按分享链接查询，返回 {'video_id', 'title', 'duration', 'candidates'} 或 None
+        """
+        key = normalize_share_url(url)
+        with self._lock:
+            video_id = self._urls.get(key)
+            entry = self._entries.get(video_id) if video_id else None
+            if entry is None or not entry['candidates']:
+                self.misses += 1
+                return None
+            if entry['expires_at'] <= time.time():
+                # 只清空播放地址，保留 链接 -> 视频 id 的映射（下载索引仍可据此跳过）
+                self.expired += 1
+                entry['candidates'] = []
+                self._save()
+                return None
+            self.hits += 1
+            self._entries.move_to_end(video_id)
+            return {'video_id': video_id, 'title': entry['title'], 'duration': entry.get('duration'),
+                    'candidates': entry['candidates']}
+
+    def video_id_for(self, url):
+        """
+        只查询分享链接对应的视频 id（不计入命中统计，条目过期也可用）
+        """
+        with self._lock:
+            return self._urls.get(normalize_share_url(url))
+
+    def put(self, url, result):
+        """
+        写入解析结果（需要包含 video_id 和至少一个候选）
+        """
+        video_id = result.get('video_id')
+        candidates = result.get('candidates') or []
+        if not video_id or not candidates:
+            return
+
+        now = time.time()
+        expires_at = now + self.default_ttl
+        for c in candidates:
+            expiry = url_expiry(c['url'])
+            if expiry is not None:
+                expires_at = min(expires_at, expiry - self.expiry_margin)
+        if expires_at <= now:
+            return
+
+        with self._lock:
+            self._urls[normalize_share_url(url)] = video_id
+            self._entries[video_id] = {
+                'title': result.get('title') or '',
+                'duration': result.get('duration'),
+                'candidates': candidates,
+                'expires_at': expires_at,
+            }
+            self._entries.move_to_end(video_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+            self._save()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'expired': self.expired, 'entries': len(self._entries)}
+
+    def _remove(self, video_id):
+        self._entries.pop(video_id, None)
+        for key in [k for k, v in self._urls.items() if v == video_id]:
+            del self._urls[key]
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self._urls = data.get('urls', {})
+            self._entries = OrderedDict(data.get('entries', []))
+        except Exception as e:
+            self.log(f"读取解析缓存失败，将重新建立: {e}")
+            self._urls = {}
+            self._entries = OrderedDict()
+
+    def _save(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            # entries 保存为列表以保留 LRU 顺序
+            json.dump({'urls': self._urls, 'entries': list(self._entries.items())}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,61 @@
+from fnmatch import fnmatch
+
+
+def is_media_request(url, resource_type):
+    """
+    判断请求是否为视频流（按资源类型或 .mp4 地址）
+    """
+    return resource_type == "media" or ".mp4" in url
+
+
+class ResourcePolicy:
+    """
+    页面资源路由策略：按资源类型和 URL 模式决定放行、拦截或作为视频流处理。
+
+    优先级：allow_patterns > deny_patterns > 视频流 > block_types > 默认放行。
+    URL 模式使用 fnmatch 通配符，例如 "*://mcs.zijieapi.com/*"。
+    """
+
+    ALLOW = "allow"
+    BLOCK = "block"
+    MEDIA = "media"
+
+    # 嗅探只需要页面脚本和视频地址，图片和字体都不必加载
+    DEFAULT_BLOCK_TYPES = ("image", "font")
+    # 埋点/监控上报
+    DEFAULT_DENY_PATTERNS = (
+        "*://mcs.zijieapi.com/*",
+        "*://mon.zijieapi.com/*",
+        "*://*.snssdk.com/*/log*",
+    )
+
+    # 按 URL 拦截时（不能按资源类型判断）各类型对应的扩展名
+    TYPE_URL_PATTERNS = {
+        "image": ("*.png*", "*.jpg*", "*.jpeg*", "*.webp*", "*.gif*", "*.avif*", "*.image*"),
+        "font": ("*.woff*", "*.woff2*", "*.ttf*", "*.otf*"),
+    }
+
+    def __init__(self, block_types=DEFAULT_BLOCK_TYPES, allow_patterns=(), deny_patterns=DEFAULT_DENY_PATTERNS):
+        self.block_types = set(block_types)
+        self.allow_patterns = list(allow_patterns)
+        self.deny_patterns = list(deny_patterns)
+
+    def decide(self, url, resource_type):
+        if any(fnmatch(url, p) for p in self.allow_patterns):
+            return self.ALLOW
+        if any(fnmatch(url, p) for p in self.deny_patterns):
+            return self.BLOCK
+        if is_media_request(url, resource_type):
+            return self.MEDIA
+        if resource_type in self.block_types:
+            return self.BLOCK
+        return self.ALLOW
+
+    def url_block_patterns(self):
+        """
+        只能按 URL 拦截时（持久化浏览器配置下不使用页面路由）使用的通配符列表，allow_patterns 不生效
+        """
+        patterns = list(self.deny_patterns)
+        for resource_type in sorted(self.block_types):
+            patterns += self.TYPE_URL_PATTERNS.get(resource_type, ())
+        return patterns
@@ -0,0 +1,381 @@
+import json
+import os
+import queue
+import re
+import socket
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from douyin_spider import DouyinSpider, extract_urls_from_text
+from job_store import FINAL_STATUSES
+from metrics import MetricsBus, JobEvent, DownloadProgressEvent
+
+
+class DownloadService:
+    """
+    常驻下载服务：从 JobStore 取任务交给常驻的下载引擎执行，引擎和浏览器一直保持预热。
+
+    任务状态写回 JobStore（重启后排队中的任务继续执行），执行过程中的事件广播给
+    subscribe() 的订阅者（HTTP 接口用它实现 SSE 事件流）。
+    """
+
+    def __init__(self, store, engine, cache=None, index=None, save_dir="videos", max_active=4, owner=None,
+                 lease_seconds=60, poll_interval=0.5, log_callback=None, manifest=None):
+        self.store = store
+        self.engine = engine
+        self.cache = cache
+        self.index = index
+        # 可选的校验结果清单（见 media_verify.VerifyManifest）
+        self.manifest = manifest
+        self.save_dir = save_dir
+        # 同时交给引擎的任务数，其余任务留在 JobStore 里排队
+        self.max_active = max_active
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.log_callback = log_callback
+
+        # 所有任务的事件都汇总到这条总线（批量工作进程把它转发给主进程）
+        self.metrics = MetricsBus()
+        self._lock = threading.Lock()
+        # 执行中的任务: job_id -> {'spider', 'progress'}
+        self._active = {}
+        self._subscribers = []
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def log(self, message):
+        if self.log_callback:
+            self.log_callback(message)
+        else:
+            print(f"[Service] {message}")
+
+    def start(self):
+        # 本服务上次退出时没执行完的任务放回队列（正常退出时已经放回，剩下的说明上次是崩溃退出）
+        requeued = self.store.requeue_owner(self.owner, crashed=True)
+        if requeued:
+            self.log(f"恢复上次未完成的任务 {requeued} 个")
+        self._thread = threading.Thread(target=self._dispatch_loop, name="DownloadService", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=30):
+        """
+        停止取新任务并取消执行中的任务，未完成的任务下次启动时继续。
+        等执行中的任务都停下（最多 timeout 秒）再把它们放回队列，避免任务已放回队列时还在写文件或结果
+        """
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+        with self._lock:
+            active = list(self._active.values())
+        for item in active:
+            item['spider'].cancel()
+
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                remaining = len(self._active)
+            if not remaining or time.monotonic() >= deadline:
+                break
+            time.sleep(0.05)
+        if remaining:
+            # 留在执行中状态，下次启动时按崩溃恢复放回队列
+            self.log(f"还有 {remaining} 个任务未能在 {timeout}s 内停止，下次启动时恢复")
+            return
+        self.store.requeue_owner(self.owner)
+
+    def run_until_idle(self, poll_interval=0.5):
+        """阻塞到没有执行中的任务、任务库中也没有可取的任务为止（批量工作进程使用）"""
+        while not self._stopping.is_set():
+            with self._lock:
+                active = bool(self._active)
+            if not active and not self.store.has_pending():
+                return
+            time.sleep(poll_interval)
+
+    def submit(self, urls, save_dir=None):
+        jobs = [self.store.add(url, save_dir or self.save_dir) for url in urls]
+        self._wakeup.set()
+        return jobs
+
+    def get(self, job_id):
+        job = self.store.get(job_id)
+        if job is not None:
+            with self._lock:
+                item = self._active.get(job_id)
+                if item is not None:
+                    job['progress'] = item['progress']
+        return job
+
+    def cancel(self, job_id):
+        job = self.store.request_cancel(job_id)
+        with self._lock:
+            item = self._active.get(job_id)
+        if item is not None:
+            item['spider'].cancel()
+        return job
+
+    def subscribe(self, job_id=None, maxsize=1000):
+        """
+        订阅事件，返回 queue.Queue，元素为事件字典（带 job_id）；job_id 为 None 时订阅所有任务
+        队列满时丢弃新事件，慢的订阅者不会拖慢下载
+        """
+        q = queue.Queue(maxsize=maxsize)
+        with self._lock:
+            self._subscribers.append((job_id, q))
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers = [(job_id, sub) for job_id, sub in self._subscribers if sub is not q]
+
+    def _dispatch_loop(self):
+        last_renew = 0.0
+        while not self._stopping.is_set():
+            while len(self._active) < self.max_active and not self._stopping.is_set():
+                job = self.store.claim(self.owner, self.lease_seconds)
+                if job is None:
+                    break
+                try:
+                    self._start_job(job)
+                except Exception as e:
+                    # 单个任务启动失败（如保存目录不可用）只让这个任务失败，不能让调度线程退出
+                    self._fail_job(job, e)
+            if time.monotonic() - last_renew > self.lease_seconds / 3:
+                self._renew_leases()
+                last_renew = time.monotonic()
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def _start_job(self, job):
+        job_id = job['id']
+        os.makedirs(job['save_dir'], exist_ok=True)
+        # 每个任务一条总线：同一个链接提交多次时，事件也能对应到各自的任务
+        bus = MetricsBus(parent=self.metrics)
+        bus.subscribe(lambda event: self._on_event(job_id, event))
+        spider = DouyinSpider(job['url'], log_callback=self.log_callback, cache=self.cache, index=self.index,
+                              engine=self.engine, metrics=bus, manifest=self.manifest)
+        spider.save_dir = job['save_dir']
+        with self._lock:
+            self._active[job_id] = {'spider': spider, 'progress': None}
+        self._publish(job_id, {'type': 'state', 'status': 'running', 'url': job['url'], 'ts': time.time()})
+        future = self.engine.submit(spider)
+        future.add_done_callback(lambda f: self._finish_job(job_id, f))
+
+    def _fail_job(self, job, error):
+        job_id = job['id']
+        self.log(f"任务 {job_id} 启动失败: {error}")
+        with self._lock:
+            self._active.pop(job_id, None)
+        result = {'url': job['url'], 'status': 'failed', 'error': str(error)}
+        self.store.finish(job_id, 'failed', result, owner=self.owner)
+        self._publish(job_id, {'type': 'state', 'status': 'failed', 'result': result, 'ts': time.time()})
+
+    def _finish_job(self, job_id, future):
+        try:
+            result = future.result()
+        except Exception as e:
+            result = {'status': 'failed', 'error': str(e)}
+        try:
+            if self._stopping.is_set() and result['status'] == 'cancelled':
+                # 服务停止导致的取消，不写结果，下次启动重新执行
+                return
+            self.store.finish(job_id, result['status'], result, owner=self.owner)
+            self._publish(job_id, {'type': 'state', 'status': result['status'], 'result': result, 'ts': time.time()})
+        finally:
+            # 结果写完才移出执行中列表，stop() 据此判断可以放回队列
+            with self._lock:
+                self._active.pop(job_id, None)
+            self._wakeup.set()
+
+    def _renew_leases(self):
+        with self._lock:
+            active = list(self._active.items())
+        for job_id, item in active:
+            cancel_requested = self.store.renew(job_id, self.owner, self.lease_seconds)
+            if cancel_requested:
+                item['spider'].cancel()
+
+    def _on_event(self, job_id, event):
+        if isinstance(event, DownloadProgressEvent):
+            with self._lock:
+                item = self._active.get(job_id)
+                if item is not None:
+                    item['progress'] = {'downloaded': event.downloaded, 'total': event.total}
+        if isinstance(event, JobEvent):
+            # 任务结束由 _finish_job 统一发布
+            return
+        self._publish(job_id, dict(event.to_dict(), job_id=job_id))
+
+    def _publish(self, job_id, data):
+        data.setdefault('job_id', job_id)
+        with self._lock:
+            subscribers = [q for sub_id, q in self._subscribers if sub_id is None or sub_id == job_id]
+        for q in subscribers:
+            try:
+                q.put_nowait(data)
+            except queue.Full:
+                pass
+
+
+def make_handler(service):
+    """
+    HTTP 接口（JSON）：
+        POST /jobs                 提交任务，请求体为 {"urls": [...]} / {"text": "分享文本"} / 纯文本，可带 "save_dir"
+        GET  /jobs?status=queued   任务列表
+        GET  /jobs/<id>            任务详情（执行中的任务带下载进度）
+        POST /jobs/<id>/cancel     取消任务（DELETE /jobs/<id> 同义）
+        GET  /events[?job=<id>]    事件流（text/event-stream）
+        GET  /health               服务状态和各状态任务数
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            parts = urlsplit(self.path)
+            query = parse_qs(parts.query)
+            if parts.path == '/health':
+                return self._send_json({'ok': True, 'owner': service.owner, 'jobs': service.store.counts()})
+            if parts.path == '/jobs':
+                status = query.get('status', [None])[0]
+                try:
+                    limit = int(query.get('limit', ['100'])[0])
+                except ValueError:
+                    return self._send_error(400, "limit 必须是整数")
+                return self._send_json({'jobs': service.store.list(status.split(',') if status else None, limit)})
+            m = re.match(r'^/jobs/(\d+)$', parts.path)
+            if m:
+                job = service.get(int(m.group(1)))
+                return self._send_json(job) if job else self._send_error(404, "任务不存在")
+            if parts.path == '/events':
+                job_id = query.get('job', [None])[0]
+                try:
+                    job_id = int(job_id) if job_id else None
+                except ValueError:
+                    return self._send_error(400, "job 必须是任务 id")
+                return self._stream_events(job_id)
+            self._send_error(404, "未知接口")
+
+        def do_POST(self):
+            path = urlsplit(self.path).path
+            if path == '/jobs':
+                return self._submit()
+            m = re.match(r'^/jobs/(\d+)/cancel$', path)
+            if m:
+                return self._cancel(int(m.group(1)))
+            self._send_error(404, "未知接口")
+
+        def do_DELETE(self):
+            m = re.match(r'^/jobs/(\d+)$', urlsplit(self.path).path)
+            if m:
+                return self._cancel(int(m.group(1)))
+            self._send_error(404, "未知接口")
+
+        def _submit(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length).decode('utf-8') if length else ''
+            save_dir = None
+            try:
+                data = json.loads(body) if body.lstrip().startswith('{') else {'text': body}
+            except ValueError:
+                return self._send_error(400, "请求体不是有效的 JSON")
+            entries = data.get('urls')
+            if entries is None:
+                entries = []
+            elif not isinstance(entries, list):
+                return self._send_error(400, "urls 必须是链接数组")
+            text = data.get('text')
+            if text:
+                entries = entries + [text]
+            save_dir = data.get('save_dir')
+            if save_dir is not None and not isinstance(save_dir, str):
+                return self._send_error(400, "save_dir 必须是字符串")
+            if save_dir:
+                try:
+                    os.makedirs(save_dir, exist_ok=True)
+                except OSError as e:
+                    return self._send_error(400, f"save_dir 不可用: {e}")
+            if not all(isinstance(entry, str) for entry in entries):
+                return self._send_error(400, "链接和分享文本必须是字符串")
+            # 与命令行一样从文本中提取链接，不是链接的内容直接忽略
+            urls = [url for entry in entries for url in extract_urls_from_text(entry)]
+            if not urls:
+                return self._send_error(400, "未识别到有效链接")
+            self._send_json({'jobs': service.submit(urls, save_dir)}, status=201)
+
+        def _cancel(self, job_id):
+            job = service.cancel(job_id)
+            return self._send_json(job) if job else self._send_error(404, "任务不存在")
+
+        def _stream_events(self, job_id):
+            q = service.subscribe(job_id)
+            try:
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+                self.send_header('Cache-Control', 'no-cache')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                self.close_connection = True
+                while True:
+                    try:
+                        data = q.get(timeout=15)
+                    except queue.Empty:
+                        # 心跳，顺便发现已断开的客户端
+                        self.wfile.write(b": keep-alive\n\n")
+                        self.wfile.flush()
+                        continue
+                    line = json.dumps(data, ensure_ascii=False)
+                    self.wfile.write(f"event: {data.get('type', 'event')}\ndata: {line}\n\n".encode('utf-8'))
+                    self.wfile.flush()
+                    # 只订阅单个任务时，任务结束后关闭事件流
+                    if job_id is not None and data.get('type') == 'state' and data.get('status') in FINAL_STATUSES:
+                        return
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            finally:
+                service.unsubscribe(q)
+
+        def _send_json(self, data, status=200):
+            body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_error(self, status, message):
+            self._send_json({'error': message}, status=status)
+
+    return Handler
+
+
+if hasattr(socket, 'AF_UNIX'):
+    class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        """在 Unix 套接字上提供同样的 HTTP 接口（只有本机有权限的用户能访问）"""
+        daemon_threads = True
+
+        def get_request(self):
+            request, _ = super().get_request()
+            # BaseHTTPRequestHandler 需要 (host, port) 形式的客户端地址
+            return request, ("local", 0)
+
+
+def make_server(service, host="127.0.0.1", port=8765, unix_socket=None):
+    handler = make_handler(service)
+    if unix_socket:
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        return UnixHTTPServer(unix_socket, handler)
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
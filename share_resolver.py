@@ -0,0 +1,225 @@
+import json
+import re
+from urllib.parse import unquote
+
+MOBILE_USER_AGENT = "Mozilla/5.0 (iPhone; CPU iPhone OS 16_6 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.6 Mobile/15E148 Safari/604.1"
+
+# 分享页内嵌数据的两种格式：移动端 _ROUTER_DATA（JSON），网页端 RENDER_DATA（URL 编码的 JSON）
+ROUTER_DATA_RE = re.compile(r'window\._ROUTER_DATA\s*=\s*(\{.*?\})\s*</script>', re.S)
+RENDER_DATA_RE = re.compile(r'<script id="RENDER_DATA" type="application/json">(.*?)</script>', re.S)
+# 清晰度档位名中的分辨率，如 normal_1080_0 / adapt_lowest_720_1
+GEAR_HEIGHT_RE = re.compile(r'_(\d{3,4})_')
+RATIO_HEIGHT_RE = re.compile(r'(\d{3,4})p')
+# 页面自己请求的视频详情接口，响应中有全部清晰度的播放地址
+DETAIL_API_RE = re.compile(r'/aweme/v\d+/web/aweme/detail/|/aweme/v\d+/aweme/detail/')
+VIDEO_ID_RES = [
+    re.compile(r'/(?:video|note)/(\d+)'),
+    re.compile(r'[?&](?:modal_id|aweme_id|item_id)=(\d+)'),
+]
+
+
+def extract_video_id(url):
+    """
+    从跳转后的地址中提取视频 id
+    """
+    for pattern in VIDEO_ID_RES:
+        m = pattern.search(url or '')
+        if m:
+            return m.group(1)
+    return None
+
+
+def parse_embedded_data(html):
+    """
+    解析分享页内嵌的页面数据，失败返回 None
+    """
+    m = ROUTER_DATA_RE.search(html)
+    if m:
+        try:
+            return json.loads(m.group(1))
+        except ValueError:
+            pass
+    m = RENDER_DATA_RE.search(html)
+    if m:
+        try:
+            return json.loads(unquote(m.group(1)))
+        except ValueError:
+            pass
+    return None
+
+
+def find_aweme(data):
+    """
+    在页面数据中递归查找视频详情（包含 video.play_addr / video.playAddr 的对象）
+    """
+    if isinstance(data, dict):
+        video = data.get('video')
+        if isinstance(video, dict) and ('play_addr' in video or 'playAddr' in video):
+            return data
+        values = data.values()
+    elif isinstance(data, list):
+        values = data
+    else:
+        return None
+    for value in values:
+        found = find_aweme(value)
+        if found is not None:
+            return found
+    return None
+
+
+def _normalize_play_url(url):
+    if url.startswith('//'):
+        url = 'https:' + url
+    # playwm 是带水印的地址，换成 play 即为无水印
+    return url.replace('/playwm/', '/play/')
+
+
+def _height(value, pattern):
+    m = pattern.search(value or '')
+    return int(m.group(1)) if m else 0
+
+
+def extract_play_candidates(aweme):
+    """
+    从视频详情中提取所有播放地址，返回 [{'url', 'size', 'height', 'bitrate'}]，同一地址只保留一次。
+    height（分辨率高度）和 bitrate（码率）未知时为 0，已按 rank_candidates 排好序
+    """
+    video = aweme.get('video') or {}
+    candidates = []
+    seen = set()
+
+    def add(url, size, height=0, bitrate=0):
+        if not url:
+            return
+        url = _normalize_play_url(url)
+        if url in seen:
+            return
+        seen.add(url)
+        candidates.append({'url': url, 'size': int(size or 0), 'height': int(height or 0), 'bitrate': int(bitrate or 0)})
+
+    # 各清晰度的地址（bit_rate / bitRateList）
+    for rate in video.get('bit_rate') or []:
+        addr = rate.get('play_addr') or {}
+        height = addr.get('height') or _height(rate.get('gear_name'), GEAR_HEIGHT_RE)
+        for url in addr.get('url_list') or []:
+            add(url, addr.get('data_size'), height, rate.get('bit_rate'))
+    for rate in video.get('bitRateList') or []:
+        height = rate.get('height') or _height(rate.get('gearName'), GEAR_HEIGHT_RE)
+        for addr in rate.get('playAddr') or []:
+            add(addr.get('src'), rate.get('dataSize'), height, rate.get('bitRate'))
+
+    # 默认播放地址
+    default_height = _height(video.get('ratio'), RATIO_HEIGHT_RE)
+    play_addr = video.get('play_addr')
+    if isinstance(play_addr, dict):
+        for url in play_addr.get('url_list') or []:
+            add(url, play_addr.get('data_size'), play_addr.get('height') or default_height)
+    for addr in video.get('playAddr') or []:
+        if isinstance(addr, dict):
+            add(addr.get('src'), 0, default_height)
+
+    return rank_candidates(candidates)
+
+
+def video_duration(aweme):
+    """
+    视频时长（秒），用于下载后校验文件是否完整、是不是广告；未知时返回 None
+    """
+    video = aweme.get('video') or {}
+    # 详情接口的 video.duration 单位为毫秒，部分接口只有顶层的 duration（也是毫秒）
+    value = video.get('duration') or aweme.get('duration')
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value / 1000 if value > 0 else None
+
+
+def rank_candidates(candidates):
+    """
+    按清晰度（分辨率高度）、码率、文件大小从高到低排序；都相同时保持原有顺序，
+    同一批候选每次排序结果一致
+    """
+    return sorted(candidates, key=lambda c: (c.get('height', 0), c.get('bitrate', 0), c.get('size', 0)), reverse=True)
+
+
+def parse_detail_response(data):
+    """
+    解析视频详情接口的 JSON（{"aweme_detail": {...}} 或 {"item_list": [...]}），
+    返回视频详情对象，没有返回 None
+    """
+    if not isinstance(data, dict):
+        return None
+    detail = data.get('aweme_detail')
+    if isinstance(detail, dict):
+        return detail
+    return find_aweme(data)
+
+
+class ShareResolver:
+    """
+    纯 HTTP 解析分享短链：跟随跳转拿到视频 id，解析分享页内嵌数据直接得到播放地址，
+    全程不需要启动浏览器。解析失败返回 None，由调用方回退到浏览器嗅探。
+    """
+
+    SHARE_PAGE = "https://www.iesdouyin.com/share/video/{video_id}/"
+
+    def __init__(self, share_page=SHARE_PAGE, timeout=10, log_callback=None):
+        self.share_page = share_page
+        self.timeout = timeout
+        self.log_callback = log_callback
+        self._session = None
+
+    @property
+    def session(self):
+        # 第一次请求时才导入 requests 并创建会话，避免拖慢程序启动
+        if self._session is None:
+            import requests
+
+            self._session = requests.Session()
+            self._session.headers.update({"User-Agent": MOBILE_USER_AGENT})
+        return self._session
+
+    def log(self, message):
+        if self.log_callback:
+            self.log_callback(message)
+        else:
+            print(f"[Resolver] {message}")
+
+    def resolve(self, url):
+        """
+        返回 {'video_id', 'title', 'duration', 'candidates': [{'url', 'size'}]}，失败返回 None
+        """
+        try:
+            response = self.session.get(url, timeout=self.timeout, allow_redirects=True)
+            video_id = extract_video_id(response.url)
+            if not video_id:
+                self.log(f"未能从跳转地址识别视频 id: {response.url[:80]}")
+                return None
+
+            data = parse_embedded_data(response.text)
+            if data is None or find_aweme(data) is None:
+                # 短链落地页不是分享页（例如跳到了网页版），再请求一次分享页
+                response = self.session.get(self.share_page.format(video_id=video_id), timeout=self.timeout)
+                data = parse_embedded_data(response.text)
+
+            aweme = find_aweme(data) if data is not None else None
+            if aweme is None:
+                self.log("分享页中未找到视频数据")
+                return None
+
+            candidates = extract_play_candidates(aweme)
+            if not candidates:
+                self.log("分享页中未找到播放地址")
+                return None
+
+            return {
+                'video_id': video_id,
+                'title': aweme.get('desc') or '',
+                'duration': video_duration(aweme),
+                'candidates': candidates,
+            }
+        except Exception as e:
+            self.log(f"HTTP 解析出错: {e}")
+            return None
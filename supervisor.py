@@ -0,0 +1,194 @@
+import multiprocessing
+import os
+import socket
+import tempfile
+import threading
+import time
+
+from job_store import FINAL_STATUSES, JobStore
+from metrics import DownloadProgressEvent, LogEvent, MetricsBus, event_from_dict
+
+
+def worker_main(config, events):
+    """
+    工作进程入口：自己的浏览器池 + 下载引擎，从共享任务库中按租约取任务，直到没有可取的任务为止。
+    日志和指标事件通过 events 队列（multiprocessing.Queue）发回主进程。
+    必须是模块级函数，Windows / PyInstaller 打包版以 spawn 方式启动子进程时才能找到。
+    """
+    from browser_pool import BrowserPool
+    from download_index import DownloadIndex
+    from engine import DownloadEngine
+    from media_verify import VerifyManifest
+    from service import DownloadService
+
+    worker = config['worker']
+
+    def log(message):
+        events.put(LogEvent(message=f"[worker {worker}] {message}").to_dict())
+
+    def forward(event):
+        # 日志由 log 发送；进度事件太多，不跨进程传输
+        if not isinstance(event, (LogEvent, DownloadProgressEvent)):
+            events.put(event.to_dict())
+
+    pool = BrowserPool(size=config['concurrency'], headless=config['headless'], log_callback=log)
+    engine = DownloadEngine(pool=pool, resolve_concurrency=config['concurrency'],
+                            download_concurrency=config['downloads'], log_callback=log)
+    store = JobStore(config['db_path'])
+    index = DownloadIndex(config['index_path'])
+    service = DownloadService(store, engine, index=index, save_dir=config['save_dir'],
+                              max_active=config['concurrency'] + config['downloads'], owner=config['owner'],
+                              lease_seconds=config['lease_seconds'], log_callback=log, manifest=VerifyManifest())
+    service.metrics.subscribe(forward)
+    try:
+        service.start()
+        service.run_until_idle()
+    finally:
+        service.stop()
+        engine.close()
+        pool.close()
+        store.close()
+        index.close()
+
+
+class Supervisor:
+    """
+    多进程分片：把一批链接写入共享任务库，启动 N 个工作进程（各自一个浏览器）按租约取任务。
+
+    工作进程异常退出时立即把它名下的任务放回队列并补一个新进程（不必等租约过期）；
+    所有工作进程的事件汇总到 metrics 总线上，结束后从任务库读出每个链接的结果。
+
+    db_path 为 None 时每次 run() 在 cache 目录下新建一个任务库，结束后删除，
+    不会取到以前批次遗留在队列里的任务。
+    """
+
+    def __init__(self, workers=None, concurrency=2, downloads=None, save_dir="videos",
+                 db_path=None, index_path=os.path.join("cache", "downloads.db"),
+                 headless=True, lease_seconds=60, max_restarts=None, metrics=None, log_callback=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.concurrency = concurrency
+        self.downloads = downloads or concurrency
+        self.save_dir = save_dir
+        self.db_path = os.path.abspath(db_path) if db_path else None
+        self.index_path = os.path.abspath(index_path)
+        self.headless = headless
+        self.lease_seconds = lease_seconds
+        # 工作进程累计重启次数上限，防止某个链接反复让进程崩溃时无限重启
+        self.max_restarts = self.workers * 3 if max_restarts is None else max_restarts
+        self.metrics = metrics or MetricsBus()
+        self.log_callback = log_callback
+        self._context = multiprocessing.get_context("spawn")
+        self._events = None
+        self._processes = {}
+        self._restarts = 0
+        self._next_worker = 0
+
+    def log(self, message):
+        if self.log_callback:
+            self.log_callback(message)
+        else:
+            print(f"[Supervisor] {message}")
+
+    def run(self, urls):
+        """
+        处理一批链接，阻塞直到全部结束，按输入顺序返回结果列表（格式同 DouyinSpider.run()）
+        """
+        os.makedirs(self.save_dir, exist_ok=True)
+        own_db = self.db_path is None
+        if own_db:
+            os.makedirs("cache", exist_ok=True)
+            fd, path = tempfile.mkstemp(prefix="shard_jobs_", suffix=".db", dir="cache")
+            os.close(fd)
+            self.db_path = os.path.abspath(path)
+        store = JobStore(self.db_path)
+        try:
+            job_ids = [store.add(url, self.save_dir)['id'] for url in urls]
+            self._events = self._context.Queue()
+            reader = threading.Thread(target=self._read_events, daemon=True)
+            reader.start()
+
+            for _ in range(min(self.workers, len(job_ids))):
+                self._spawn()
+            self._monitor(store, job_ids)
+
+            results = []
+            for job_id in job_ids:
+                job = store.get(job_id)
+                result = job['result'] or {'url': job['url'], 'status': job['status']}
+                results.append(result)
+            return results
+        finally:
+            self._stop_all()
+            if self._events is not None:
+                self._events.put(None)
+            store.close()
+            if own_db:
+                for suffix in ("", "-wal", "-shm"):
+                    if os.path.exists(self.db_path + suffix):
+                        os.remove(self.db_path + suffix)
+                self.db_path = None
+
+    def _spawn(self):
+        worker = self._next_worker
+        self._next_worker += 1
+        owner = f"{socket.gethostname()}:{os.getpid()}:worker{worker}"
+        config = {
+            'worker': worker, 'owner': owner, 'db_path': self.db_path, 'index_path': self.index_path,
+            'save_dir': self.save_dir, 'concurrency': self.concurrency, 'downloads': self.downloads,
+            'headless': self.headless, 'lease_seconds': self.lease_seconds,
+        }
+        process = self._context.Process(target=worker_main, args=(config, self._events), name=f"worker{worker}",
+                                        daemon=True)
+        process.start()
+        self._processes[owner] = process
+        self.log(f"已启动工作进程 {worker} (pid {process.pid})")
+
+    def _monitor(self, store, job_ids):
+        while True:
+            for owner, process in list(self._processes.items()):
+                if process.is_alive():
+                    continue
+                del self._processes[owner]
+                if process.exitcode != 0:
+                    requeued = store.requeue_owner(owner, crashed=True)
+                    self.log(f"工作进程 {process.name} 异常退出 (exitcode {process.exitcode})，放回队列 {requeued} 个任务")
+
+            unfinished = [job_id for job_id in job_ids if store.get(job_id)['status'] not in FINAL_STATUSES]
+            if not unfinished:
+                return
+            # 还有没完成的任务但工作进程不够时补充（崩溃的进程，或提前结束的进程遇到租约过期的任务）
+            while len(self._processes) < min(self.workers, len(unfinished)) and store.has_pending():
+                if self._restarts >= self.max_restarts:
+                    if not self._processes:
+                        self.log("工作进程重启次数过多，放弃剩余任务")
+                        for job_id in unfinished:
+                            store.finish(job_id, 'failed', {'status': 'failed', 'error': "工作进程重启次数过多"})
+                        return
+                    break
+                if self._next_worker >= self.workers:
+                    self._restarts += 1
+                self._spawn()
+            time.sleep(0.5)
+
+    def _stop_all(self):
+        # 任务都结束后工作进程会自行退出，等一会儿再强制结束剩下的
+        for process in self._processes.values():
+            process.join(timeout=10)
+        for process in self._processes.values():
+            if process.is_alive():
+                process.terminate()
+                process.join(timeout=5)
+        self._processes = {}
+
+    def _read_events(self):
+        while True:
+            try:
+                data = self._events.get()
+            except (EOFError, OSError):
+                return
+            if data is None:
+                return
+            event = event_from_dict(data)
+            if isinstance(event, LogEvent):
+                self.log(event.message)
+            self.metrics.emit(event)
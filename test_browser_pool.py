@@ -0,0 +1,169 @@
+import sys
+import types
+
+import pytest
+
+import browser_pool
+from browser_pool import BrowserPool, get_shared_pool, shutdown_shared_pool
+
+
+def quiet(message):
+    pass
+
+
+class FakePage:
+    def __init__(self, context):
+        self.context = context
+        self.url = "about:blank"
+        self.closed = False
+        self._handlers = {}
+
+    def on(self, event, callback):
+        self._handlers.setdefault(event, []).append(callback)
+
+    def crash(self):
+        for callback in self._handlers.get("crash", []):
+            callback(self)
+
+    def is_closed(self):
+        return self.closed
+
+    async def goto(self, url, **kwargs):
+        self.url = url
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeContext:
+    def __init__(self, browser):
+        self.browser = browser
+        self.pages = []
+        self.closed = False
+
+    async def add_init_script(self, path=None):
+        pass
+
+    async def new_page(self):
+        page = FakePage(self)
+        self.pages.append(page)
+        return page
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeBrowser:
+    def __init__(self):
+        self.connected = True
+        self.contexts = []
+
+    def is_connected(self):
+        return self.connected
+
+    async def new_context(self, **kwargs):
+        context = FakeContext(self)
+        self.contexts.append(context)
+        return context
+
+    async def close(self):
+        self.connected = False
+
+
+class FakePlaywright:
+    """代替 async_playwright()：chromium.launch() 每次返回一个新的 FakeBrowser"""
+
+    def __init__(self):
+        self.chromium = self
+        self.browsers = []
+        self.stopped = False
+
+    async def start(self):
+        return self
+
+    async def launch(self, **kwargs):
+        browser = FakeBrowser()
+        self.browsers.append(browser)
+        return browser
+
+    async def stop(self):
+        self.stopped = True
+
+
+@pytest.fixture
+def playwright(monkeypatch):
+    fake = FakePlaywright()
+    module = types.ModuleType("playwright.async_api")
+    module.async_playwright = lambda: fake
+    monkeypatch.setitem(sys.modules, "playwright.async_api", module)
+    return fake
+
+
+async def current_page(page):
+    return page
+
+
+async def crash_page(page):
+    page.crash()
+    return page
+
+
+def test_page_is_recycled_after_max_uses(playwright):
+    pool = BrowserPool(size=1, max_uses=2, log_callback=quiet)
+    try:
+        pages = [pool.run(current_page, timeout=5) for _ in range(3)]
+    finally:
+        pool.close()
+    assert pages[0] is pages[1] and pages[0].closed
+    assert pages[2] is not pages[0]
+    # 同一个上下文里换新页面，浏览器不重启
+    assert pages[2].context is pages[0].context
+    assert len(playwright.browsers) == 1 and playwright.stopped
+
+
+def test_relaunch_after_crash(playwright):
+    pool = BrowserPool(size=1, log_callback=quiet)
+    try:
+        # 页面崩溃：整个上下文丢弃重建
+        crashed = pool.run(crash_page, timeout=5)
+        page = pool.run(current_page, timeout=5)
+        assert page.context is not crashed.context and crashed.context.closed
+
+        # 浏览器进程退出：下次租用时重新启动，槽位在新浏览器里重建上下文
+        playwright.browsers[0].connected = False
+        page = pool.run(current_page, timeout=5)
+        assert len(playwright.browsers) == 2
+        assert page.context.browser is playwright.browsers[1]
+    finally:
+        pool.close()
+
+
+def test_lease_returns_slot_when_job_raises(playwright):
+    async def fail(page):
+        raise ValueError("页面出错")
+
+    pool = BrowserPool(size=1, log_callback=quiet)
+    try:
+        first = pool.run(current_page, timeout=5)
+        with pytest.raises(ValueError):
+            pool.run(fail, timeout=5)
+        # 只有一个槽位，出错后槽位必须归还，而且换了干净的上下文
+        page = pool.run(current_page, timeout=5)
+        assert page.context is not first.context and first.context.closed
+    finally:
+        pool.close()
+
+
+def test_shared_pool_is_reused_until_shutdown(playwright, monkeypatch):
+    monkeypatch.setattr(browser_pool, '_shared_pool', None)
+    pool = get_shared_pool(size=1, log_callback=quiet)
+    # 之后的参数被忽略
+    assert get_shared_pool(size=3) is pool and pool.size == 1
+    pool.run(current_page, timeout=5)
+
+    shutdown_shared_pool()
+    assert pool.loop is None and playwright.stopped
+    assert not playwright.browsers[0].connected
+    other = get_shared_pool(size=2, log_callback=quiet)
+    assert other is not pool and other.size == 2
+    shutdown_shared_pool()
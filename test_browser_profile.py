@@ -0,0 +1,38 @@
+from browser_profile import BrowserProfile, CacheMeter
+from metrics import MetricsBus, PageLoadEvent, SummaryCollector
+
+
+def test_prepare_rotates_oversized_profile(tmp_path):
+    profile = BrowserProfile(str(tmp_path / "profile"), max_size_mb=1, log_callback=lambda m: None)
+    assert profile.prepare() is True
+    assert profile.prepare() is False
+
+    (tmp_path / "profile" / "chromium" / "Cache").mkdir()
+    (tmp_path / "profile" / "chromium" / "Cache" / "data_1").write_bytes(b"\0" * (2 * 1024 * 1024))
+    (tmp_path / "profile" / "storage_state.json").write_text('{"cookies": []}', encoding='utf-8')
+
+    # 超过上限后清空重建，导出的 storage_state 保留
+    assert profile.prepare() is True
+    assert not (tmp_path / "profile" / "chromium" / "Cache").exists()
+    assert (tmp_path / "profile" / "storage_state.json").exists()
+
+
+def test_cache_meter_counts_cached_bytes():
+    meter = CacheMeter()
+    meter._on_response({'requestId': "1", 'response': {'fromDiskCache': True}})
+    meter._on_data({'requestId': "1", 'dataLength': 3000})
+    meter._on_finished({'requestId': "1", 'encodedDataLength': 0})
+    meter._on_response({'requestId': "2", 'response': {}})
+    meter._on_data({'requestId': "2", 'dataLength': 500})
+    meter._on_finished({'requestId': "2", 'encodedDataLength': 700})
+    meter._on_served_from_cache({'requestId': "3"})
+    meter._on_data({'requestId': "3", 'dataLength': 100})
+    meter._on_finished({'requestId': "3", 'encodedDataLength': 0})
+
+    assert meter.snapshot() == {'requests': 3, 'cached_requests': 2, 'network_bytes': 700, 'cache_bytes': 3100}
+
+    bus = MetricsBus()
+    summary = bus.subscribe(SummaryCollector())
+    bus.emit(PageLoadEvent(url="u", **meter.snapshot()))
+    assert summary.summary()['page_loads']['cache_bytes'] == 3100
+    assert "缓存" in summary.format_summary()
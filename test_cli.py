@@ -0,0 +1,31 @@
+import io
+import json
+import sys
+
+import cli
+from fake_douyin_server import FakeDouyinServer
+
+
+def test_read_batch_urls():
+    text = ("1.2 复制打开抖音 https://v.douyin.com/abc/ 看看 https://v.douyin.com/def/ 两个\n"
+            "\n"
+            "又一次分享 HTTPS://V.DOUYIN.COM/abc?share_token=1 和 https://www.douyin.com/video/7300\n")
+    # 每行的链接都提取，规范化后相同的只保留第一次出现的
+    assert cli.read_batch_urls(io.StringIO(text)) == [
+        "https://v.douyin.com/abc/", "https://v.douyin.com/def/", "https://www.douyin.com/video/7300"]
+
+
+def test_batch_from_stdin_writes_one_result_per_url(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    with FakeDouyinServer(default_fixture="share_router_data.html") as server:
+        urls = [server.short_url(str(7300000000000000200 + i)) for i in range(3)]
+        text = f"第一个 {urls[0]} 第二个 {urls[1]}\n{urls[2]}\n重复 {urls[0].rstrip('/')}\n"
+        monkeypatch.setattr(sys, 'stdin', io.StringIO(text))
+
+        assert cli.batch(["-c", "1", "-d", str(tmp_path / "videos")]) == 0
+
+    # stdout 只有结果行（日志在 stderr），每个链接一行
+    results = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert sorted(r['url'] for r in results) == sorted(urls)
+    assert [r['status'] for r in results] == ['downloaded'] * 3
+    assert all(r['path'] and r['bytes'] for r in results)
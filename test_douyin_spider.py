@@ -0,0 +1,61 @@
+import asyncio
+import time
+
+from douyin_spider import DouyinSpider
+
+MB = 1024 * 1024
+
+
+def quiet(message):
+    pass
+
+
+def wait_for_stream(spider, arrivals):
+    """按 (秒, 回调) 在事件循环里送达候选，返回 _wait_for_stream 等待的时间"""
+
+    async def main():
+        spider._candidate_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        handles = [loop.call_later(at, callback) for at, callback in arrivals]
+        started = time.monotonic()
+        try:
+            await spider._wait_for_stream(started + spider.sniff_timeout)
+        finally:
+            for handle in handles:
+                handle.cancel()
+        return time.monotonic() - started
+
+    return asyncio.run(main())
+
+
+def stream(spider, name, size):
+    return lambda: spider._record_candidate(f"https://v26.douyinvod.com/{name}.mp4", size, 'response')
+
+
+def test_larger_candidate_restarts_settle_window():
+    spider = DouyinSpider("https://www.douyin.com/video/7300", log_callback=quiet, settle_time=0.4, sniff_timeout=5)
+    # 广告先到，正片在静默窗口内到达：从正片到达时重新计时
+    elapsed = wait_for_stream(spider, [(0.0, stream(spider, "ad", 2 * MB)), (0.3, stream(spider, "main", 8 * MB)),
+                                       (0.5, stream(spider, "small", 3 * MB))])
+    assert 0.65 <= elapsed < 2
+    assert [c['size'] for c in spider.video_candidates] == [2 * MB, 8 * MB, 3 * MB]
+
+
+def test_detail_api_stops_wait_early():
+    spider = DouyinSpider("https://www.douyin.com/video/7300", log_callback=quiet, settle_time=2, sniff_timeout=5)
+
+    def api():
+        spider._api_candidates = [{'url': "https://v26.douyinvod.com/api.mp4", 'size': 0}]
+        spider._candidate_event.set()
+
+    # 视频流已捕获、静默窗口还没到，详情接口返回后立即结束
+    elapsed = wait_for_stream(spider, [(0.0, stream(spider, "main", 8 * MB)), (0.2, api)])
+    assert elapsed < 1
+
+
+def test_deadline_expires_without_candidates():
+    spider = DouyinSpider("https://www.douyin.com/video/7300", log_callback=quiet, settle_time=0.2, sniff_timeout=0.6)
+    # 只有被忽略的小文件，等到最长时间为止
+    elapsed = wait_for_stream(spider, [(0.1, stream(spider, "ad", 100 * 1024))])
+    assert 0.55 <= elapsed < 1.5
+    assert spider.video_candidates == []
@@ -0,0 +1,59 @@
+from download_index import DownloadIndex, file_sha256
+
+
+def write(path, data):
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_find_downloaded_and_verify(tmp_path):
+    index = DownloadIndex(str(tmp_path / "downloads.db"))
+    path = write(tmp_path / "a.mp4", b"video-a")
+    index.add("7300", path, 7, file_sha256(path))
+
+    assert index.find_downloaded("7300")['path'] == path
+    assert index.find_downloaded("7301") is None
+    assert [status for _, status in index.verify()] == ["ok"]
+
+    # 同样大小但内容被改动，只有完整哈希校验能发现
+    write(tmp_path / "a.mp4", b"video-b")
+    assert [status for _, status in index.verify()] == ["hash_mismatch"]
+
+    (tmp_path / "a.mp4").unlink()
+    assert index.find_downloaded("7300") is None
+    assert [status for _, status in index.verify()] == ["missing"]
+
+
+def test_claim_path_avoids_collisions(tmp_path):
+    index = DownloadIndex(str(tmp_path / "downloads.db"))
+    first = index.claim_path(str(tmp_path), "标题", "7300")
+    assert first.endswith("标题.mp4")
+
+    # 同名标题的另一个视频（第一个仍在下载中）
+    second = index.claim_path(str(tmp_path), "标题", "7301")
+    assert second.endswith("标题_7301.mp4")
+
+    write(tmp_path / "标题.mp4", b"x")
+    index.add("7300", first, 1, None)
+    index.release_path(first)
+    index.release_path(second)
+
+    # 索引中属于自己的文件可以复用路径，属于别人的不行
+    assert index.claim_path(str(tmp_path), "标题", "7300") == first
+    assert index.claim_path(str(tmp_path), "标题", "7302").endswith("标题_7302.mp4")
+    # 没有视频 id 时追加序号
+    assert index.claim_path(str(tmp_path), "标题", None).endswith("标题_1.mp4")
+
+
+def test_claim_path_shared_between_processes(tmp_path):
+    # 两个实例共用一个索引文件，模拟多个工作进程
+    db = str(tmp_path / "downloads.db")
+    a, b = DownloadIndex(db), DownloadIndex(db)
+    first = a.claim_path(str(tmp_path), "标题", "7300")
+    assert b.claim_path(str(tmp_path), "标题", "7301").endswith("标题_7301.mp4")
+    # 同一个视频留下的认领可以接着用（断点续传）
+    c = DownloadIndex(db)
+    assert c.claim_path(str(tmp_path), "标题", "7300") == first
+
+    a.release_path(first)
+    assert b.claim_path(str(tmp_path), "标题", "7302") == first
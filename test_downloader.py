@@ -0,0 +1,47 @@
+import os
+import threading
+
+from downloader import SegmentedDownloader
+from fake_douyin_server import FakeDouyinServer
+from media_verify import block_hash
+
+MB = 1024 * 1024
+
+
+def quiet(message):
+    pass
+
+
+def test_segmented_download_matches_source(tmp_path):
+    with FakeDouyinServer() as server:
+        path = str(tmp_path / "video.mp4")
+        record = SegmentedDownloader({}, segments=4, log_callback=quiet).download(
+            server.base_url + "/video/main_1080p.mp4", path)
+
+        data = server.media_bytes("main_1080p.mp4")
+        assert record['size'] == len(data)
+        assert record['sha256'] == block_hash(data)
+        with open(path, 'rb') as f:
+            assert f.read() == data
+        assert not os.path.exists(path + ".part.json")
+
+
+def test_cancel_keeps_resumable_part(tmp_path):
+    # 限速到 4MB/s，下载 8MB 的正片时取消一定发生在完成之前
+    with FakeDouyinServer(bandwidth=4 * MB) as server:
+        url = server.base_url + "/video/main_1080p.mp4"
+        path = str(tmp_path / "video.mp4")
+        cancel_event = threading.Event()
+        downloader = SegmentedDownloader({}, segments=4, log_callback=quiet, cancel_event=cancel_event)
+
+        timer = threading.Timer(0.3, cancel_event.set)
+        timer.start()
+        assert downloader.download(url, path) is None
+        timer.join()
+        assert not os.path.exists(path)
+        assert os.path.exists(path + ".part.json")
+
+        # 不再取消时从断点继续完成下载
+        server.bandwidth = None
+        record = SegmentedDownloader({}, segments=4, log_callback=quiet).download(url, path)
+        assert record['sha256'] == block_hash(server.media_bytes("main_1080p.mp4"))
@@ -0,0 +1,29 @@
+import os
+
+from environment import EnvironmentStamp, environment_key, find_bundled_browsers_path
+
+
+def test_find_bundled_browsers_path(tmp_path):
+    empty = tmp_path / "empty"
+    empty.mkdir()
+    bundled = tmp_path / "ms-playwright"
+    (bundled / "chromium-1200").mkdir(parents=True)
+
+    assert find_bundled_browsers_path([str(tmp_path / "missing"), str(empty), str(bundled)]) == str(bundled)
+    assert find_bundled_browsers_path([str(empty)]) is None
+
+
+def test_stamp_invalidated_when_browser_changes(tmp_path, monkeypatch):
+    browsers = tmp_path / "ms-playwright"
+    (browsers / "chromium-1200").mkdir(parents=True)
+    monkeypatch.setenv("PLAYWRIGHT_BROWSERS_PATH", str(browsers))
+    stamp = EnvironmentStamp(str(tmp_path / "env.json"))
+
+    assert not stamp.is_verified()
+    stamp.mark_verified()
+    assert stamp.is_verified()
+
+    # 升级浏览器后指纹变化，需要重新验证
+    os.rename(browsers / "chromium-1200", browsers / "chromium-1300")
+    assert environment_key()['chromium'] == ["chromium-1300"]
+    assert not stamp.is_verified()
@@ -0,0 +1,108 @@
+import time
+
+from douyin_spider import DouyinSpider
+from downloader import SegmentedDownloader
+from fake_douyin_server import FakeDouyinServer
+from http_client import CircuitBreaker, CircuitOpen, HttpClient
+from media_verify import block_hash
+from metrics import MetricsBus, RetryEvent
+
+
+def quiet(message):
+    pass
+
+
+def fast_client(**kwargs):
+    return HttpClient(backoff=0.01, max_backoff=0.02, log_callback=quiet, **kwargs)
+
+
+def test_circuit_breaker_half_open():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure("cdn")
+    assert breaker.allow("cdn")
+    assert breaker.record_failure("cdn")
+    assert breaker.is_open("cdn") and not breaker.allow("cdn")
+
+    # 冷却后只放行一个试探请求
+    time.sleep(0.06)
+    assert breaker.allow("cdn") and not breaker.allow("cdn")
+    breaker.record_success("cdn")
+    assert breaker.allow("cdn") and not breaker.is_open("cdn")
+
+
+def test_retries_then_opens_circuit():
+    with FakeDouyinServer(flaky={"main_720p.mp4": 2, "ad.mp4": 100}) as server:
+        bus = MetricsBus()
+        retries = []
+        bus.subscribe(lambda e: isinstance(e, RetryEvent) and retries.append(e))
+        client = fast_client(retries=3, breaker=CircuitBreaker(failure_threshold=4))
+
+        response = client.get(server.base_url + "/video/main_720p.mp4", metrics=bus, job_url="u")
+        assert response.status_code == 200
+        response.close()
+        assert [e.attempt for e in retries] == [1, 2]
+
+        # 一直 503：重试用尽后失败，连续失败达到阈值后熔断
+        try:
+            client.get(server.base_url + "/video/ad.mp4")
+        except IOError as e:
+            assert not isinstance(e, CircuitOpen)
+        else:
+            raise AssertionError("应当失败")
+        try:
+            client.get(server.base_url + "/video/ad.mp4")
+        except CircuitOpen:
+            pass
+        else:
+            raise AssertionError("应当熔断")
+
+
+def test_segment_resumes_after_connection_drop(tmp_path):
+    with FakeDouyinServer(truncate={"main_1080p.mp4": 2}) as server:
+        bus = MetricsBus()
+        events = []
+        bus.subscribe(events.append)
+        record = SegmentedDownloader({}, segments=4, log_callback=quiet, metrics=bus, client=fast_client()).download(
+            server.base_url + "/video/main_1080p.mp4", str(tmp_path / "video.mp4"))
+
+        assert record['sha256'] == block_hash(server.media_bytes("main_1080p.mp4"))
+        assert any(isinstance(e, RetryEvent) and e.what == "segment" for e in events)
+
+
+def test_failover_to_next_candidate(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with FakeDouyinServer(forbidden={"main_1080p.mp4"}) as server:
+        spider = DouyinSpider("https://www.douyin.com/video/7300", log_callback=quiet)
+        spider.save_dir = str(tmp_path)
+        target = {'video_id': "7300", 'title': "标题", 'candidates': [
+            {'url': server.base_url + "/video/main_1080p.mp4", 'size': 0},
+            {'url': server.base_url + "/video/main_720p.mp4", 'size': 0},
+        ]}
+        record = spider.download_target(target)
+        assert record['sha256'] == block_hash(server.media_bytes("main_720p.mp4"))
+
+
+def test_half_open_probe_error_does_not_block_host():
+    import requests
+
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    client = fast_client(retries=0, breaker=breaker)
+    breaker.record_failure("127.0.0.1:1")
+    time.sleep(0.06)
+
+    class BrokenSession:
+        def get(self, *args, **kwargs):
+            raise requests.TooManyRedirects("重定向过多")
+
+    client._sessions["127.0.0.1:1"] = BrokenSession()
+    try:
+        client.get("http://127.0.0.1:1/video.mp4")
+    except requests.TooManyRedirects:
+        pass
+    else:
+        raise AssertionError("应当抛出原来的异常")
+
+    # 试探请求出错算作失败：重新计时，冷却后可以再次试探
+    assert breaker.is_open("127.0.0.1:1")
+    time.sleep(0.06)
+    assert breaker.allow("127.0.0.1:1")
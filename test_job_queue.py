@@ -0,0 +1,93 @@
+from job_queue import JobQueue
+
+
+class FakeSpider:
+    def __init__(self):
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class Starter:
+    """代替界面的 _start_job：记录启动顺序，任务置为 running"""
+
+    def __init__(self):
+        self.started = []
+
+    def __call__(self, job):
+        job.spider = FakeSpider()
+        job.state = 'running'
+        self.started.append(job.url)
+
+
+def make_queue(max_parallel, count):
+    starter = Starter()
+    jobs = JobQueue(starter, max_parallel=max_parallel)
+    for i in range(count):
+        jobs.add(f"https://v.douyin.com/{i}/", "videos")
+    jobs.dispatch()
+    return jobs, starter
+
+
+def test_max_parallel_and_next_job_starts_when_slot_frees():
+    jobs, starter = make_queue(2, 4)
+    assert starter.started == ["https://v.douyin.com/0/", "https://v.douyin.com/1/"]
+    assert [job.state for job in jobs.jobs] == ['running', 'running', 'queued', 'queued']
+
+    # 再次调度不会超过上限；下载中的任务同样占名额
+    jobs.progress("https://v.douyin.com/0/", 10, 100, 1.0)
+    jobs.dispatch()
+    assert len(starter.started) == 2 and jobs.jobs[0].state == 'downloading'
+
+    # 一个任务结束，按提交顺序启动下一个
+    jobs.finish(jobs.jobs[1], 'downloaded')
+    assert starter.started[-1] == "https://v.douyin.com/2/"
+    assert [job.state for job in jobs.jobs] == ['downloading', 'downloaded', 'running', 'queued']
+
+    # 调大并发后剩下的任务立即启动
+    jobs.max_parallel = 3
+    jobs.dispatch()
+    assert starter.started[-1] == "https://v.douyin.com/3/"
+
+
+def test_failed_start_does_not_take_a_slot():
+    def start(job):
+        job.state = 'failed' if job.url.endswith("/0/") else 'running'
+
+    jobs = JobQueue(start, max_parallel=1)
+    jobs.add("https://v.douyin.com/0/", "videos")
+    jobs.add("https://v.douyin.com/1/", "videos")
+    jobs.dispatch()
+    assert [job.state for job in jobs.jobs] == ['failed', 'running']
+
+
+def test_cancel_queued_and_running_jobs():
+    jobs, starter = make_queue(1, 3)
+    running, queued, _ = jobs.jobs
+
+    # 排队中的任务直接取消，不会再被启动
+    assert jobs.cancel(queued) is False
+    assert queued.state == 'cancelled' and queued.spider is None
+
+    # 运行中的任务通知爬虫停止，名额要等它真正结束才空出来
+    assert jobs.cancel(running) is True
+    assert running.state == 'cancelling' and running.spider.cancelled
+    jobs.dispatch()
+    assert len(starter.started) == 1
+
+    jobs.finish(running, 'cancelled')
+    assert starter.started == ["https://v.douyin.com/0/", "https://v.douyin.com/2/"]
+    # 已结束的任务不能再取消
+    assert jobs.cancel(running) is False and running.state == 'cancelled'
+
+
+def test_duplicate_url_and_clear_finished():
+    jobs, _ = make_queue(1, 2)
+    assert jobs.add("https://v.douyin.com/0/", "videos") is None
+    jobs.finish(jobs.jobs[0], 'downloaded')
+
+    assert [job.url for job in jobs.clear_finished()] == ["https://v.douyin.com/0/"]
+    assert [job.url for job in jobs.jobs] == ["https://v.douyin.com/1/"]
+    # 结束并清除后可以重新加入
+    assert jobs.add("https://v.douyin.com/0/", "videos") is not None
@@ -0,0 +1,53 @@
+import time
+
+from job_store import JobStore
+
+
+def test_claim_finish_and_persistence(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    store = JobStore(path)
+    first = store.add("https://v.douyin.com/a/", "videos")
+    second = store.add("https://v.douyin.com/b/", "videos")
+    store.close()
+
+    # 重新打开后排队中的任务还在，按提交顺序取出
+    store = JobStore(path)
+    job = store.claim("worker-1")
+    assert job['id'] == first['id'] and job['status'] == 'running' and job['attempts'] == 1
+    assert store.finish(job['id'], 'downloaded', {'status': 'downloaded'}, owner="worker-1")
+    assert store.get(job['id'])['result'] == {'status': 'downloaded'}
+
+    assert store.claim("worker-1")['id'] == second['id']
+    assert store.claim("worker-1") is None
+    assert store.counts() == {'downloaded': 1, 'running': 1}
+
+
+def test_expired_lease_is_reclaimed(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"), max_attempts=2)
+    job = store.add("https://v.douyin.com/a/", "videos")
+
+    store.claim("crashed", lease_seconds=0.05)
+    assert store.claim("other") is None
+    time.sleep(0.1)
+
+    # 持有者崩溃、租约过期后任务被其他持有者取走，原持有者不能再写结果
+    assert store.claim("other", lease_seconds=0.05)['attempts'] == 2
+    assert not store.finish(job['id'], 'downloaded', owner="crashed")
+    assert store.renew(job['id'], "crashed") is None
+
+    # 超过最大尝试次数后判为失败
+    time.sleep(0.1)
+    assert store.claim("third") is None
+    assert store.get(job['id'])['status'] == 'failed'
+
+
+def test_cancel_queued_and_running(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"))
+    running = store.add("https://v.douyin.com/a/", "videos")
+    queued = store.add("https://v.douyin.com/b/", "videos")
+    store.claim("worker")
+
+    assert store.request_cancel(queued['id'])['status'] == 'cancelled'
+    assert store.request_cancel(running['id'])['cancel_requested']
+    assert store.renew(running['id'], "worker") is True
+    assert store.claim("worker") is None
@@ -0,0 +1,86 @@
+import os
+
+from douyin_spider import DouyinSpider
+from downloader import SegmentedDownloader
+from fake_douyin_server import FakeDouyinServer, make_fake_mp4
+from media_verify import (BLOCK_SIZE, BlockHasher, VerificationError, VerifyManifest, block_hash, file_block_hash,
+                          scan_mp4)
+from metrics import MetricsBus, VerifyEvent
+
+
+def quiet(message):
+    pass
+
+
+def test_scan_mp4(tmp_path):
+    path = str(tmp_path / "video.mp4")
+    data = make_fake_mp4(3 * BLOCK_SIZE, duration=21.0)
+    with open(path, 'wb') as f:
+        f.write(data)
+    info = scan_mp4(path)
+    assert info['boxes'] == ['ftyp', 'moov', 'mdat']
+    assert info['duration'] == 21.0
+
+    # 截断的文件和 HTML 错误页都不能通过
+    for bad in (data[:len(data) // 2], b"<html><body>403 Forbidden</body></html>"):
+        with open(path, 'wb') as f:
+            f.write(bad)
+        try:
+            scan_mp4(path)
+        except VerificationError:
+            pass
+        else:
+            raise AssertionError("应当校验失败")
+
+
+def test_block_hash_out_of_order(tmp_path):
+    data = os.urandom(3 * BLOCK_SIZE + 1234)
+    path = str(tmp_path / "data.bin")
+    with open(path, 'wb') as f:
+        f.write(data)
+
+    # 分段乱序到达，第 1 块中途重试（数据不连续）时从文件补算
+    hasher = BlockHasher()
+    hasher.update(2 * BLOCK_SIZE, data[2 * BLOCK_SIZE:])
+    hasher.update(0, data[:BLOCK_SIZE])
+    hasher.update(BLOCK_SIZE, data[BLOCK_SIZE:BLOCK_SIZE + 100])
+    hasher.update(BLOCK_SIZE + 200, data[BLOCK_SIZE + 200:2 * BLOCK_SIZE])
+    digest = hasher.hexdigest(len(data), lambda i: data[i * BLOCK_SIZE:(i + 1) * BLOCK_SIZE])
+    assert hasher.reread_blocks == 1
+    assert digest == block_hash(data) == file_block_hash(path)
+
+
+def test_bad_candidate_fails_over_and_is_recorded(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with FakeDouyinServer(error_pages={"main_1080p.mp4"}) as server:
+        manifest = VerifyManifest(str(tmp_path / "manifest.jsonl"))
+        spider = DouyinSpider("https://www.douyin.com/video/7300", log_callback=quiet, manifest=manifest)
+        spider.save_dir = str(tmp_path)
+        target = {'video_id': "7300", 'title': "标题", 'duration': 15.0, 'candidates': [
+            {'url': server.base_url + "/video/main_1080p.mp4", 'size': 0},
+            {'url': server.base_url + "/video/main_720p.mp4", 'size': 0},
+        ]}
+        record = spider.download_target(target)
+        assert record['sha256'] == block_hash(server.media_bytes("main_720p.mp4"))
+
+        entries = manifest.read()
+        assert [(e['attempt'], e['ok']) for e in entries] == [(1, False), (2, True)]
+        assert "MP4" in entries[0]['error']
+        assert entries[1]['duration'] == 15.0 and entries[1]['boxes'] == ['ftyp', 'moov', 'mdat']
+        assert not os.path.exists(record['path'] + ".part")
+
+
+def test_duration_mismatch_is_discarded(tmp_path):
+    with FakeDouyinServer() as server:
+        bus = MetricsBus()
+        events = []
+        bus.subscribe(lambda e: isinstance(e, VerifyEvent) and events.append(e))
+        path = str(tmp_path / "video.mp4")
+        downloader = SegmentedDownloader({}, segments=4, log_callback=quiet, metrics=bus)
+
+        # 解析结果是 60 秒的视频，下载到的只有 15 秒（例如广告）
+        assert downloader.download(server.base_url + "/video/main_1080p.mp4", path, expected_duration=60.0) is None
+        assert not os.path.exists(path) and not os.path.exists(path + ".part")
+        assert not os.path.exists(path + ".part.json")
+        assert [e.ok for e in events] == [False]
+        assert downloader.report['duration'] == 15.0
@@ -0,0 +1,49 @@
+import json
+
+from metrics import (CandidateEvent, DownloadEvent, JobEvent, JsonlSink, LogEvent, LogSink, MetricsBus,
+                     PhaseEvent, SummaryCollector)
+
+
+def test_child_bus_forwards_to_parent_and_log_callback():
+    shared = MetricsBus()
+    received = []
+    shared.subscribe(received.append)
+
+    messages = []
+    bus = MetricsBus(parent=shared)
+    bus.subscribe(LogSink(messages.append))
+
+    bus.emit(LogEvent(url="u", message="hello"))
+    with bus.phase("goto", "u"):
+        pass
+
+    assert messages == ["hello"]
+    assert [e.type for e in received] == ["log", "phase"]
+    assert received[1].phase == "goto"
+
+
+def test_summary_and_jsonl(tmp_path):
+    bus = MetricsBus()
+    summary = bus.subscribe(SummaryCollector())
+    sink = bus.subscribe(JsonlSink(str(tmp_path / "events.jsonl")))
+
+    for d in (0.2, 0.4, 3.0):
+        bus.emit(PhaseEvent(url="u", phase="resolve", duration=d))
+    bus.emit(CandidateEvent(url="u", candidate_url="a", size=10, accepted=False))
+    bus.emit(CandidateEvent(url="u", candidate_url="b", size=2 << 20, accepted=True))
+    bus.emit(DownloadEvent(url="u", path="p", bytes=4 << 20, duration=2.0, mbps=2.0))
+    bus.emit(JobEvent(url="u", status="downloaded", result={}))
+    sink.close()
+
+    data = summary.summary()
+    assert data['phases']['resolve']['count'] == 3
+    assert data['phases']['resolve']['p50'] == 0.4
+    assert data['phases']['resolve']['histogram']['0.25'] == 1
+    assert data['phases']['resolve']['histogram']['5'] == 1
+    assert data['candidates'] == {'accepted': 1, 'ignored': 1}
+    assert data['downloads']['bytes'] == 4 << 20
+    assert data['jobs'] == {'downloaded': 1}
+    assert "resolve" in summary.format_summary()
+
+    lines = [json.loads(line) for line in (tmp_path / "events.jsonl").read_text(encoding='utf-8').splitlines()]
+    assert [line['type'] for line in lines] == ["phase"] * 3 + ["candidate", "candidate", "download", "job"]
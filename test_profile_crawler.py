@@ -0,0 +1,209 @@
+import asyncio
+import json
+import threading
+from concurrent.futures import Future
+
+from fake_douyin_server import FakeDouyinServer
+from profile_crawler import (CrawlCheckpoint, CrawlProgress, ProfileCrawler, parse_list_response, parse_source,
+                             with_cursor)
+
+
+class FakePage:
+    url = "https://www.douyin.com/user/u"
+
+    def on(self, event, callback):
+        pass
+
+    def remove_listener(self, event, callback):
+        pass
+
+    async def goto(self, url, timeout=None):
+        pass
+
+
+class FakePool:
+    """代替 BrowserPool：在新线程的事件循环里执行协程，租到的是不需要浏览器的 FakePage"""
+
+    def submit(self, coro):
+        future = Future()
+
+        def run():
+            try:
+                future.set_result(asyncio.run(coro))
+            except Exception as e:
+                future.set_exception(e)
+
+        threading.Thread(target=run, daemon=True).start()
+        return future
+
+    async def run_leased(self, fn, *args):
+        return await fn(FakePage(), *args)
+
+
+class FakeListCrawler(ProfileCrawler):
+    """列表直接从模拟服务的作品列表接口数据中取，不经过页面"""
+
+    def __init__(self, server, checkpoint):
+        super().__init__("https://www.douyin.com/user/u", pool=FakePool(), checkpoint=checkpoint,
+                         log_callback=lambda message: None)
+        self.server = server
+
+    async def _next_page(self, page, spec, cursor):
+        return parse_list_response(self.server.post_list_json('u', cursor))
+
+
+def crawl_pages(server, sec_uid, checkpoint, max_pages=None):
+    """按 CrawlProgress 的游标逐页读取模拟列表接口，每页处理完保存断点，返回交出的视频 id"""
+    progress = CrawlProgress(checkpoint.get(sec_uid))
+    cursor = progress.start_cursor
+    ids = []
+    pages = 0
+    while cursor is not None and (max_pages is None or pages < max_pages):
+        page = parse_list_response(server.post_list_json(sec_uid, cursor))
+        items, cursor, snapshot = progress.accept(page)
+        ids += [item['aweme_id'] for item in items]
+        checkpoint.put(sec_uid, snapshot)
+        pages += 1
+    return ids
+
+
+def test_parse_source_and_cursor():
+    assert parse_source("https://www.douyin.com/user/MS4wLjABAAAA-x_y?from_tab_name=main") == ('user', "MS4wLjABAAAA-x_y")
+    assert parse_source("https://www.douyin.com/collection/7290000000000000001") == ('mix', "7290000000000000001")
+    assert parse_source("https://www.douyin.com/video/7300000000000000001") is None
+
+    url = with_cursor("https://www.douyin.com/aweme/v1/web/aweme/post/?sec_user_id=u&max_cursor=0&count=18",
+                      'max_cursor', 1700000000000)
+    assert "max_cursor=1700000000000" in url and "sec_user_id=u" in url
+    assert parse_list_response({'status_code': 8, 'status_msg': "error"}) is None
+
+
+def test_resume_and_incremental(tmp_path):
+    server = FakeDouyinServer(profiles={'u': 25}, page_size=10)
+    checkpoint = CrawlCheckpoint(str(tmp_path / "checkpoints.json"))
+    all_ids = [server.post_id('u', i) for i in range(25)]
+
+    # 第一次运行只抓了一页就中断
+    assert crawl_pages(server, 'u', checkpoint, max_pages=1) == all_ids[:10]
+    assert not checkpoint.get('u')['done']
+
+    # 期间发布了 3 个新作品：先抓新作品，再从断点继续抓历史作品，不重复
+    server.profiles['u'] = 28
+    new_ids = [server.post_id('u', i) for i in range(3)]
+    checkpoint = CrawlCheckpoint(checkpoint.path)
+    assert crawl_pages(server, 'u', checkpoint) == new_ids + all_ids[10:]
+    entry = checkpoint.get('u')
+    assert entry['done'] and entry['count'] == 28
+
+    # 没有新作品时只请求第一页
+    assert crawl_pages(server, 'u', checkpoint) == []
+    server.profiles['u'] = 29
+    assert crawl_pages(server, 'u', checkpoint) == [server.post_id('u', 0)]
+
+
+def test_pinned_old_post_does_not_stop_head():
+    newest = 1700000000 + 10 * 3600
+    progress = CrawlProgress({'newest': newest, 'done': True})
+    page = {'items': [{'aweme_id': "1", 'create_time': 1700000000, 'is_top': 1},
+                      {'aweme_id': "12", 'create_time': newest + 7200},
+                      {'aweme_id': "11", 'create_time': newest + 3600}],
+            'cursor': (newest + 3600) * 1000, 'has_more': True}
+    items, cursor, snapshot = progress.accept(page)
+    # 置顶的旧作品跳过，但还没遇到已抓过的作品，继续翻页
+    assert [item['aweme_id'] for item in items] == ["12", "11"]
+    assert cursor == page['cursor'] and snapshot['newest'] == newest
+
+    items, cursor, snapshot = progress.accept({'items': [{'aweme_id': "10", 'create_time': newest}],
+                                               'cursor': newest * 1000, 'has_more': True})
+    assert items == [] and cursor is None and snapshot['newest'] == newest + 7200
+
+
+def test_failed_and_unfinished_items_are_crawled_again(tmp_path):
+    server = FakeDouyinServer(profiles={'u': 25}, page_size=10)
+    checkpoint = CrawlCheckpoint(str(tmp_path / "checkpoints.json"))
+    failed_id = server.post_id('u', 3)
+
+    crawler = FakeListCrawler(server, checkpoint)
+    ids = []
+    for item in crawler.crawl():
+        ids.append(item['video_id'])
+        crawler.done(item, item['video_id'] != failed_id)
+    assert len(ids) == 25
+    assert list(checkpoint.get('user:u')['retry']) == [failed_id]
+
+    # 下次抓取先重新交出失败的作品（不带过期的播放地址），成功后从断点中移除
+    crawler = FakeListCrawler(server, CrawlCheckpoint(checkpoint.path))
+    items = []
+    for item in crawler.crawl():
+        items.append(item)
+        crawler.done(item, True)
+    assert [(item['video_id'], item['candidates']) for item in items] == [(failed_id, [])]
+    assert CrawlCheckpoint(checkpoint.path).get('user:u')['retry'] == {}
+
+    # 新作品都已取走，但第二个还没下载完就中断：这一页的断点不保存，下次整页重新交出
+    server.profiles['u'] = 27
+    new_ids = [server.post_id('u', i) for i in range(2)]
+    crawler = FakeListCrawler(server, CrawlCheckpoint(checkpoint.path))
+    for item in crawler.crawl():
+        if item['video_id'] == new_ids[0]:
+            crawler.done(item, True)
+    crawler = FakeListCrawler(server, CrawlCheckpoint(checkpoint.path))
+    ids = []
+    for item in crawler.crawl():
+        ids.append(item['video_id'])
+        crawler.done(item, True)
+    assert ids == new_ids
+
+
+class SlotPool(FakePool):
+    """只有 size 个页面的 FakePool：页面都被占用时租用要等待，等不到视为死锁"""
+
+    def __init__(self, size=1, **kwargs):
+        self.slots = threading.BoundedSemaphore(size)
+
+    def start(self):
+        pass
+
+    async def run_leased(self, fn, *args):
+        if not await asyncio.to_thread(self.slots.acquire, True, 5):
+            raise TimeoutError("等待空闲页面超时")
+        try:
+            return await fn(FakePage(), *args)
+        finally:
+            self.slots.release()
+
+
+def test_crawl_resolves_retry_items_while_paging(tmp_path, monkeypatch):
+    import cli
+    import profile_crawler
+    from douyin_spider import DouyinSpider
+
+    monkeypatch.chdir(tmp_path)
+    with FakeDouyinServer(profiles={'u': 30}, page_size=10, media={"main_720p.mp4": 64 * 1024}) as server:
+        # 上次失败的两个作品：HTTP 快速解析失败，只能租页面嗅探
+        retry_ids = ["7100000000000000001", "7100000000000000002"]
+        CrawlCheckpoint().put('user:u', {'retry': {
+            video_id: {'url': f"https://www.douyin.com/video/{video_id}", 'title': video_id, 'attempts': 1}
+            for video_id in retry_ids}})
+
+        async def sniff(spider, page):
+            video_id = spider.url.rsplit('/', 1)[-1]
+            return {'video_id': video_id, 'title': video_id, 'duration': None,
+                    'candidates': [{'url': server.base_url + "/video/main_720p.mp4", 'size': 0}]}
+
+        class Crawler(ProfileCrawler):
+            async def _next_page(self, page, spec, cursor):
+                return parse_list_response(server.post_list_json('u', cursor))
+
+        monkeypatch.setattr(DouyinSpider, '_resolve_over_http', lambda spider: None)
+        monkeypatch.setattr(DouyinSpider, '_sniff', sniff)
+        monkeypatch.setattr(profile_crawler, 'ProfileCrawler', Crawler)
+        monkeypatch.setattr(cli, 'get_shared_pool', lambda **kwargs: SlotPool(**kwargs))
+
+        # 下载并发为 1 时两个重试作品就占满在途上限，翻页把缓冲区填满后一直占着页面
+        output = tmp_path / "results.jsonl"
+        assert cli.crawl(["https://www.douyin.com/user/u", "--downloads", "1", "--max-items", "3",
+                          "-d", str(tmp_path / "videos"), "-o", str(output)]) == 0
+        results = [json.loads(line) for line in output.read_text(encoding='utf-8').splitlines()]
+        assert [r['status'] for r in results] == ['downloaded'] * 3
+        assert {r['video_id'] for r in results} >= set(retry_ids)
@@ -0,0 +1,62 @@
+import json
+import time
+
+from resolve_cache import ResolveCache, normalize_share_url, url_expiry
+
+
+def make_cache(tmp_path, **kwargs):
+    return ResolveCache(path=str(tmp_path / "cache.json"), log_callback=lambda m: None, **kwargs)
+
+
+def result(video_id, url="https://www.douyin.com/aweme/v1/play/?video_id=v0200"):
+    return {'video_id': video_id, 'title': f"title_{video_id}", 'candidates': [{'url': url, 'size': 1024}]}
+
+
+def test_normalize_share_url():
+    assert normalize_share_url("https://v.douyin.com/iAbCdEf/") == normalize_share_url("http://V.DOUYIN.COM/iAbCdEf")
+    assert normalize_share_url("https://www.douyin.com/discover?modal_id=7300&from=share") == "www.douyin.com/discover?modal_id=7300"
+
+
+def test_url_expiry():
+    assert url_expiry("https://v26-web.douyinvod.com/0123456789abcdef0123456789abcdef/65a1b2c3/video/tos/cn/x.mp4") == 0x65a1b2c3
+    assert url_expiry("https://v3-dy-o.zjcdn.com/video/x.mp4?x-expires=1700000000&x-signature=abc") == 1700000000
+    assert url_expiry("https://www.douyin.com/aweme/v1/play/?video_id=v0200") is None
+
+
+def test_hit_miss_and_persistence(tmp_path):
+    cache = make_cache(tmp_path)
+    assert cache.get("https://v.douyin.com/abc/") is None
+    cache.put("https://v.douyin.com/abc/", result("7300"))
+    assert cache.get("https://v.douyin.com/abc")['title'] == "title_7300"
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+    # 重新加载后仍然命中
+    assert make_cache(tmp_path).get("https://v.douyin.com/abc/")['video_id'] == "7300"
+
+
+def test_signed_url_expiry(tmp_path):
+    cache = make_cache(tmp_path, expiry_margin=0)
+    expires = int(time.time()) + 1
+    cache.put("https://v.douyin.com/abc/", result("7300", f"https://cdn.example.com/x.mp4?x-expires={expires}"))
+    assert cache.get("https://v.douyin.com/abc/") is not None
+
+    time.sleep(1.1)
+    assert cache.get("https://v.douyin.com/abc/") is None
+    assert cache.stats()['expired'] == 1
+    # 过期的播放地址立即从文件中清除，视频 id 映射保留
+    with open(cache.path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    assert dict(data['entries'])["7300"]['candidates'] == []
+    assert make_cache(tmp_path).video_id_for("https://v.douyin.com/abc/") == "7300"
+
+
+def test_lru_eviction(tmp_path):
+    cache = make_cache(tmp_path, max_entries=2)
+    cache.put("https://v.douyin.com/a/", result("1"))
+    cache.put("https://v.douyin.com/b/", result("2"))
+    cache.get("https://v.douyin.com/a/")
+    cache.put("https://v.douyin.com/c/", result("3"))
+
+    assert cache.get("https://v.douyin.com/b/") is None
+    assert cache.get("https://v.douyin.com/a/") is not None
+    assert cache.get("https://v.douyin.com/c/") is not None
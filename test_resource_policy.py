@@ -0,0 +1,73 @@
+import asyncio
+
+from douyin_spider import DouyinSpider
+from resource_policy import ResourcePolicy
+
+MB = 1024 * 1024
+
+
+def test_decide():
+    policy = ResourcePolicy(allow_patterns=["*://mcs.zijieapi.com/keep/*"])
+    # 埋点上报和图片/字体拦截，allow_patterns 优先
+    assert policy.decide("https://mcs.zijieapi.com/list", "xhr") == ResourcePolicy.BLOCK
+    assert policy.decide("https://mcs.zijieapi.com/keep/1", "xhr") == ResourcePolicy.ALLOW
+    assert policy.decide("https://p3.douyinpic.com/cover.jpeg", "image") == ResourcePolicy.BLOCK
+    # 视频流按资源类型或 .mp4 地址识别，优先于按类型拦截
+    assert policy.decide("https://v26.douyinvod.com/abc/?mime_type=video_mp4", "media") == ResourcePolicy.MEDIA
+    assert policy.decide("https://v26.douyinvod.com/abc.mp4", "image") == ResourcePolicy.MEDIA
+    assert policy.decide("https://www.douyin.com/static/app.js", "script") == ResourcePolicy.ALLOW
+
+    patterns = ResourcePolicy(block_types=("font",)).url_block_patterns()
+    assert "*://mcs.zijieapi.com/*" in patterns and "*.woff2*" in patterns and "*.png*" not in patterns
+
+
+class FakeRequest:
+    def __init__(self, url):
+        self.url = url
+        self.headers = {}
+
+
+class FakeResponse:
+    def __init__(self, url, status, headers):
+        self.url = url
+        self.status = status
+        self.headers = headers
+
+
+class FakeRoute:
+    def __init__(self, url, response):
+        self.request = FakeRequest(url)
+        self.response = response
+        self.outcome = None
+
+    async def fetch(self, headers=None):
+        assert headers['range'] == 'bytes=0-0'
+        return self.response
+
+    async def abort(self):
+        self.outcome = 'abort'
+
+    async def fulfill(self, response=None):
+        self.outcome = 'fulfill'
+
+
+def test_probe_records_each_stream_once(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    spider = DouyinSpider("https://www.douyin.com/video/7300", log_callback=lambda message: None)
+
+    # 支持 Range：记录总大小后中止，浏览器不再下载
+    url = "https://v26.douyinvod.com/main.mp4"
+    route = FakeRoute(url, FakeResponse(url, 206, {'content-range': f"bytes 0-0/{8 * MB}", 'content-type': "video/mp4"}))
+    asyncio.run(spider._probe_media(route))
+    assert route.outcome == 'abort'
+    assert spider.video_candidates == [{'url': url, 'size': 8 * MB}]
+
+    # 不支持 Range：响应交给浏览器，候选只由响应监听记录一次
+    url = "https://v3.douyinvod.com/main.mp4"
+    response = FakeResponse(url, 200, {'content-length': str(4 * MB), 'content-type': "video/mp4"})
+    route = FakeRoute(url, response)
+    asyncio.run(spider._probe_media(route))
+    assert route.outcome == 'fulfill'
+    spider.handle_response(response)
+    spider.handle_response(response)
+    assert [c['url'] for c in spider.video_candidates].count(url) == 1
@@ -0,0 +1,138 @@
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from engine import DownloadEngine
+from fake_douyin_server import FakeDouyinServer
+from job_store import JobStore
+from service import DownloadService, make_server
+
+
+@pytest.fixture
+def service(tmp_path):
+    with FakeDouyinServer(default_fixture="share_router_data.html") as douyin:
+        engine = DownloadEngine(resolve_concurrency=1, download_concurrency=1, log_callback=lambda m: None)
+        store = JobStore(str(tmp_path / "jobs.db"))
+        service = DownloadService(store, engine, save_dir=str(tmp_path / "videos"), max_active=1,
+                                  log_callback=lambda m: None, poll_interval=0.05).start()
+        server = make_server(service, port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        service.base_url = "http://127.0.0.1:%d" % server.server_address[1]
+        service.douyin = douyin
+        yield service
+        server.shutdown()
+        server.server_close()
+        service.stop()
+        engine.close()
+        store.close()
+
+
+def request(service, method, path, data=None):
+    body = json.dumps(data).encode('utf-8') if data is not None else None
+    req = urllib.request.Request(service.base_url + path, data=body, method=method)
+    with urllib.request.urlopen(req, timeout=10) as response:
+        return json.loads(response.read())
+
+
+def wait_status(service, job_id, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = request(service, "GET", f"/jobs/{job_id}")
+        if job['status'] not in ('queued', 'running'):
+            return job
+        time.sleep(0.05)
+    raise AssertionError("任务未在规定时间内结束")
+
+
+def test_submit_poll_and_events(service):
+    text = f"看看这个 {service.douyin.short_url('7300000000000000001')} 复制此链接"
+    job = request(service, "POST", "/jobs", {"text": text})['jobs'][0]
+
+    events = urllib.request.urlopen(f"{service.base_url}/events?job={job['id']}", timeout=10)
+    job = wait_status(service, job['id'])
+    assert job['status'] == 'downloaded'
+    assert job['result']['bytes'] == service.douyin.media["main_720p.mp4"]
+
+    # 单任务事件流在任务结束后关闭，最后一条是结束状态
+    lines = [line for line in events.read().decode('utf-8').splitlines() if line.startswith("data: ")]
+    last = json.loads(lines[-1][len("data: "):])
+    assert last['type'] == 'state' and last['status'] == 'downloaded'
+
+    assert request(service, "GET", "/health")['jobs'] == {'downloaded': 1}
+
+
+def test_cancel_queued_job(service):
+    # 限速让第一个任务占住唯一的执行名额
+    service.douyin.bandwidth = 1024 * 1024
+    first, second = request(service, "POST", "/jobs", {"urls": [
+        service.douyin.short_url('7300000000000000001'), service.douyin.short_url('7300000000000000002')]})['jobs']
+
+    assert request(service, "POST", f"/jobs/{second['id']}/cancel")['status'] == 'cancelled'
+    # 执行中的任务在下一个数据块处停止
+    request(service, "DELETE", f"/jobs/{first['id']}")
+    assert wait_status(service, first['id'])['status'] == 'cancelled'
+
+
+def test_submit_rejects_invalid_body(service):
+    for data in ({"urls": "https://v.douyin.com/x/"}, {"urls": ["不是链接"]}, {"urls": [1]},
+                 {"text": service.douyin.short_url('7300000000000000001'), "save_dir": ["videos"]}):
+        with pytest.raises(urllib.error.HTTPError) as e:
+            request(service, "POST", "/jobs", data)
+        assert e.value.code == 400
+    assert service.store.counts() == {}
+
+
+def test_invalid_query_returns_400(service):
+    for path in ("/jobs?limit=abc", "/events?job=x"):
+        with pytest.raises(urllib.error.HTTPError) as e:
+            request(service, "GET", path)
+        assert e.value.code == 400
+
+
+def test_same_url_jobs_get_their_own_events(service):
+    service.max_active = 2
+    url = service.douyin.short_url('7300000000000000001')
+    q = service.subscribe()
+    jobs = request(service, "POST", "/jobs", {"urls": [url, url]})['jobs']
+    for job in jobs:
+        wait_status(service, job['id'])
+
+    downloads = {}
+    while not q.empty():
+        data = q.get()
+        if data['type'] == 'download':
+            downloads[data['job_id']] = downloads.get(data['job_id'], 0) + 1
+    # 每个任务只收到自己的那一次下载事件
+    assert downloads == {job['id']: 1 for job in jobs}
+
+
+def test_stop_requeues_running_job_after_it_stops(service):
+    service.douyin.bandwidth = 1024 * 1024
+    job = request(service, "POST", "/jobs", {"urls": [service.douyin.short_url('7300000000000000001')]})['jobs'][0]
+    deadline = time.monotonic() + 10
+    while service.store.get(job['id'])['status'] != 'running' and time.monotonic() < deadline:
+        time.sleep(0.02)
+
+    service.stop()
+    assert not service._active
+    job = service.store.get(job['id'])
+    assert job['status'] == 'queued' and job['result'] is None
+
+
+def test_bad_save_dir_does_not_stop_dispatcher(service, tmp_path):
+    not_a_dir = tmp_path / "file"
+    not_a_dir.write_text("x")
+    with pytest.raises(urllib.error.HTTPError) as e:
+        request(service, "POST", "/jobs", {"urls": [service.douyin.short_url('7300000000000000001')],
+                                           "save_dir": str(not_a_dir)})
+    assert e.value.code == 400
+
+    # 绕过接口校验直接写入任务库（如旧版本留下的任务）：这个任务失败，后面的任务照常执行
+    bad = service.submit([service.douyin.short_url('7300000000000000001')], str(not_a_dir))[0]
+    good = service.submit([service.douyin.short_url('7300000000000000002')])[0]
+    assert wait_status(service, bad['id'])['status'] == 'failed'
+    assert wait_status(service, good['id'])['status'] == 'downloaded'
@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+
+from douyin_spider import DouyinSpider
+from fake_douyin_server import FakeDouyinServer
+from share_resolver import (ShareResolver, extract_play_candidates, extract_video_id, parse_detail_response,
+                            rank_candidates)
+
+
+@pytest.fixture
+def server():
+    videos = {
+        "7300000000000000001": "share_router_data.html",
+        "7300000000000000002": "share_render_data.html",
+        "7300000000000000003": "share_no_data.html",
+    }
+    with FakeDouyinServer(videos) as s:
+        yield s
+
+
+def make_resolver(server):
+    return ShareResolver(share_page=server.base_url + "/share/video/{video_id}/", log_callback=lambda m: None)
+
+
+def test_extract_video_id():
+    assert extract_video_id("https://www.iesdouyin.com/share/video/7300000000000000001/?region=CN") == "7300000000000000001"
+    assert extract_video_id("https://www.douyin.com/discover?modal_id=7300000000000000002") == "7300000000000000002"
+    assert extract_video_id("https://www.douyin.com/") is None
+
+
+def test_resolve_short_link_router_data(server):
+    result = make_resolver(server).resolve(server.short_url("7300000000000000001"))
+
+    assert result['video_id'] == "7300000000000000001"
+    assert result['title'] == "测试视频 #fixture"
+    assert len(result['candidates']) == 1
+    # 带水印的 playwm 地址被替换为无水印的 play 地址
+    assert result['candidates'][0]['url'].startswith(server.base_url + "/aweme/v1/play/?video_id=v0200fg10000ck0001")
+
+
+def test_resolve_falls_back_to_share_page(server):
+    # 落地页没有内嵌数据时，按视频 id 再请求分享页（RENDER_DATA 格式）
+    result = make_resolver(server).resolve(server.base_url + "/web/7300000000000000002")
+
+    assert result['video_id'] == "7300000000000000002"
+    urls = [c['url'] for c in result['candidates']]
+    assert urls == [
+        server.base_url + "/video/main_1080p.mp4?video_id=v0200fg10000ck0002",
+        server.base_url + "/video/main_720p.mp4?video_id=v0200fg10000ck0002",
+    ]
+    assert result['candidates'][0]['size'] == 6291456
+    assert "/share/video/7300000000000000002/" in server.requests[-1]
+
+
+def test_resolve_without_video_data_returns_none(server):
+    assert make_resolver(server).resolve(server.short_url("7300000000000000003")) is None
+
+
+def test_resolve_unknown_video_returns_none(server):
+    assert make_resolver(server).resolve(server.short_url("7399999999999999999")) is None
+
+
+def test_spider_fast_path_skips_browser(server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    spider = DouyinSpider(server.base_url + "/web/7300000000000000002", log_callback=lambda m: None,
+                          resolver=make_resolver(server))
+
+    target = spider._resolve_over_http()
+
+    assert target['title'] == "网页版测试视频"
+    assert target['candidates'][0]['url'] == server.base_url + "/video/main_1080p.mp4?video_id=v0200fg10000ck0002"
+
+
+def test_detail_candidates_ranked_by_quality(server):
+    aweme = parse_detail_response(server.detail_json("7300000000000000001"))
+    candidates = extract_play_candidates(aweme)
+
+    assert [c['height'] for c in candidates] == [1080, 720, 720]
+    assert candidates[0]['url'].startswith(server.base_url + "/video/main_1080p.mp4")
+    # 同样的输入排序结果稳定
+    assert rank_candidates(list(reversed(candidates))) == candidates
+
+
+class _FakeJsonResponse:
+    def __init__(self, url, data, status=200):
+        self.url = url
+        self.status = status
+        self._data = data
+
+    async def json(self):
+        return self._data
+
+
+def test_spider_uses_detail_api_response(server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    video_id = "7300000000000000001"
+    spider = DouyinSpider(f"https://www.douyin.com/video/{video_id}", log_callback=lambda m: None)
+    api_url = f"https://www.douyin.com/aweme/v1/web/aweme/detail/?aweme_id={video_id}"
+
+    # 其他视频的详情（如推荐视频）被忽略
+    asyncio.run(spider.handle_api_response(_FakeJsonResponse(api_url, server.detail_json("7300000000000000009"))))
+    assert spider._api_candidates == []
+
+    asyncio.run(spider.handle_api_response(_FakeJsonResponse(api_url, server.detail_json(video_id))))
+    assert spider._api_candidates[0]['height'] == 1080
+    assert spider._api_aweme['desc'] == f"基准视频{video_id}"
@@ -0,0 +1,25 @@
+import os
+
+from fake_douyin_server import FakeDouyinServer
+from metrics import MetricsBus, SummaryCollector
+from supervisor import Supervisor
+
+
+def test_jobs_sharded_across_worker_processes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with FakeDouyinServer(default_fixture="share_router_data.html") as server:
+        urls = [server.short_url(str(7300000000000000100 + i)) for i in range(4)]
+        metrics = MetricsBus()
+        summary = metrics.subscribe(SummaryCollector())
+        supervisor = Supervisor(workers=2, concurrency=1, save_dir=str(tmp_path / "videos"),
+                                index_path=str(tmp_path / "downloads.db"),
+                                metrics=metrics, log_callback=lambda m: None)
+
+        results = supervisor.run(urls)
+
+    assert [r['url'] for r in results] == urls
+    assert [r['status'] for r in results] == ['downloaded'] * 4
+    # 各工作进程的事件汇总到主进程
+    assert summary.summary()['jobs'] == {'downloaded': 4}
+    # 本次运行的任务库用完即删
+    assert not [name for name in os.listdir(tmp_path / "cache") if name.startswith("shard_jobs_")]